@@ -2,10 +2,20 @@ from sentence_transformers import SentenceTransformer, util
 import torch
 import re
 
-class SimilarityClassifier:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
+# Models are shared per name so several classifiers (or a host process that
+# already loaded the same model) don't each hold their own copy in memory.
+_shared_models = {}
+
+def get_shared_model(model_name):
+    if model_name not in _shared_models:
         print(f"Loading embedding model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
+        _shared_models[model_name] = SentenceTransformer(model_name)
+    return _shared_models[model_name]
+
+class SimilarityClassifier:
+    def __init__(self, model_name="all-MiniLM-L6-v2", model=None):
+        # Pass `model` to reuse an instance owned by the host (e.g. Project/embeddings.py)
+        self.model = model if model is not None else get_shared_model(model_name)
         
         # Define prototypes for each intent
         self.prototypes = {
@@ -156,7 +166,7 @@ class SimilarityClassifier:
         return best_label, max_similarity
 
 class IngestionEngine:
-    def __init__(self, model_name="all-MiniLM-L6-v2", user_name="User"):
+    def __init__(self, model_name="all-MiniLM-L6-v2", user_name="User", model=None):
         """
         Initialize the Ingestion Engine with Embedding Similarity.
         """
@@ -172,7 +182,7 @@ class IngestionEngine:
             print(f"Warning: spaCy could not be loaded ({type(e).__name__}). Using basic sentence splitting fallback.")
 
         # Load our new Similarity Classifier
-        self.classifier = SimilarityClassifier(model_name=self.model_name)
+        self.classifier = SimilarityClassifier(model_name=self.model_name, model=model)
         self.threshold = 0.45
         print(f"Ingestion Engine initialized with {self.model_name} (Threshold: {self.threshold})")
 
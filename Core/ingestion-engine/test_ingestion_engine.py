@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import hashlib
+from unittest import mock
+
+# Add the current directory to sys.path so we can import ingestion_engine
+sys.path.append(os.path.dirname(__file__))
+import torch
+import ingestion_engine
+
+class FakeModel:
+    """Stands in for SentenceTransformer: a fixed random vector per text, counting encode() calls."""
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return torch.randn(384, generator=torch.Generator().manual_seed(seed))
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.calls += 1
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return torch.stack([self._vector(t) for t in texts])
+
+class TestSharedModels(unittest.TestCase):
+
+    def setUp(self):
+        ingestion_engine._shared_models.clear()
+        self.loads = []
+        def load(name):
+            self.loads.append(name)
+            return FakeModel(name)
+        patcher = mock.patch.object(ingestion_engine, "SentenceTransformer", side_effect=load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ingestion_engine._shared_models.clear)
+
+    def test_model_loaded_once_per_name(self):
+        first = ingestion_engine.SimilarityClassifier()
+        second = ingestion_engine.SimilarityClassifier()
+        self.assertIs(first.model, second.model)
+        self.assertEqual(self.loads, ["all-MiniLM-L6-v2"])
+
+        other = ingestion_engine.SimilarityClassifier(model_name="paraphrase-MiniLM-L3-v2")
+        self.assertIsNot(other.model, first.model)
+        self.assertEqual(self.loads, ["all-MiniLM-L6-v2", "paraphrase-MiniLM-L3-v2"])
+
+    def test_injected_model_is_used(self):
+        model = FakeModel()
+        engine = ingestion_engine.IngestionEngine(model=model)
+        self.assertIs(engine.classifier.model, model)
+        self.assertEqual(self.loads, [])
+        self.assertEqual(ingestion_engine._shared_models, {})
+
+        calls = model.calls
+        label, confidence = engine.classifier.classify("I will fix this issue")
+        self.assertEqual(model.calls, calls + 1)
+        self.assertEqual(label, "commitment") # same text as a prototype
+        self.assertAlmostEqual(confidence, 1.0, places=4)
+
+if __name__ == "__main__":
+    unittest.main()
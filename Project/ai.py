@@ -1,24 +1,477 @@
 import os
-import google.genai as genai
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
 from dotenv import load_dotenv
+try:
+    from pysqlite3 import dbapi2 as sqlite3
+except ImportError:
+    import sqlite3
+import database
 
 load_dotenv()
-api_key = os.environ.get("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key) if api_key else None
 
-def call_ai(prompt, model_name='gemini-3.1-flash-lite-preview'):
+# ---------------------------------------------------------------------------
+# Providers
+#   gemini  — Google Gemini through google-genai (default when GEMINI_API_KEY is set)
+#   openai  — any OpenAI-compatible /chat/completions server (llama.cpp, vLLM, Ollama...)
+#   stub    — deterministic offline responses for tests, demos and load tests
+# Selected with AI_PROVIDER; see README "The ai.py Module".
+# ---------------------------------------------------------------------------
+
+class GeminiProvider:
+    default_model = 'gemini-3.1-flash-lite-preview'
+
+    def __init__(self, api_key=None):
+        import google.genai as genai
+        self.client = genai.Client(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+
+    def generate(self, prompt, model):
+        response = self.client.models.generate_content(model=model, contents=prompt)
+        return response.text
+
+    async def agenerate(self, prompt, model):
+        response = await self.client.aio.models.generate_content(model=model, contents=prompt)
+        return response.text
+
+    async def astream(self, prompt, model):
+        stream = await self.client.aio.models.generate_content_stream(model=model, contents=prompt)
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+class OpenAICompatibleProvider:
+    """POST {base_url}/chat/completions with a single user message."""
+    default_model = 'local-model'
+
+    def __init__(self, base_url=None, api_key=None, model=None, timeout=120):
+        import httpx
+        self.httpx = httpx
+        self.base_url = (base_url or os.environ.get("AI_BASE_URL", "http://localhost:8080/v1")).rstrip("/")
+        self.api_key = api_key or os.environ.get("AI_API_KEY")
+        self.default_model = model or os.environ.get("AI_MODEL", self.default_model)
+        self.timeout = timeout
+        self._async_clients = {} # event loop -> httpx.AsyncClient
+
+    def _request(self, prompt, model, stream=False):
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        body = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+        return f"{self.base_url}/chat/completions", headers, body
+
+    def _aclient(self):
+        # httpx.AsyncClient is tied to the loop it first ran on: one per loop
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Clients of loops that are gone can no longer be closed; just drop them
+            for closed in [l for l in self._async_clients if l.is_closed()]:
+                del self._async_clients[closed]
+            client = self._async_clients[loop] = self.httpx.AsyncClient(timeout=self.timeout)
+        return client
+
+    async def aclose(self):
+        """Closes the running loop's client and its pooled connections."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def generate(self, prompt, model):
+        url, headers, body = self._request(prompt, model)
+        response = self.httpx.post(url, headers=headers, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def agenerate(self, prompt, model):
+        url, headers, body = self._request(prompt, model)
+        response = await self._aclient().post(url, headers=headers, json=body)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def astream(self, prompt, model):
+        url, headers, body = self._request(prompt, model, stream=True)
+        async with self._aclient().stream("POST", url, headers=headers, json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+class StubProvider:
+    """
+    Offline stand-in that recognises the app's own prompts and answers them
+    with well-formed output: a JSON object for single-sentence extraction, a
+    JSON array for transcript extraction and final suggestions, one tool call
+    then READY for the suggestion rounds, and plain text for chat.
+    The same prompt always gets the same answer. `latency` (seconds) is spread
+    over the stream chunks, so streaming and non-streaming take equally long.
+    """
+    default_model = 'stub'
+
+    def __init__(self, latency=None):
+        self.latency = float(latency if latency is not None else os.environ.get("AI_STUB_LATENCY", "0"))
+
+    def respond(self, prompt):
+        if '"title": "short actionable title' in prompt:
+            sentence = re.search(r'Sentence: "(.*?)"\n', prompt, re.DOTALL)
+            return json.dumps(self._item(sentence.group(1) if sentence else ""))
+        if "TRANSCRIPT:" in prompt and "JSON array" in prompt:
+            transcript = prompt.split('"""', 2)[1] if prompt.count('"""') >= 2 else prompt
+            items = [self._item(s) for s in re.split(r"(?<=[.?!])\s+|\n", transcript)
+                     if re.search(r"\b(I will|we will|will you|need to|please)\b|\?", s, re.IGNORECASE)]
+            return json.dumps(items)
+        if "Return a JSON array only" in prompt and '"priority"' in prompt:
+            return json.dumps(self._suggestions(prompt))
+        if "TOOL_CALL" in prompt and "Respond with" in prompt:
+            if "TOOL RESULT (" in prompt.split("CURRENT DATA:")[0]:
+                return "READY\nTHINKING: The tool result confirms the backlog is concentrated in the critical items."
+            return "TOOL_CALL: get_overdue_items | critical\nTHINKING: Checking the full overdue list before suggesting anything."
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        question = re.search(r"QUESTION:\s*(.*)\s*$", prompt, re.DOTALL)
+        topic = (question.group(1).strip() if question else prompt.strip().splitlines()[-1] if prompt.strip() else "")[:80]
+        return f"(stub {digest}) Offline answer about: {topic}"
+
+    def _item(self, sentence):
+        # Drop a transcript speaker label ("MLA: ...")
+        sentence = re.sub(r"^[\w .]{1,30}:\s+", "", sentence.strip().strip('"'))
+        ward = re.search(r"\bward\s*(\d+)", sentence, re.IGNORECASE)
+        dept = re.search(r"\b(?!MLA\b)([A-Z]{2,6})\b", sentence)
+        kind = "question" if sentence.endswith("?") else "commitment" if re.search(r"\bwill\b", sentence, re.IGNORECASE) else "action"
+        return {
+            "title": " ".join(sentence.split()[:10]) or "Untitled item",
+            "deadline": None,
+            "to_whom": dept.group(1) if dept else None,
+            "ward": f"Ward {ward.group(1)}" if ward else None,
+            "type": kind
+        }
+
+    def _suggestions(self, prompt):
+        urgent = re.findall(r"^- \[(CRITICAL|URGENT)\] (.*?) \|", prompt, re.MULTILINE)
+        suggestions = [{
+            "priority": level.lower(),
+            "title": f"Unblock: {title}"[:80],
+            "body": f"{title} is {level.lower()} and still open. Ask the owning department for a dated plan this week."
+        } for level, title in urgent[:3]]
+        suggestions.append({
+            "priority": "normal",
+            "title": "Review department follow-through",
+            "body": "Compare on-time rates in the department scorecard before the next review meeting."
+        })
+        return suggestions
+
+    def _chunks(self, text):
+        return re.findall(r"\S+\s*|\s+", text) or [text]
+
+    def generate(self, prompt, model):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def agenerate(self, prompt, model):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def astream(self, prompt, model):
+        chunks = self._chunks(self.respond(prompt))
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAICompatibleProvider,
+    "stub": StubProvider,
+}
+
+def register_provider(name, factory):
+    """Adds a backend; factory(**options) must return generate/agenerate/astream."""
+    PROVIDERS[name] = factory
+
+def _default_provider_name():
+    name = os.environ.get("AI_PROVIDER")
+    if name:
+        return name.lower()
+    return "gemini" if os.environ.get("GEMINI_API_KEY") else None
+
+def set_provider(name, **options):
+    """Switches the process-wide backend (None disables AI). Returns the provider."""
+    global provider, provider_name
+    provider_name = name
+    if name is None:
+        provider = None
+    elif name not in PROVIDERS:
+        raise ValueError(f"Unknown AI provider '{name}'. Available: {', '.join(PROVIDERS)}")
+    else:
+        provider = PROVIDERS[name](**options)
+    return provider
+
+provider = None
+provider_name = None
+try:
+    set_provider(_default_provider_name())
+except Exception as e:
+    print(f"Warning: AI provider could not be initialized: {e}")
+if provider is None:
+    print("Warning: No AI provider configured (GEMINI_API_KEY or AI_PROVIDER). AI features will fail gracefully.")
+
+def is_available():
+    return provider is not None
+
+async def aclose():
+    """Releases the provider's async connections on this loop. Call on app shutdown."""
+    close = getattr(provider, "aclose", None)
+    if close is not None:
+        await close()
+
+def _require_provider():
+    if provider is None:
+        raise Exception("AI client is not initialized (e.g. missing API key).")
+    return provider
+
+# Upper bound on LLM requests in flight from async handlers. Extra callers
+# wait their turn on the event loop instead of holding a threadpool worker.
+MAX_CONCURRENT_CALLS = int(os.environ.get("AI_MAX_CONCURRENT_CALLS", "4"))
+
+_semaphore = None
+_semaphore_loop = None
+
+def _get_semaphore():
+    # asyncio primitives belong to one loop; tests and scripts may start several
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+        _semaphore_loop = loop
+    return _semaphore
+
+# ---------------------------------------------------------------------------
+# Response cache
+# Persistent prompt -> response store in copilot.db (llm_cache), keyed by
+# provider + model + whitespace-normalised prompt. Only call sites listed in
+# CACHE_TTLS are cached, each with its own lifetime; the table is kept under
+# CACHE_MAX_BYTES by evicting the least recently used rows. A running byte
+# total per database decides when to evict, so most writes skip the scan.
+# AI_CACHE=0 turns it off globally, cache=False on a call skips it once.
+# ---------------------------------------------------------------------------
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
+CACHE_ENABLED = os.environ.get("AI_CACHE", "1") != "0"
+CACHE_MAX_BYTES = int(os.environ.get("AI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_EVICT_TO = 0.9 # fraction of the budget left after an eviction pass, so the next writes fit
+
+# Seconds a response stays valid, per call site. Sites not listed (chat) are never cached.
+CACHE_TTLS = {
+    "extract": 30 * 86400,        # one transcript sentence -> item JSON
+    "batch_extract": 30 * 86400,  # whole transcript -> items JSON
+    "suggestions": 3600,          # agent rounds; prompts embed the live data, so a change misses anyway
+}
+
+_cache_lock = threading.Lock()
+_cache_table_ready = False
+_cache_counters = {}
+_cache_bytes = {}   # CACHE_DB_PATH -> running SUM(bytes) of llm_cache, loaded on first write
+
+def _cache_count(site, name):
+    with _cache_lock:
+        counters = _cache_counters.setdefault(site, {"hits": 0, "misses": 0, "expired": 0, "evictions": 0})
+        counters[name] += 1
+
+def _cache_db():
+    global _cache_table_ready
+    db = database.connect(CACHE_DB_PATH)
+    if not _cache_table_ready:
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key        TEXT PRIMARY KEY, -- sha256(provider + model + normalised prompt)
+                site       TEXT,
+                model      TEXT,
+                response   TEXT,
+                bytes      INTEGER,
+                created_at REAL,             -- epoch seconds
+                last_used  REAL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+        db.commit()
+        _cache_table_ready = True
+    return db
+
+def _cache_key(prompt, model):
+    normalised = " ".join(prompt.split())
+    return hashlib.sha256(f"{provider_name}\0{model}\0{normalised}".encode("utf-8")).hexdigest()
+
+def _cache_ttl(site, cache):
+    if not CACHE_ENABLED or cache is False or site is None:
+        return 0
+    return CACHE_TTLS.get(site, 0)
+
+def _cache_get(key, site, ttl):
+    try:
+        db = _cache_db()
+        row = db.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row and now - row[1] <= ttl:
+            db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+            db.close()
+            _cache_count(site, "hits")
+            return row[0]
+        db.close()
+        _cache_count(site, "expired" if row else "misses")
+    except sqlite3.Error as e:
+        print(f"LLM cache read failed: {e}")
+    return None
+
+def _cache_put(key, site, model, response):
+    try:
+        db = _cache_db()
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        old = db.execute("SELECT bytes FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, site, model, response, bytes, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, site, model, response, size, now, now)
+        )
+        with _cache_lock:
+            total = _cache_bytes.get(CACHE_DB_PATH)
+            if total is None:
+                total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_cache").fetchone()[0]
+            else:
+                total += size - (old[0] if old else 0)
+            _cache_bytes[CACHE_DB_PATH] = total
+        evicted = []
+        if total > CACHE_MAX_BYTES:
+            # Keep the newest rows whose running total fits, drop the rest. Other
+            # processes share the table, so the total is re-read here rather than trusted.
+            evicted = db.execute("""
+                SELECT key, site FROM (
+                    SELECT key, site, SUM(bytes) OVER (ORDER BY last_used DESC, key) AS running
+                    FROM llm_cache
+                ) WHERE running > ?
+            """, (int(CACHE_MAX_BYTES * CACHE_EVICT_TO),)).fetchall()
+            db.executemany("DELETE FROM llm_cache WHERE key = ?", [(r[0],) for r in evicted])
+            total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_cache").fetchone()[0]
+        db.commit()
+        db.close()
+        if evicted:
+            with _cache_lock:
+                _cache_bytes[CACHE_DB_PATH] = total
+            # Charged to the site that owned each row, not the one that wrote last
+            for _, evicted_site in evicted:
+                _cache_count(evicted_site, "evictions")
+    except sqlite3.Error as e:
+        with _cache_lock:
+            _cache_bytes.pop(CACHE_DB_PATH, None) # reload the total on the next write
+        print(f"LLM cache write failed: {e}")
+
+def cache_stats():
+    with _cache_lock:
+        by_site = {site: dict(c) for site, c in _cache_counters.items()}
+    hits = sum(c["hits"] for c in by_site.values())
+    lookups = sum(c["hits"] + c["misses"] + c["expired"] for c in by_site.values())
+    stats = {
+        "enabled": CACHE_ENABLED,
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttls": dict(CACHE_TTLS),
+        "hits": hits,
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "by_site": by_site,
+        "entries": 0,
+        "bytes": 0
+    }
+    try:
+        db = _cache_db()
+        stats["entries"], stats["bytes"] = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM llm_cache").fetchone()
+        db.close()
+    except sqlite3.Error:
+        pass
+    return stats
+
+def clear_cache():
+    """Deletes every cached response and resets the counters."""
+    with _cache_lock:
+        _cache_counters.clear()
+        _cache_bytes.pop(CACHE_DB_PATH, None)
+    try:
+        db = _cache_db()
+        db.execute("DELETE FROM llm_cache")
+        db.commit()
+        db.close()
+    except sqlite3.Error as e:
+        print(f"LLM cache clear failed: {e}")
+
+def call_ai(prompt, model_name=None, site=None, cache=None):
     """
-    Centralized function to call an AI model. 
+    Centralized function to call an AI model.
     This wrapper abstracts the AI provider, ensuring easy swapping between
     Gemini, OpenAI, local LLMs, etc. for production flexibility.
     Though not as advanced solution as discussed in the issues but a good start.
     Fixes #13
+    `site` names the call site for the response cache (see CACHE_TTLS);
+    cache=False bypasses it.
     """
-    if not client:
-        raise Exception("AI client is not initialized (e.g. missing API key).")
-        
-    response = client.models.generate_content(
-        model=model_name,
-        contents=prompt
-    )
-    return response.text.strip()
+    backend = _require_provider()
+    model = model_name or backend.default_model
+    ttl = _cache_ttl(site, cache)
+    if ttl:
+        key = _cache_key(prompt, model)
+        hit = _cache_get(key, site, ttl)
+        if hit is not None:
+            return hit
+    text = backend.generate(prompt, model).strip()
+    if ttl:
+        _cache_put(key, site, model, text)
+    return text
+
+async def call_ai_async(prompt, model_name=None, site=None, cache=None):
+    """
+    call_ai() on the provider's async surface, for async FastAPI handlers.
+    At most MAX_CONCURRENT_CALLS run at once; the rest queue on the semaphore.
+    Cache hits return without taking a slot.
+    """
+    backend = _require_provider()
+    model = model_name or backend.default_model
+    ttl = _cache_ttl(site, cache)
+    if ttl:
+        key = _cache_key(prompt, model)
+        hit = await asyncio.to_thread(_cache_get, key, site, ttl)
+        if hit is not None:
+            return hit
+    async with _get_semaphore():
+        text = (await backend.agenerate(prompt, model)).strip()
+    if ttl:
+        await asyncio.to_thread(_cache_put, key, site, model, text)
+    return text
+
+async def stream_ai_async(prompt, model_name=None, site=None, cache=None):
+    """
+    Async generator over the response text as the model produces it.
+    Holds one concurrency slot until the stream is exhausted or closed.
+    A cache hit is yielded as a single chunk; a completed stream is stored.
+    """
+    backend = _require_provider()
+    model = model_name or backend.default_model
+    ttl = _cache_ttl(site, cache)
+    if ttl:
+        key = _cache_key(prompt, model)
+        hit = await asyncio.to_thread(_cache_get, key, site, ttl)
+        if hit is not None:
+            yield hit
+            return
+    parts = []
+    async with _get_semaphore():
+        async for text in backend.astream(prompt, model):
+            parts.append(text)
+            yield text
+    if ttl:
+        await asyncio.to_thread(_cache_put, key, site, model, "".join(parts).strip())
@@ -6,23 +6,71 @@ except ImportError:
     import sqlite3
 import datetime
 from dotenv import load_dotenv
-import google.genai as genai
 import rag_engine
+import database
+import snapshots
+import events
 import ai
 
 # Load environment variables
 load_dotenv()
-api_key = os.environ.get("GEMINI_API_KEY")
-if api_key:
-    client = genai.Client(api_key=api_key)
-else:
-    print("Warning: No Gemini API key found in .env. Extraction will fail gracefully.")
-    client = None
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
 
+# Secondary indexes for the hot read paths. Partial indexes keep the
+# pending-only ones small: completed history never enters them.
+# test_query_plans.py checks that none of these queries falls back to a table scan.
+TIMELY_INDEXES = [
+    # get_todo_list(): ranked pending list, optionally filtered
+    """CREATE INDEX IF NOT EXISTS idx_timely_pending_rank
+       ON timely_items(weight DESC, deadline) WHERE status = 'pending'""",
+    """CREATE INDEX IF NOT EXISTS idx_timely_pending_ward
+       ON timely_items(ward, weight DESC, deadline) WHERE status = 'pending'""",
+    """CREATE INDEX IF NOT EXISTS idx_timely_pending_type
+       ON timely_items(type, weight DESC, deadline) WHERE status = 'pending'""",
+    # urgency filter, digest's open-by-urgency counts, get_overdue_items tool
+    """CREATE INDEX IF NOT EXISTS idx_timely_pending_urgency
+       ON timely_items(urgency, weight DESC, deadline) WHERE status = 'pending'""",
+    # digest overdue window / most overdue, stats currently_overdue
+    """CREATE INDEX IF NOT EXISTS idx_timely_pending_deadline
+       ON timely_items(deadline) WHERE status = 'pending'""",
+    # escalate_due(): items crossing a band
+    """CREATE INDEX IF NOT EXISTS idx_timely_next_escalation
+       ON timely_items(next_escalation_at) WHERE status = 'pending' AND source != 'issue_engine'""",
+    # add_item() cluster lookup, recent meetings
+    """CREATE INDEX IF NOT EXISTS idx_timely_source
+       ON timely_items(source, source_id)""",
+    # get_stats() by department, covering the columns it aggregates
+    """CREATE INDEX IF NOT EXISTS idx_timely_dept
+       ON timely_items(to_whom, status, completed_at, deadline, meeting_date)""",
+    # digest + stats date windows (same expressions the queries use)
+    """CREATE INDEX IF NOT EXISTS idx_timely_created_day
+       ON timely_items(date(created_at))""",
+    """CREATE INDEX IF NOT EXISTS idx_timely_completed_day
+       ON timely_items(date(completed_at)) WHERE status = 'completed'""",
+    # history page
+    """CREATE INDEX IF NOT EXISTS idx_timely_completed_at
+       ON timely_items(completed_at) WHERE status = 'completed'""",
+    # stats extension_rate
+    """CREATE INDEX IF NOT EXISTS idx_timely_extended
+       ON timely_items(extension_count) WHERE extension_count > 0""",
+]
+
+# Whole days from meeting to completion; NULL when either date doesn't parse
+DAYS_TO_RESOLVE_SQL = "(julianday(date(completed_at)) - julianday(date(meeting_date)))"
+
+# One timely_items row's contribution to its department's scorecard
+SCORECARD_COLUMNS = f"""
+    COUNT(*),
+    COALESCE(SUM(status = 'completed'), 0),
+    COALESCE(SUM(status = 'completed' AND date(completed_at) <= deadline), 0),
+    COALESCE(SUM(CASE WHEN status = 'completed' AND meeting_date IS NOT NULL THEN {DAYS_TO_RESOLVE_SQL} END), 0),
+    COALESCE(SUM(status = 'completed' AND meeting_date IS NOT NULL AND {DAYS_TO_RESOLVE_SQL} IS NOT NULL), 0),
+    COALESCE(SUM(extension_count), 0)
+"""
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS timely_items (
@@ -44,7 +92,8 @@ def init_db():
             created_at        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             completed_at      TIMESTAMP,
             resolution_notes  TEXT,
-            injected_to_rag   BOOLEAN DEFAULT FALSE
+            injected_to_rag   BOOLEAN DEFAULT FALSE,
+            next_escalation_at DATE -- next band crossing, NULL once at W8 or for issue items
         )
     """)
     cursor.execute("""
@@ -79,6 +128,51 @@ def init_db():
     # Insert default if not exists
     cursor.execute("INSERT OR IGNORE INTO profile (id) VALUES (1)")
 
+    # Escalation schedule: date each pending item next crosses a band
+    try:
+        cursor.execute("ALTER TABLE timely_items ADD COLUMN next_escalation_at DATE")
+        # Existing rows have no schedule yet; make them due so the next pass fills it in
+        cursor.execute("""
+            UPDATE timely_items SET next_escalation_at = date('now', 'localtime')
+            WHERE status = 'pending' AND source != 'issue_engine' AND julianday(deadline) IS NOT NULL
+        """)
+    except sqlite3.OperationalError:
+        pass # Already exists
+    for index_sql in TIMELY_INDEXES:
+        cursor.execute(index_sql)
+
+    # Department scorecard: running totals kept in step with timely_items by
+    # add_item / complete_item / extend_item, so stats never rescan history.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dept_scorecard'")
+    scorecard_exists = cursor.fetchone() is not None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dept_scorecard (
+            department        TEXT PRIMARY KEY, -- timely_items.to_whom
+            total             INTEGER DEFAULT 0,
+            completed         INTEGER DEFAULT 0,
+            on_time           INTEGER DEFAULT 0,
+            days_sum          REAL DEFAULT 0,   -- meeting -> completion, summed
+            days_count        INTEGER DEFAULT 0,
+            extensions        INTEGER DEFAULT 0
+        )
+    """)
+    if not scorecard_exists:
+        _fill_dept_scorecard(cursor)
+
+    # Escalation epoch: date of the last full pass + a dirty flag raised by
+    # writes that can move an item between bands (new items, new deadlines).
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS escalation_state (
+            id                INTEGER PRIMARY KEY CHECK (id = 1),
+            last_run_date     DATE,
+            dirty             BOOLEAN DEFAULT TRUE
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO escalation_state (id) VALUES (1)")
+
+    # Write counter behind the dashboard snapshot cache, see snapshots.py
+    snapshots.init_table(cursor)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS context_files (
             id                INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -107,8 +201,9 @@ def _infer_deadline(meeting_date_str, item_type):
     return (meeting_date + datetime.timedelta(days=days)).isoformat()
 
 def extract_with_gemini(raw_text, meeting_date, item_type, surrounding_context=""):
+    # Name kept for callers; the model comes from whichever ai.py provider is active
     try:
-        if not client:
+        if not ai.is_available():
             raise Exception("No client initialized.")
             
         prompt = f"""
@@ -134,7 +229,7 @@ Deadline inference rules if not explicit:
   question   -> 3 days from meeting date
   action     -> 5 days from meeting date
 """
-        raw = ai.call_ai(prompt)
+        raw = ai.call_ai(prompt, site="extract")
         # Clean up any potential markdown backticks that Gemini might still output
         if raw.startswith("```json"):
             raw = raw[7:]
@@ -165,7 +260,7 @@ def batch_extract_from_transcript(full_text, meeting_date, source_id):
     Uses Gemini to extract multiple items from a full meeting transcript.
     """
     try:
-        if not client:
+        if not ai.is_available():
             raise Exception("No client initialized.")
 
         prompt = f"""
@@ -188,7 +283,7 @@ For each item, extract:
 Return a JSON array of objects only.
 No explanation. No markdown. No backticks. Just the JSON array.
 """
-        raw = ai.call_ai(prompt)
+        raw = ai.call_ai(prompt, site="batch_extract")
         if raw.startswith("```json"): raw = raw[7:]
         if raw.startswith("```"): raw = raw[3:]
         if raw.endswith("```"): raw = raw[:-3]
@@ -261,7 +356,7 @@ def add_item(input_data):
     For Source B (issue): cluster_id, cluster_summary, ward, weight, urgency
     """
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
     
     if "cluster_summary" in input_data:
@@ -288,7 +383,9 @@ def add_item(input_data):
                 SET title = ?, weight = ?, urgency = ?, status = 'pending'
                 WHERE id = ?
             """, (title, weight, urgency, existing[0]))
+            snapshots.bump(cursor)
             conn.commit()
+            _publish_item(cursor, "item_updated", existing[0])
             conn.close()
             return existing[0]
 
@@ -315,76 +412,245 @@ def add_item(input_data):
         weight = 1
         urgency = "normal"
     
+    next_escalation_at = _initial_next_escalation(deadline) if source != "issue_engine" else None
+
     cursor.execute("""
         INSERT INTO timely_items (
             title, raw_text, type, source, source_id, to_whom, ward, deadline,
-            weight, urgency, extraction_failed, meeting_date
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (title, raw_text, item_type, source, source_id, to_whom, ward, deadline, weight, urgency, extraction_failed, meeting_date))
+            weight, urgency, extraction_failed, meeting_date, next_escalation_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (title, raw_text, item_type, source, source_id, to_whom, ward, deadline, weight, urgency, extraction_failed, meeting_date, next_escalation_at))
     
     item_id = cursor.lastrowid
+    _scorecard_apply(cursor, item_id, 1)
+    if source != "issue_engine":
+        _mark_escalation_dirty(cursor)
+    snapshots.bump(cursor)
     conn.commit()
+    _publish_item(cursor, "item_added", item_id)
     conn.close()
     
     return item_id
 
+# Escalation ladder: (max days overdue, weight, urgency). None = no upper bound.
+ESCALATION_BANDS = [
+    (0, 1, "normal"),
+    (3, 2, "normal"),
+    (7, 3, "urgent"),
+    (14, 5, "critical"),
+    (None, 8, "critical"),
+]
+
+# escalation_finished events list the moved items only up to this many
+ESCALATION_EVENT_ITEMS = 200
+
+def _band_case(days_expr, column):
+    """
+    Builds a SQL CASE mapping days overdue to the band's weight, urgency, or
+    next_escalation_at (the date the item crosses into the following band).
+    """
+    sql = "CASE"
+    for max_days, weight, urgency in ESCALATION_BANDS:
+        if column == "weight":
+            value = weight
+        elif column == "urgency":
+            value = f"'{urgency}'"
+        else:
+            value = "NULL" if max_days is None else f"date(deadline, '+{max_days + 1} days')"
+        if max_days is None:
+            sql += f" ELSE {value}"
+        else:
+            sql += f" WHEN {days_expr} <= {max_days} THEN {value}"
+    return sql + " END"
+
+def _initial_next_escalation(deadline):
+    # New or re-dated items are due immediately: the next pass puts them in
+    # their band and schedules the real crossing date. Unparseable deadlines
+    # are never escalated, so they get no schedule at all.
+    try:
+        datetime.datetime.strptime(str(deadline)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return datetime.datetime.now().date().isoformat()
+
+def _mark_escalation_dirty(cursor):
+    # Same transaction as the write, so a reader never sees the write without the flag
+    try:
+        cursor.execute("UPDATE escalation_state SET dirty = TRUE WHERE id = 1")
+    except sqlite3.OperationalError:
+        pass # Table not created yet; ensure_escalated() will run a pass anyway
+
+def ensure_escalated():
+    """
+    Runs escalate_due() only if weights could have changed since the last pass:
+    the calendar date moved on, or an item was added / had its deadline edited.
+    Returns the number of rows changed (0 when the pass was skipped).
+    """
+    today = datetime.datetime.now().date().isoformat()
+    conn = database.connect(DB_PATH)
+    try:
+        row = conn.execute("SELECT last_run_date, dirty FROM escalation_state WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+
+    if row and row[0] == today and not row[1]:
+        return 0
+    return escalate_due()
+
+def _run_escalation(due_only):
+    today = datetime.datetime.now().date().isoformat()
+    days = "(julianday(:today) - julianday(date(deadline)))"
+    new_weight = _band_case(days, "weight")
+    new_urgency = _band_case(days, "urgency")
+    new_next = _band_case(days, "next")
+
+    # Rows whose deadline doesn't parse (julianday() is NULL) are skipped.
+    where = """
+        WHERE status = 'pending'
+          AND source != 'issue_engine'
+          AND julianday(deadline) IS NOT NULL
+    """
+    if due_only:
+        # Served by idx_timely_next_escalation: only items crossing a band today
+        where += " AND next_escalation_at <= :today"
+
+    conn = database.connect(DB_PATH)
+    cursor = conn.cursor()
+    # Rows already in the right band are left alone so only real changes come back.
+    cursor.execute(f"""
+        UPDATE timely_items
+        SET weight = {new_weight},
+            urgency = {new_urgency},
+            next_escalation_at = {new_next}
+        {where}
+          AND (weight IS NOT {new_weight} OR urgency IS NOT {new_urgency})
+        RETURNING id, weight, urgency
+    """, {"today": today})
+    moved = [{"id": r[0], "weight": r[1], "urgency": r[2]} for r in cursor.fetchall()]
+    changed = len(moved)
+    # Reschedule the rest (due rows that stayed in band, or stale schedules on a full pass)
+    cursor.execute(f"""
+        UPDATE timely_items
+        SET next_escalation_at = {new_next}
+        {where}
+          AND next_escalation_at IS NOT {new_next}
+    """, {"today": today})
+    try:
+        cursor.execute("UPDATE escalation_state SET last_run_date = ?, dirty = FALSE WHERE id = 1", (today,))
+    except sqlite3.OperationalError:
+        pass
+    if changed:
+        snapshots.bump(cursor)
+    conn.commit()
+    conn.close()
+    if changed:
+        # Small passes carry the moved items so pages can patch them in place;
+        # a big first pass just tells them to refetch.
+        events.publish("escalation_finished", changed=changed,
+                       items=moved if changed <= ESCALATION_EVENT_ITEMS else None)
+    return changed
+
 def escalate():
     """
     Recalculates weight and urgency based on days overdue for meeting items.
+    Runs as set-based UPDATEs and returns the number of rows changed.
+    Always does a full pass; read paths should call ensure_escalated().
     NOTE: Issue-engine items are intentionally excluded — their weight is set
     by the Issue Engine at ingestion time and is not re-escalated here. This
     is a conscious design decision: timely.db defers urgency ownership of issue
     items back to the Issue Engine. Revisit if independent escalation is needed.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    return _run_escalation(due_only=False)
 
-    cursor.execute("SELECT id, deadline FROM timely_items WHERE status = 'pending' AND source != 'issue_engine'")
-    items = cursor.fetchall()
-    
-    today = datetime.datetime.now().date()
-    
-    for item_id, deadline_str in items:
-        if not deadline_str:
-            continue
-            
-        try:
-            deadline = datetime.datetime.strptime(str(deadline_str), "%Y-%m-%d").date()
-        except ValueError:
-            continue
-            
-        days_overdue = (today - deadline).days
-        
-        if days_overdue <= 0:
-            weight = 1
-            urgency = "normal"
-        elif 1 <= days_overdue <= 3:
-            weight = 2
-            urgency = "normal"
-        elif 4 <= days_overdue <= 7:
-            weight = 3
-            urgency = "urgent"
-        elif 8 <= days_overdue <= 14:
-            weight = 5
-            urgency = "critical"
-        else:
-            weight = 8
-            urgency = "critical"
-            
-        cursor.execute("UPDATE timely_items SET weight = ?, urgency = ? WHERE id = ?", (weight, urgency, item_id))
-        
-    conn.commit()
+def escalate_due():
+    """
+    Scheduled escalation: only touches items whose next_escalation_at has
+    arrived (deadline +1, +4, +8, +15 days), i.e. O(items changing today)
+    instead of O(all pending). Returns the number of rows changed.
+    """
+    return _run_escalation(due_only=True)
+
+def get_escalation_schedule(limit=10):
+    """Upcoming band crossings, soonest first, with the weight each item will move to."""
+    conn = database.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, title, ward, to_whom, deadline, weight, urgency, next_escalation_at,
+               {_band_case("(julianday(next_escalation_at) - julianday(date(deadline)))", "weight")} AS next_weight,
+               {_band_case("(julianday(next_escalation_at) - julianday(date(deadline)))", "urgency")} AS next_urgency
+        FROM timely_items
+        WHERE status = 'pending'
+          AND source != 'issue_engine'
+          AND next_escalation_at IS NOT NULL
+        ORDER BY next_escalation_at ASC
+        LIMIT ?
+    """, (limit,))
+    rows = cursor.fetchall()
     conn.close()
+    return [dict(r) for r in rows]
 
-def get_todo_list(type=None, urgency=None, ward=None):
+def get_todo_list(type=None, urgency=None, ward=None, escalate=True):
     """
     Returns all pending items, split into meeting_items and issue_items.
     Accepts optional filters: type, urgency, ward.
-    escalate() is called first to ensure fresh weights.
+    ensure_escalated() is called first to ensure fresh weights, unless the
+    caller already did (escalate=False).
     """
-    escalate() # Ensure weights are fresh
+    if escalate:
+        ensure_escalated() # Ensure weights are fresh
+    return snapshots.cached(DB_PATH, "todo", _build_todo_list, type, urgency, ward)
+
+def _todo_entry(item, today):
+    """Shapes a timely_items row the way get_todo_list returns it: (bucket, entry)."""
+    days_overdue = 0
+    if item["deadline"]:
+        try:
+            deadline = datetime.datetime.strptime(str(item["deadline"]), "%Y-%m-%d").date()
+            days_overdue = (today - deadline).days
+        except ValueError:
+            pass
+    item["days_overdue"] = days_overdue
     
-    conn = sqlite3.connect(DB_PATH)
+    if item["source"] == "issue_engine":
+        # Adjust to schema
+        return "issue_items", {
+            "id": item["id"],
+            "title": item["title"],
+            "type": item["type"],
+            "ward": item["ward"],
+            "weight": item["weight"],
+            "urgency": item["urgency"],
+            "cluster_id": item["source_id"],
+            "deadline": item["deadline"],
+            "days_overdue": item["days_overdue"]
+        }
+    else:
+        return "meeting_items", {
+            "id": item["id"],
+            "title": item["title"],
+            "type": item["type"],
+            "to_whom": item["to_whom"],
+            "ward": item["ward"],
+            "deadline": item["deadline"],
+            "weight": item["weight"],
+            "urgency": item["urgency"],
+            "days_overdue": item["days_overdue"],
+            "source_id": item["source_id"],
+            "meeting_date": item["meeting_date"]
+        }
+
+def _publish_item(cursor, event_type, item_id):
+    """Pushes the item's current todo entry to /api/events. Call after commit."""
+    cursor.execute("SELECT * FROM timely_items WHERE id = ?", (item_id,))
+    row = cursor.fetchone()
+    if row:
+        bucket, entry = _todo_entry(dict(row), datetime.datetime.now().date())
+        events.publish(event_type, bucket=bucket, item=entry)
+
+def _build_todo_list(type, urgency, ward):
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -414,50 +680,13 @@ def get_todo_list(type=None, urgency=None, ward=None):
     today = datetime.datetime.now().date()
     
     for row in rows:
-        item = dict(row)
-        
-        days_overdue = 0
-        if item["deadline"]:
-            try:
-                deadline = datetime.datetime.strptime(str(item["deadline"]), "%Y-%m-%d").date()
-                days_overdue = (today - deadline).days
-            except ValueError:
-                pass
-        item["days_overdue"] = days_overdue
-        
-        if item["source"] == "issue_engine":
-            # Adjust to schema
-            response["issue_items"].append({
-                "id": item["id"],
-                "title": item["title"],
-                "type": item["type"],
-                "ward": item["ward"],
-                "weight": item["weight"],
-                "urgency": item["urgency"],
-                "cluster_id": item["source_id"],
-                "deadline": item["deadline"],
-                "days_overdue": item["days_overdue"]
-            })
-        else:
-            response["meeting_items"].append({
-                "id": item["id"],
-                "title": item["title"],
-                "type": item["type"],
-                "to_whom": item["to_whom"],
-                "ward": item["ward"],
-                "deadline": item["deadline"],
-                "weight": item["weight"],
-                "urgency": item["urgency"],
-                "days_overdue": item["days_overdue"],
-                "source_id": item["source_id"],
-                "meeting_date": item["meeting_date"]
-            })
-            
+        bucket, entry = _todo_entry(dict(row), today)
+        response[bucket].append(entry)            
     conn.close()
     return response
 
 def complete_item(item_id, resolution_notes=""):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
@@ -502,6 +731,7 @@ Days taken: {days_taken}
 Was overdue: {'yes' if was_overdue else 'no'}
 Extensions: {item['extension_count']}"""
 
+    _scorecard_apply(cursor, item_id, -1)
     cursor.execute("""
         UPDATE timely_items 
         SET status = 'completed', 
@@ -510,9 +740,12 @@ Extensions: {item['extension_count']}"""
             injected_to_rag = TRUE
         WHERE id = ?
     """, (completed_at.isoformat(), resolution_notes, item_id))
+    _scorecard_apply(cursor, item_id, 1)
+    snapshots.bump(cursor)
     
     conn.commit()
     conn.close()
+    events.publish("item_completed", id=item_id)
     
     # In a real app, you would call RAG Engine here: rag_engine.store_fact(fact_string)
     try:
@@ -530,68 +763,132 @@ Extensions: {item['extension_count']}"""
     return fact_string
 
 def extend_item(item_id, new_deadline):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
 
     # Status stays 'pending' so the item remains visible in get_todo_list.
     # extension_count tracks how many times the deadline has been pushed.
     # Weight resets to 1 — fresh escalation from the new deadline.
+    _scorecard_apply(cursor, item_id, -1)
     cursor.execute("""
         UPDATE timely_items
         SET deadline = ?,
             extension_count = extension_count + 1,
             weight = 1,
             urgency = 'normal',
-            status = 'pending'
+            status = 'pending',
+            next_escalation_at = CASE WHEN source = 'issue_engine' THEN NULL ELSE ? END
         WHERE id = ?
-    """, (new_deadline, item_id))
+    """, (new_deadline, _initial_next_escalation(new_deadline), item_id))
+    _scorecard_apply(cursor, item_id, 1)
+    _mark_escalation_dirty(cursor)
+    snapshots.bump(cursor)
 
     conn.commit()
+    _publish_item(cursor, "item_extended", item_id)
     conn.close()
     return True
 
+def _fill_dept_scorecard(cursor):
+    cursor.execute(f"""
+        INSERT INTO dept_scorecard (department, total, completed, on_time, days_sum, days_count, extensions)
+        SELECT to_whom, {SCORECARD_COLUMNS}
+        FROM timely_items WHERE to_whom IS NOT NULL
+        GROUP BY to_whom
+    """)
+
+def _scorecard_apply(cursor, item_id, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) one item's contribution to its
+    department's scorecard. Writers remove it before changing the row and add
+    it back after, inside the same transaction.
+    """
+    cursor.execute(f"""
+        INSERT INTO dept_scorecard AS d (department, total, completed, on_time, days_sum, days_count, extensions)
+        SELECT to_whom, {SCORECARD_COLUMNS}
+        FROM timely_items WHERE id = ? AND to_whom IS NOT NULL
+        GROUP BY to_whom
+        ON CONFLICT(department) DO UPDATE SET
+            total      = d.total      + ? * excluded.total,
+            completed  = d.completed  + ? * excluded.completed,
+            on_time    = d.on_time    + ? * excluded.on_time,
+            days_sum   = d.days_sum   + ? * excluded.days_sum,
+            days_count = d.days_count + ? * excluded.days_count,
+            extensions = d.extensions + ? * excluded.extensions
+    """, (item_id,) + (sign,) * 6)
+
+def rebuild_dept_scorecard():
+    """Recomputes dept_scorecard from timely_items. For repairs after out-of-band SQL edits."""
+    conn = database.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM dept_scorecard")
+    _fill_dept_scorecard(cursor)
+    snapshots.bump(cursor)
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM dept_scorecard")
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def get_dept_scorecard(department=None):
+    conn = database.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    query = "SELECT * FROM dept_scorecard WHERE total > 0"
+    params = []
+    if department:
+        query += " AND department = ?"
+        params.append(department)
+    cursor.execute(query + " ORDER BY department", params)
+    rows = cursor.fetchall()
+    conn.close()
+    return [{
+        "name": row["department"],
+        "total": row["total"],
+        "completed": row["completed"],
+        "on_time": row["on_time"],
+        "avg_days": (row["days_sum"] / row["days_count"]) if row["days_count"] else 0,
+        "extensions": row["extensions"]
+    } for row in rows]
+
 def get_stats():
-    conn = sqlite3.connect(DB_PATH)
+    return snapshots.cached(DB_PATH, "stats", _build_stats)
+
+def _build_stats():
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     today = datetime.datetime.now()
-    current_month_str = today.strftime("%Y-%m")
+    # Month as a date(created_at) range so idx_timely_created_day can serve it
+    month_start = today.date().replace(day=1)
+    next_month = (month_start + datetime.timedelta(days=32)).replace(day=1)
+    month_range = (month_start.isoformat(), next_month.isoformat())
     
     # This month stats
-    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE strftime('%Y-%m', created_at) = ?", (current_month_str,))
+    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE date(created_at) >= ? AND date(created_at) < ?", month_range)
     total_made_this_month = cursor.fetchone()["c"]
     
     # Use date(completed_at) to strip the time component before comparing to
     # deadline (which is stored as plain YYYY-MM-DD). Without this, a full
     # ISO timestamp like '2026-03-04T14:32:00' compares incorrectly to '2026-03-04'.
-    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'completed' AND date(completed_at) <= deadline AND strftime('%Y-%m', created_at) = ?", (current_month_str,))
+    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'completed' AND date(completed_at) <= deadline AND date(created_at) >= ? AND date(created_at) < ?", month_range)
     resolved_on_time = cursor.fetchone()["c"]
     
     cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'pending' AND deadline < ?", (today.strftime("%Y-%m-%d"),))
     currently_overdue = cursor.fetchone()["c"]
     
-    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'completed' AND strftime('%Y-%m', created_at) = ?", (current_month_str,))
+    cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'completed' AND date(created_at) >= ? AND date(created_at) < ?", month_range)
     total_completed_month = cursor.fetchone()["c"]
     resolution_rate = (resolved_on_time / total_completed_month * 100) if total_completed_month > 0 else 0
     
     # All time stats
-    # avg_days_to_resolve
-    cursor.execute("SELECT completed_at, meeting_date FROM timely_items WHERE status = 'completed' AND meeting_date IS NOT NULL")
-    completed_items = cursor.fetchall()
-    
-    total_days = 0
-    valid_completed = 0
-    for item in completed_items:
-        try:
-            c_date = datetime.datetime.fromisoformat(item["completed_at"]).date()
-            m_date = datetime.datetime.strptime(item["meeting_date"], "%Y-%m-%d").date()
-            total_days += (c_date - m_date).days
-            valid_completed += 1
-        except Exception:
-            pass
-            
-    avg_days_to_resolve = (total_days / valid_completed) if valid_completed > 0 else 0
+    # avg_days_to_resolve — rows whose dates don't parse give NULL and AVG() skips them
+    cursor.execute(f"""
+        SELECT AVG({DAYS_TO_RESOLVE_SQL}) as avg_days
+        FROM timely_items WHERE status = 'completed' AND meeting_date IS NOT NULL
+    """)
+    avg_days_to_resolve = cursor.fetchone()["avg_days"] or 0
     
     cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE extension_count > 0")
     extended_count = cursor.fetchone()["c"]
@@ -600,41 +897,8 @@ def get_stats():
     
     extension_rate = (extended_count / total_items * 100) if total_items > 0 else 0
     
-    # by department stats
-    cursor.execute("SELECT to_whom, COUNT(*) as c FROM timely_items WHERE to_whom IS NOT NULL GROUP BY to_whom")
-    departments = cursor.fetchall()
-    
-    dept_stats = []
-    
-    for dept in departments:
-        name = dept["to_whom"]
-        total = dept["c"]
-        
-        cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE to_whom = ? AND status = 'completed' AND date(completed_at) <= deadline", (name,))
-        on_time = cursor.fetchone()["c"]
-        
-        cursor.execute("SELECT completed_at, meeting_date FROM timely_items WHERE to_whom = ? AND status = 'completed' AND meeting_date IS NOT NULL", (name,))
-        dept_completed = cursor.fetchall()
-        
-        dt_days = 0
-        dt_valid = 0
-        for item in dept_completed:
-            try:
-                c_date = datetime.datetime.fromisoformat(item["completed_at"]).date()
-                m_date = datetime.datetime.strptime(item["meeting_date"], "%Y-%m-%d").date()
-                dt_days += (c_date - m_date).days
-                dt_valid += 1
-            except:
-                pass
-                
-        avg_days = (dt_days / dt_valid) if dt_valid > 0 else 0
-        
-        dept_stats.append({
-            "name": name,
-            "total": total,
-            "on_time": on_time,
-            "avg_days": avg_days
-        })
+    # by department stats — read from the materialized scorecard, O(departments)
+    dept_stats = get_dept_scorecard()
         
     most_reliable_contact = None
     best_rate = -1
@@ -661,7 +925,7 @@ def get_stats():
         "by_department": dept_stats
     }
 def get_profile():
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM profile WHERE id = 1")
@@ -670,7 +934,7 @@ def get_profile():
     return dict(row) if row else {}
 
 def update_profile(data):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
     fields = []
     values = []
@@ -681,14 +945,15 @@ def update_profile(data):
     values.append(1)
     query = f"UPDATE profile SET {', '.join(fields)} WHERE id = ?"
     cursor.execute(query, values)
+    snapshots.bump(cursor)
     conn.commit()
     conn.close()
     return True
 
 def truncate_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
-    for table in ['timely_items', 'profile', 'context_files']:
+    for table in ['timely_items', 'profile', 'context_files', 'dept_scorecard']:
         try:
             cursor.execute(f"DELETE FROM {table}")
         except sqlite3.OperationalError:
@@ -698,12 +963,13 @@ def truncate_db():
         cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('timely_items', 'context_files')")
     except sqlite3.OperationalError:
         pass
+    snapshots.bump(cursor)
     conn.commit()
     conn.close()
     init_db() # Re-initialize defaults for profile
 
 def get_history(limit=50, offset=0):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) as c FROM timely_items WHERE status = 'completed'")
@@ -719,13 +985,14 @@ def get_history(limit=50, offset=0):
     return {"total": total, "items": items}
 
 def add_context_file(filename, label, category, content):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO context_files (filename, label, category, content)
         VALUES (?, ?, ?, ?)
     """, (filename, label, category, content))
     new_id = cursor.lastrowid
+    snapshots.bump(cursor)
     conn.commit()
     conn.close()
 
@@ -744,7 +1011,7 @@ def add_context_file(filename, label, category, content):
     return True
 
 def get_context_files():
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM context_files ORDER BY created_at DESC")
@@ -753,7 +1020,7 @@ def get_context_files():
     return [dict(row) for row in rows]
 
 def get_recent_meetings(limit=5):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -771,3 +1038,9 @@ def get_recent_meetings(limit=5):
     rows = cursor.fetchall()
     conn.close()
     return [dict(row) for row in rows]
+
+if __name__ == "__main__":
+    import sys
+    init_db()
+    if "--rebuild-scorecard" in sys.argv:
+        print(f"Rebuilt dept_scorecard: {rebuild_dept_scorecard()} departments.")
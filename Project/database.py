@@ -0,0 +1,152 @@
+import os
+import threading
+try:
+    from pysqlite3 import dbapi2 as sqlite3
+except ImportError:
+    import sqlite3
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
+
+# Applied once per connection. WAL lets dashboard reads run alongside a
+# write; busy_timeout makes concurrent writers wait instead of erroring.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000, # negative = KiB, so ~20 MB page cache
+    "busy_timeout": 5000,
+}
+
+# One connection per (thread, database file). FastAPI runs sync endpoints on
+# a fixed threadpool, so each worker thread keeps its own connection alive
+# instead of reconnecting (and reloading sqlite-vec) on every call.
+# Connections of threads that have exited are closed the next time a new
+# connection is opened, so short-lived threads do not leak file handles.
+_local = threading.local()
+_all_entries = []
+_all_lock = threading.Lock()
+
+class _Entry:
+    def __init__(self, raw):
+        self.raw = raw
+        self.thread = threading.current_thread()
+        self.handles = 0
+        self.closed = False
+
+    def release(self):
+        self.handles -= 1
+        # Last handle closed: behave like a real close() and drop uncommitted work
+        if self.handles <= 0:
+            self.handles = 0
+            if self.raw.in_transaction:
+                self.raw.rollback()
+
+class PooledConnection:
+    """
+    What connect() hands out. Behaves like a sqlite3.Connection, but close()
+    returns the thread's connection to the pool instead of closing it.
+
+    Nested connect() calls on one thread share the same raw connection, so a
+    commit or rollback through any handle applies to all of them. A nested
+    handle may therefore only be taken while no transaction is open.
+    """
+    def __init__(self, entry):
+        object.__setattr__(self, "_entry", entry)
+        object.__setattr__(self, "_open", True)
+        entry.handles += 1
+
+    def __getattr__(self, name):
+        return getattr(self._entry.raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._entry.raw, name, value)
+
+    def close(self):
+        if self._open:
+            object.__setattr__(self, "_open", False)
+            self._entry.release()
+
+    def __del__(self):
+        # Handles dropped by an exception path still release the connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def _load_vec(raw):
+    try:
+        import sqlite_vec
+        raw.enable_load_extension(True)
+        sqlite_vec.load(raw)
+    except (AttributeError, sqlite3.OperationalError, ImportError):
+        # Fallback for systems where enable_load_extension is not available
+        pass
+    finally:
+        try:
+            raw.enable_load_extension(False)
+        except Exception:
+            pass
+
+def _open(path):
+    raw = sqlite3.connect(path, check_same_thread=False)
+    for name, value in PRAGMAS.items():
+        raw.execute(f"PRAGMA {name} = {value}")
+    _load_vec(raw)
+    raw.row_factory = sqlite3.Row
+    return raw
+
+def _prune_dead():
+    """Closes the connections of threads that are no longer running."""
+    with _all_lock:
+        dead = [e for e in _all_entries if not e.thread.is_alive()]
+        for entry in dead:
+            _all_entries.remove(entry)
+    for entry in dead:
+        entry.closed = True
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+def connect(path=None):
+    """
+    Returns this thread's connection to `path` (default: copilot.db), opened
+    on first use with PRAGMAS applied and sqlite-vec loaded.
+    Call close() when done, exactly as with sqlite3.connect().
+    """
+    path = path or DB_PATH
+    entries = getattr(_local, "entries", None)
+    if entries is None:
+        entries = _local.entries = {}
+    entry = entries.get(path)
+    if entry is None or entry.closed:
+        _prune_dead()
+        entry = entries[path] = _Entry(_open(path))
+        with _all_lock:
+            _all_entries.append(entry)
+    elif entry.handles == 0 and entry.raw.in_transaction:
+        entry.raw.rollback() # leftovers from a caller that never closed
+    else:
+        # A nested handle would commit or roll back the outer caller's work
+        assert not (entry.handles and entry.raw.in_transaction), \
+            "nested connect() while this thread has an open transaction"
+    return PooledConnection(entry)
+
+def close_all():
+    """Closes every pooled connection (server shutdown, tests)."""
+    with _all_lock:
+        entries = list(_all_entries)
+        _all_entries.clear()
+    for entry in entries:
+        entry.closed = True
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+def pool_stats():
+    with _all_lock:
+        return {
+            "connections": len(_all_entries),
+            "in_use": sum(1 for e in _all_entries if e.handles > 0)
+        }
@@ -4,6 +4,8 @@ except ImportError:
     import sqlite3
 import datetime
 import commitment_engine
+import database
+import snapshots
 
 DB_PATH = commitment_engine.DB_PATH
 
@@ -11,15 +13,19 @@ DB_PATH = commitment_engine.DB_PATH
 # NEW — Digest Module Functions
 # ---------------------------------------------------------------------------
 
-def get_digest():
+def get_digest(escalate=True):
     """
     Reads the last 7 days of data from timely_items.
     Returns a structured weekly summary dict. No LLM. No formatting. Just numbers.
-    Calls escalate() first to ensure urgency counts are fresh.
+    Calls ensure_escalated() first to ensure urgency counts are fresh, unless
+    the caller already did (escalate=False).
     """
-    commitment_engine.escalate()
+    if escalate:
+        commitment_engine.ensure_escalated()
+    return snapshots.cached(DB_PATH, "digest", _build_digest)
 
-    conn = sqlite3.connect(DB_PATH)
+def _build_digest():
+    conn = database.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
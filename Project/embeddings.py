@@ -0,0 +1,272 @@
+import os
+import time
+import threading
+import hashlib
+from collections import OrderedDict
+try:
+    from pysqlite3 import dbapi2 as sqlite3
+except ImportError:
+    import sqlite3
+import numpy as np
+import database
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+# Embedding cache: in-memory LRU in front of an on-disk float32 store.
+# Keyed by model name + text hash, so a model swap never serves stale vectors.
+# The table is kept under CACHE_DISK_MAX_ENTRIES rows (~1.5 KB each) by
+# dropping the least recently used ones once a running row count exceeds it.
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
+CACHE_MAX_ENTRIES = 4096
+CACHE_DISK_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ROWS", "50000"))
+CACHE_EVICT_TO = 0.9 # fraction of the cap left after an eviction pass
+
+# One SentenceTransformer per process, shared by every engine.
+# rag_engine and issue_engine used to hold their own copy each.
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                print(f"Loading SentenceTransformer model {MODEL_NAME}...")
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+# Tokenizer casing of known models (do_lower_case in their tokenizer_config),
+# so lowercases_input() can answer without loading the model
+LOWERCASING_MODELS = {"all-MiniLM-L6-v2": True}
+
+def lowercases_input():
+    """True when the tokenizer lowercases, i.e. 'Ward 42' and 'ward 42' embed identically."""
+    if MODEL_NAME in LOWERCASING_MODELS:
+        return LOWERCASING_MODELS[MODEL_NAME]
+    if _model is None:
+        # Unknown model not loaded yet: stay case-sensitive, which is always correct
+        return False
+    try:
+        return bool(getattr(_model.tokenizer, "do_lower_case", False))
+    except Exception:
+        return False
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+_cache_tables_ready = set() # CACHE_DB_PATH values whose table exists
+_disk_rows = {}             # CACHE_DB_PATH -> running row count, loaded on first write
+_counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+def cache_key(text):
+    return hashlib.sha256(f"{MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+def _lru_get(key):
+    with _lru_lock:
+        vec = _lru.get(key)
+        if vec is not None:
+            _lru.move_to_end(key)
+        return vec
+
+def _lru_put(key, vec):
+    vec.setflags(write=False) # shared between callers
+    with _lru_lock:
+        _lru[key] = vec
+        _lru.move_to_end(key)
+        while len(_lru) > CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+
+def _count(name, n=1):
+    with _lru_lock:
+        _counters[name] += n
+
+def _cache_db():
+    db = database.connect(CACHE_DB_PATH)
+    if CACHE_DB_PATH not in _cache_tables_ready:
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key        TEXT PRIMARY KEY, -- sha256(model + text)
+                model      TEXT,
+                embedding  BLOB,             -- raw float32
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used  REAL              -- epoch seconds
+            )
+        """)
+        try:
+            db.execute("ALTER TABLE embedding_cache ADD COLUMN last_used REAL")
+        except sqlite3.OperationalError:
+            pass
+        db.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used)")
+        db.commit()
+        _cache_tables_ready.add(CACHE_DB_PATH)
+    return db
+
+def _disk_get_many(keys):
+    if not keys:
+        return {}
+    found = {}
+    try:
+        db = _cache_db()
+        # Chunk to stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = db.execute(
+                f"SELECT key, embedding FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+        if found:
+            db.executemany("UPDATE embedding_cache SET last_used = ? WHERE key = ?",
+                           [(time.time(), key) for key in found])
+            db.commit()
+        db.close()
+    except sqlite3.Error as e:
+        print(f"Embedding cache read failed: {e}")
+    return found
+
+def _disk_put_many(entries):
+    if not entries:
+        return
+    try:
+        db = _cache_db()
+        now = time.time()
+        db.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (key, model, embedding, last_used) VALUES (?, ?, ?, ?)",
+            [(key, MODEL_NAME, vec.astype(np.float32).tobytes(), now) for key, vec in entries]
+        )
+        with _lru_lock:
+            rows = _disk_rows.get(CACHE_DB_PATH)
+            if rows is None:
+                rows = db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            else:
+                rows += len(entries) # replaced keys overcount; the eviction pass re-reads it
+            _disk_rows[CACHE_DB_PATH] = rows
+        if rows > CACHE_DISK_MAX_ENTRIES:
+            rows = db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            excess = rows - int(CACHE_DISK_MAX_ENTRIES * CACHE_EVICT_TO)
+            if rows > CACHE_DISK_MAX_ENTRIES and excess > 0:
+                db.execute("""
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache ORDER BY last_used, key LIMIT ?
+                    )
+                """, (excess,))
+                rows -= excess
+            with _lru_lock:
+                _disk_rows[CACHE_DB_PATH] = rows
+        db.commit()
+        db.close()
+    except sqlite3.Error as e:
+        with _lru_lock:
+            _disk_rows.pop(CACHE_DB_PATH, None) # recount on the next write
+        print(f"Embedding cache write failed: {e}")
+
+def encode(text):
+    """Embeds a single string. Returns a 1-D float32 vector."""
+    return encode_many([text])[0]
+
+def encode_many(texts, batch_size=32):
+    """
+    Embeds a list of strings in batched forward passes.
+    Returns a (len(texts), EMBEDDING_DIM) float32 matrix.
+    Cached texts skip the model; only the misses are encoded, in one batch.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    keys = [cache_key(t) for t in texts]
+    resolved = {}
+    for key in keys:
+        if key not in resolved:
+            vec = _lru_get(key)
+            if vec is not None:
+                resolved[key] = vec
+    _count("memory_hits", sum(1 for k in keys if k in resolved))
+
+    pending = list(dict.fromkeys(k for k in keys if k not in resolved))
+    from_disk = _disk_get_many(pending)
+    for key, vec in from_disk.items():
+        _lru_put(key, vec)
+        resolved[key] = vec
+    _count("disk_hits", sum(1 for k in keys if k in from_disk))
+
+    missing = [k for k in pending if k not in from_disk]
+    if missing:
+        missing_set = set(missing)
+        _count("misses", sum(1 for k in keys if k in missing_set))
+        text_for = dict(zip(keys, texts))
+        vecs = get_model().encode([text_for[k] for k in missing], batch_size=batch_size)
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(len(missing), -1)
+        fresh = []
+        for key, vec in zip(missing, vecs):
+            vec = vec.copy()
+            _lru_put(key, vec)
+            resolved[key] = vec
+            fresh.append((key, vec))
+        _disk_put_many(fresh)
+
+    return np.stack([resolved[k] for k in keys])
+
+def cache_stats():
+    with _lru_lock:
+        stats = dict(_counters)
+        stats["memory_entries"] = len(_lru)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["max_entries"] = CACHE_MAX_ENTRIES
+    stats["disk_max_entries"] = CACHE_DISK_MAX_ENTRIES
+    stats["disk_entries"] = 0
+    try:
+        db = _cache_db()
+        stats["disk_entries"] = db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        db.close()
+    except sqlite3.Error:
+        pass
+    stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+    return stats
+
+def clear_cache(disk=False):
+    """Drops the in-memory LRU (and the on-disk store if disk=True) and resets counters."""
+    with _lru_lock:
+        _lru.clear()
+        for k in _counters:
+            _counters[k] = 0
+        if disk:
+            _disk_rows.pop(CACHE_DB_PATH, None)
+    if disk:
+        try:
+            db = _cache_db()
+            db.execute("DELETE FROM embedding_cache")
+            db.commit()
+            db.close()
+        except sqlite3.Error as e:
+            print(f"Embedding cache clear failed: {e}")
+
+def memory_usage():
+    """
+    Reports what the shared model costs this process.
+    param_bytes covers weights + buffers; max_rss_bytes is the whole process peak.
+    """
+    usage = {
+        "model": MODEL_NAME,
+        "loaded": _model is not None,
+        "param_bytes": 0,
+        "max_rss_bytes": None,
+        "cache": cache_stats()
+    }
+    if _model is not None:
+        try:
+            tensors = list(_model.parameters()) + list(_model.buffers())
+            usage["param_bytes"] = sum(t.numel() * t.element_size() for t in tensors)
+        except Exception:
+            pass
+    try:
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        usage["max_rss_bytes"] = rss if sys.platform == "darwin" else rss * 1024
+    except Exception:
+        pass
+    return usage
@@ -0,0 +1,81 @@
+import asyncio
+import collections
+import itertools
+import json
+import threading
+
+# In-process change feed behind /api/events. Engines call publish() right
+# after they commit; each open SSE connection owns an asyncio.Queue that is
+# fed on its event loop, so publishing from a threadpool worker is safe.
+# Events only reach subscribers in the same process. The stream endpoint
+# covers writes from other workers or scripts by watching data_version.
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 256   # per subscriber; a client that falls this far behind is told to resync
+REPLAY_SIZE = 200  # recent events kept for reconnects carrying Last-Event-ID
+
+_subscribers = set()
+_recent = collections.deque(maxlen=REPLAY_SIZE)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+def publish(event_type, **data):
+    """Broadcasts {type, data} to every open stream. Cheap no-op with no listeners."""
+    with _lock:
+        event = {"id": next(_ids), "type": event_type, "data": data}
+        _recent.append(event)
+        subscribers = list(_subscribers)
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(_offer, queue, event)
+        except RuntimeError:
+            pass # Loop already closed; unsubscribe() will drop it
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Dropping events silently would leave the page wrong; make it refetch instead
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"id": event["id"], "type": "resync", "data": {"reason": "overflow"}})
+
+def subscribe(last_event_id=None):
+    """
+    Registers a queue on the running event loop. With a Last-Event-ID the
+    events missed since then are queued first, or a resync if they have
+    already fallen out of the replay buffer.
+    """
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    entry = (asyncio.get_running_loop(), queue)
+    with _lock:
+        _subscribers.add(entry)
+        recent = list(_recent)
+    if last_event_id is not None:
+        try:
+            last = int(last_event_id)
+        except ValueError:
+            last = 0
+        newest = recent[-1]["id"] if recent else 0
+        oldest = recent[0]["id"] if recent else 1
+        # Gap in the buffer, or ids from before a server restart
+        if last + 1 < oldest or last > newest:
+            queue.put_nowait({"id": newest, "type": "resync", "data": {"reason": "replay"}})
+        else:
+            for event in [e for e in recent if e["id"] > last]:
+                queue.put_nowait(event)
+    return queue
+
+def unsubscribe(queue):
+    with _lock:
+        for entry in [e for e in _subscribers if e[1] is queue]:
+            _subscribers.discard(entry)
+
+def subscriber_count():
+    with _lock:
+        return len(_subscribers)
+
+def format_sse(event):
+    # No id line for events outside the feed, so the client's Last-Event-ID stays put
+    head = f"id: {event['id']}\n" if event.get("id") is not None else ""
+    return head + f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
@@ -2,14 +2,19 @@ try:
     from pysqlite3 import dbapi2 as sqlite3
 except ImportError:
     import sqlite3
-import sqlite_vec
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 import struct
 import os
+import threading
+import numpy as np
+import database
+import embeddings
+import snapshots
+import events
+import vector_index
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
-MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_NAME = embeddings.MODEL_NAME
 THRESHOLD = 0.35 # Cosine similarity threshold (1.0 - distance). Lower is more flexible
 
 def normalize_ward(ward_str):
@@ -22,44 +27,13 @@ def normalize_ward(ward_str):
     s = str(ward_str).lower().replace(" ", "").replace("ward", "")
     return s if s else None
 
-def cosine_similarity(v1, v2):
-    """Simple in-memory cosine similarity calculation."""
-    import math
-    if len(v1) != len(v2):
-        raise ValueError(f"Vector length mismatch: {len(v1)} vs {len(v2)}")
-    sumxx, sumyy, sumxy = 0, 0, 0
-    for x, y in zip(v1, v2):
-        sumxx += x*x
-        sumyy += y*y
-        sumxy += x*y
-    if sumxx == 0 or sumyy == 0:
-        return 0
-    return sumxy / (math.sqrt(sumxx) * math.sqrt(sumyy))
-
-# Load model lazily
-_model = None
 def get_model():
-    global _model
-    if _model is None:
-        print(f"Loading SentenceTransformer model {MODEL_NAME}...")
-        _model = SentenceTransformer(MODEL_NAME)
-    return _model
+    # Shared process-wide instance, see embeddings.py
+    return embeddings.get_model()
 
 def get_db():
-    db = sqlite3.connect(DB_PATH)
-    try:
-        db.enable_load_extension(True)
-        sqlite_vec.load(db)
-    except (AttributeError, sqlite3.OperationalError):
-        # Fallback for systems where enable_load_extension is not available
-        pass
-    finally:
-        try:
-            db.enable_load_extension(False)
-        except Exception:
-            pass
-    db.row_factory = sqlite3.Row
-    return db
+    # Pooled per-thread connection with sqlite-vec already loaded, see database.py
+    return database.connect(DB_PATH)
 
 def serialize_f32(vector):
     """serializes a list of floats into a format sqlite-vec expects"""
@@ -116,6 +90,39 @@ def init_db():
             embedding BLOB
         )
         """)
+    # Every complaint's embedding, float16 (768 bytes at 384 dims), so re-clustering,
+    # threshold tuning and model comparisons never re-encode the history
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS complaint_embeddings (
+        complaint_id INTEGER PRIMARY KEY,
+        model        TEXT,
+        embedding    BLOB,
+        FOREIGN KEY(complaint_id) REFERENCES complaints(id)
+    )
+    """)
+
+    # Stored normalize_ward(ward), so complaint matching can filter by ward on an index
+    try:
+        db.execute("ALTER TABLE clusters ADD COLUMN normalized_ward TEXT")
+        rows = db.execute("SELECT id, ward FROM clusters WHERE ward IS NOT NULL").fetchall()
+        db.executemany("UPDATE clusters SET normalized_ward = ? WHERE id = ?",
+                       [(normalize_ward(r['ward']), r['id']) for r in rows])
+    except sqlite3.OperationalError:
+        pass # Already exists
+    # Complaints merged into the cluster's running-mean centroid (vec_clusters)
+    try:
+        db.execute("ALTER TABLE clusters ADD COLUMN member_count INTEGER DEFAULT 1")
+        db.execute("""
+            UPDATE clusters SET member_count = MAX(1, (SELECT COUNT(*) FROM complaints WHERE cluster_id = clusters.id))
+        """)
+    except sqlite3.OperationalError:
+        pass # Already exists
+    # Covers the per-ward sync check in ward_cluster_index()
+    db.execute("DROP INDEX IF EXISTS idx_clusters_normalized_ward")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_clusters_ward_members ON clusters(normalized_ward, member_count)")
+
+    # Write counter behind the dashboard snapshot cache, see snapshots.py
+    snapshots.init_table(db)
     db.commit()
     db.close()
 
@@ -127,11 +134,61 @@ def determine_urgency(weight):
     else:
         return "critical"
 
+# Per-ward cluster matrices for complaint matching, keyed by normalized_ward.
+# A ward is loaded on its first complaint and then kept in step by comparing
+# its MAX(id)/COUNT(*)/SUM(member_count) on idx_clusters_ward_members, so
+# matching never reads another ward's clusters and scores this ward's in one
+# product. A changed member sum means another process moved a centroid.
+_ward_indexes = {}   # normalized_ward -> {"index", "max_id", "count", "members"}
+_ward_lock = threading.Lock()
+
+def _load_ward_rows(cursor, index, normalized_ward, after_id):
+    cursor.execute("""
+        SELECT c.id, v.embedding
+        FROM clusters c
+        JOIN vec_clusters v ON v.cluster_id = c.id
+        WHERE c.normalized_ward IS ? AND c.id > ?
+        ORDER BY c.id
+    """, (normalized_ward, after_id))
+    width = embeddings.EMBEDDING_DIM * 4
+    rows = [r for r in cursor.fetchall() if r['embedding'] and len(r['embedding']) == width]
+    if rows:
+        matrix = np.frombuffer(b"".join(r['embedding'] for r in rows), dtype=np.float32)
+        index.add([r['id'] for r in rows], matrix.reshape(len(rows), -1))
+
+def ward_cluster_index(cursor, normalized_ward):
+    """Returns the VectorIndex of this ward's cluster embeddings, synced with the tables."""
+    max_id, count, members = cursor.execute(
+        "SELECT MAX(id), COUNT(*), SUM(member_count) FROM clusters WHERE normalized_ward IS ?", (normalized_ward,)
+    ).fetchone()
+    max_id, members = max_id or 0, members or 0
+    with _ward_lock:
+        entry = _ward_indexes.get(normalized_ward)
+        if entry and (entry["max_id"], entry["count"], entry["members"]) == (max_id, count, members):
+            return entry["index"]
+        if entry and max_id > entry["max_id"]:
+            # New clusters only: load just those, unless something else changed too
+            grown, new_members = cursor.execute(
+                "SELECT COUNT(*), SUM(member_count) FROM clusters WHERE normalized_ward IS ? AND id > ?",
+                (normalized_ward, entry["max_id"])
+            ).fetchone()
+            if (entry["count"] + grown, entry["members"] + (new_members or 0)) == (count, members):
+                _load_ward_rows(cursor, entry["index"], normalized_ward, entry["max_id"])
+                entry.update(max_id=max_id, count=count, members=members)
+                return entry["index"]
+        index = vector_index.VectorIndex(embeddings.EMBEDDING_DIM)
+        _load_ward_rows(cursor, index, normalized_ward, 0)
+        _ward_indexes[normalized_ward] = {"index": index, "max_id": max_id, "count": count, "members": members}
+        return index
+
+def reset_ward_indexes():
+    with _ward_lock:
+        _ward_indexes.clear()
+
 def process_complaint(complaint_data):
     """
     Takes a complaint dict and returns matched or new cluster info.
     """
-    model = get_model()
     db = get_db()
     cursor = db.cursor()
     
@@ -141,7 +198,7 @@ def process_complaint(complaint_data):
         raise ValueError("complaint_text is required")
         
     try:
-        embedding = model.encode(text)
+        embedding = embeddings.encode(text)
         embedding_bytes = serialize_f32(embedding.tolist())
     except Exception as e:
         print(f"Embedding generation failed: {e}")
@@ -166,6 +223,8 @@ def process_complaint(complaint_data):
         now
     ))
     complaint_id = cursor.lastrowid
+    if embedding_bytes:
+        _store_complaint_embeddings(cursor, [complaint_id], embedding[None, :])
     
     # 3. Search for similar clusters
     match = None
@@ -174,58 +233,11 @@ def process_complaint(complaint_data):
 
     if embedding_bytes:
         try:
-            # A. Try sqlite-vec first
-            # Attempting a vector query directly to check for module support
-            cursor.execute("""
-                SELECT v.cluster_id, vec_distance_cosine(v.embedding, ?) as distance
-                FROM vec_clusters v
-                INNER JOIN clusters c ON v.cluster_id = c.id
-                WHERE REPLACE(REPLACE(LOWER(c.ward), ' ', ''), 'ward', '') IS ?
-                ORDER BY distance ASC
-                LIMIT 1
-            """, (embedding_bytes, normalized_ward))
-            match = cursor.fetchone()
-        except Exception:
-            # B. Fallback to in-memory similarity if sqlite-vec is missing
-            try:
-                # Try fetch with embedding (works if vec_clusters is a normal table)
-                cursor.execute("""
-                    SELECT c.id, v.embedding, c.ward
-                    FROM clusters c
-                    JOIN vec_clusters v ON c.id = v.cluster_id
-                """)
-                rows = cursor.fetchall()
-            except Exception:
-                # Fallback: vec_clusters is virtual and module is missing - cannot get embeddings
-                cursor.execute("SELECT id, ward FROM clusters")
-                rows = cursor.fetchall()
-
-            all_clusters = []
-            for r in rows:
-                if normalize_ward(r['ward']) == normalized_ward:
-                    # Convert sqlite3.Row to dict and ensure embedding key exists
-                    d = dict(r)
-                    if 'embedding' not in d:
-                        d['embedding'] = None
-                    all_clusters.append(d)
-            
-            best_sim = -1
-            best_id = None
-            
-            if all_clusters:
-                current_v = embedding.tolist()
-                for row in all_clusters:
-                    cluster_id = row['id']
-                    eb = row['embedding']
-                    if eb:
-                        cluster_v = struct.unpack(f"{len(current_v)}f", eb)
-                        sim = cosine_similarity(current_v, cluster_v)
-                        if sim > best_sim:
-                            best_sim = sim
-                            best_id = cluster_id
-            
-            if best_id and best_sim >= THRESHOLD:
-                match = {'cluster_id': best_id, 'distance': 1.0 - best_sim}
+            hits = ward_cluster_index(cursor, normalized_ward).search(embedding, 1, exact=True)
+        except (sqlite3.OperationalError, sqlite3.DatabaseError):
+            hits = [] # vec_clusters unreadable (virtual table without sqlite-vec)
+        if hits:
+            match = {'cluster_id': hits[0][0], 'distance': 1.0 - hits[0][1]}
         
     action = ""
     target_cluster_id = None
@@ -235,20 +247,33 @@ def process_complaint(complaint_data):
     
     if match and match['distance'] <= max_distance:
         target_cluster_id = match['cluster_id']
-        cursor.execute("SELECT summary, weight FROM clusters WHERE id = ?", (target_cluster_id,))
+        cursor.execute("SELECT summary, weight, ward, member_count FROM clusters WHERE id = ?", (target_cluster_id,))
         cluster_row = cursor.fetchone()
         target_summary = cluster_row['summary']
+        target_ward = cluster_row['ward']
         if match['distance'] > 0.15 and len(target_summary) < 150:
             addition = text[:50].strip()
             if addition.lower() not in target_summary.lower():
                 target_summary += " | " + addition
         new_weight = cluster_row['weight'] + 1
         urgency = determine_urgency(new_weight)
-        cursor.execute("UPDATE clusters SET weight = ?, urgency = ?, summary = ? WHERE id = ?", (new_weight, urgency, target_summary, target_cluster_id))
+        cursor.execute("""
+            UPDATE clusters SET weight = ?, urgency = ?, summary = ?, member_count = member_count + 1 WHERE id = ?
+        """, (new_weight, urgency, target_summary, target_cluster_id))
+        # Fold this complaint into the running mean: O(dim), no re-encoding of members
+        cursor.execute("SELECT embedding FROM vec_clusters WHERE cluster_id = ?", (target_cluster_id,))
+        old = np.frombuffer(cursor.fetchone()['embedding'], dtype=np.float32)
+        centroid = old + (embedding - old) / ((cluster_row['member_count'] or 1) + 1)
+        cursor.execute("UPDATE vec_clusters SET embedding = ? WHERE cluster_id = ?",
+                       (centroid.astype(np.float32).tobytes(), target_cluster_id))
         action = "added_to_existing"
     else:
         target_summary = text[:100] + "..." if len(text) > 100 else text
-        cursor.execute("INSERT INTO clusters (summary, ward, weight, urgency, created_at) VALUES (?, ?, ?, ?, ?)", (target_summary, complaint_data.get('ward'), 1, "normal", now))
+        target_ward = complaint_data.get('ward')
+        cursor.execute("""
+            INSERT INTO clusters (summary, ward, normalized_ward, weight, urgency, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (target_summary, complaint_data.get('ward'), normalized_ward, 1, "normal", now))
         target_cluster_id = cursor.lastrowid
         if embedding_bytes:
             # We already know if vec_clusters is virtual or real, INSERT works the same for both
@@ -259,8 +284,21 @@ def process_complaint(complaint_data):
         action = "new_cluster_created"
         
     cursor.execute("UPDATE complaints SET cluster_id = ? WHERE id = ?", (target_cluster_id, complaint_id))
+    snapshots.bump(cursor)
     db.commit()
     db.close()
+    if action == "added_to_existing":
+        with _ward_lock:
+            entry = _ward_indexes.get(normalized_ward)
+            if entry and entry["index"].update(target_cluster_id, centroid):
+                entry["members"] += 1
+    events.publish("cluster_updated", action=action, cluster={
+        "id": target_cluster_id,
+        "summary": target_summary,
+        "ward": target_ward,
+        "weight": new_weight,
+        "urgency": urgency
+    })
     
     return {
         "action": action,
@@ -274,6 +312,7 @@ def process_complaint(complaint_data):
 def truncate_db():
     db = get_db()
     cursor = db.cursor()
+    cursor.execute("DELETE FROM complaint_embeddings")
     cursor.execute("DELETE FROM complaints")
     cursor.execute("DELETE FROM clusters")
     try:
@@ -282,8 +321,105 @@ def truncate_db():
         pass
     # Reset sequences
     cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('complaints', 'clusters')")
+    snapshots.bump(cursor)
     db.commit()
     db.close()
+    reset_ward_indexes()
+
+def _store_complaint_embeddings(cursor, complaint_ids, vectors):
+    vectors = np.asarray(vectors, dtype=np.float16)
+    cursor.executemany(
+        "INSERT OR REPLACE INTO complaint_embeddings (complaint_id, model, embedding) VALUES (?, ?, ?)",
+        [(cid, MODEL_NAME, vec.tobytes()) for cid, vec in zip(complaint_ids, vectors)]
+    )
+
+def load_complaint_embeddings(complaint_ids=None, model=MODEL_NAME):
+    """
+    Returns (ids, matrix): int64 complaint ids in ascending order and an
+    (n, EMBEDDING_DIM) float32 matrix, built from one joined buffer rather
+    than unpacking each row. complaint_ids restricts the load to those ids.
+    """
+    db = get_db()
+    sql = "SELECT complaint_id, embedding FROM complaint_embeddings WHERE model = ?"
+    if complaint_ids is None:
+        rows = db.execute(sql + " ORDER BY complaint_id", (model,)).fetchall()
+    else:
+        complaint_ids = sorted(set(complaint_ids))
+        rows = []
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(complaint_ids), 500):
+            chunk = complaint_ids[start:start + 500]
+            rows += db.execute(sql + f" AND complaint_id IN ({','.join('?' * len(chunk))}) ORDER BY complaint_id",
+                               [model] + chunk).fetchall()
+    db.close()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, embeddings.EMBEDDING_DIM), dtype=np.float32)
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    matrix = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float16).reshape(len(rows), -1)
+    return ids, matrix.astype(np.float32)
+
+def backfill_complaint_embeddings(batch_size=256):
+    """Encodes and stores complaints that have no embedding for the current model. Returns the count."""
+    db = get_db()
+    cursor = db.cursor()
+    rows = cursor.execute("""
+        SELECT c.id, c.raw_description FROM complaints c
+        LEFT JOIN complaint_embeddings e ON e.complaint_id = c.id AND e.model = ?
+        WHERE e.complaint_id IS NULL AND c.raw_description IS NOT NULL
+        ORDER BY c.id
+    """, (MODEL_NAME,)).fetchall()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        vectors = embeddings.encode_many([r['raw_description'] for r in batch], batch_size=batch_size)
+        _store_complaint_embeddings(cursor, [r['id'] for r in batch], vectors)
+        if start + batch_size >= len(rows):
+            snapshots.bump(cursor) # once, with the final batch
+        db.commit()
+    db.close()
+    return len(rows)
+
+def recentroid_clusters():
+    """
+    Rebuilds every cluster's centroid and member_count from its complaints'
+    stored embeddings. For clusters created before running means, or after
+    out-of-band edits. Complaints without a stored embedding are encoded first.
+    """
+    backfill_complaint_embeddings()
+    complaint_ids, vectors = load_complaint_embeddings()
+    db = get_db()
+    cursor = db.cursor()
+    members = dict(cursor.execute("SELECT id, cluster_id FROM complaints WHERE cluster_id IS NOT NULL").fetchall())
+    keep = np.array([int(cid) in members for cid in complaint_ids], dtype=bool)
+    if not keep.any():
+        db.close()
+        return 0
+    vectors = vectors[keep]
+    cluster_ids, slots = np.unique([members[int(cid)] for cid in complaint_ids[keep]], return_inverse=True)
+    sums = np.zeros((len(cluster_ids), vectors.shape[1]), dtype=np.float32)
+    np.add.at(sums, slots, vectors)
+    counts = np.bincount(slots)
+    centroids = sums / counts[:, None]
+
+    have_vector = {r[0] for r in cursor.execute("SELECT cluster_id FROM vec_clusters")}
+    for cluster_id, centroid, count in zip(cluster_ids.tolist(), centroids, counts.tolist()):
+        sql = ("UPDATE vec_clusters SET embedding = ? WHERE cluster_id = ?" if cluster_id in have_vector
+               else "INSERT INTO vec_clusters (embedding, cluster_id) VALUES (?, ?)")
+        cursor.execute(sql, (centroid.astype(np.float32).tobytes(), cluster_id))
+        cursor.execute("UPDATE clusters SET member_count = ? WHERE id = ?", (count, cluster_id))
+    snapshots.bump(cursor)
+    db.commit()
+    db.close()
+    reset_ward_indexes()
+    return len(cluster_ids)
+
+def get_open_clusters():
+    return snapshots.cached(DB_PATH, "clusters", _load_open_clusters)
+
+def _load_open_clusters():
+    db = get_db()
+    rows = db.execute("SELECT * FROM clusters WHERE status = 'open' ORDER BY weight DESC").fetchall()
+    db.close()
+    return [dict(r) for r in rows]
 
 def get_recent_complaints(limit=5):
     db = get_db()
@@ -298,5 +434,10 @@ def get_recent_complaints(limit=5):
     return [dict(r) for r in rows]
 
 if __name__ == "__main__":
+    import sys
     init_db()
     print("Database initialized.")
+    if "--backfill-embeddings" in sys.argv:
+        print(f"Stored embeddings for {backfill_complaint_embeddings()} complaints.")
+    if "--recentroid" in sys.argv:
+        print(f"Re-centroided {recentroid_clusters()} clusters. Restart the server to reload them.")
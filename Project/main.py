@@ -1,33 +1,115 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 from contextlib import asynccontextmanager
 import os
+import time
 import asyncio
+import datetime
 import commitment_engine
 import issue_engine
 import digest_engine
 import rag_engine
+import embeddings
+import database
+import snapshots
+import events
 import ai
 
 async def auto_escalate_task():
     while True:
         try:
             print("Auto-escalating items...")
-            commitment_engine.escalate()
+            # No-op unless the date rolled over or items changed since the last pass
+            commitment_engine.ensure_escalated()
         except Exception as e:
             print(f"Auto-escalation error: {e}")
         await asyncio.sleep(3600) # Run every hour
 
+# Autonomous-mode suggestions are regenerated in the background once writes
+# settle, so opening the Suggestions page only reads suggestion_snapshots.
+BRIEFING_DEBOUNCE_SECONDS = 20   # quiet period after the last write
+BRIEFING_MAX_DELAY_SECONDS = 300 # regenerate anyway under a steady stream of writes
+BRIEFING_POLL_SECONDS = 60       # catches writes from other processes and date rollover
+BRIEFING_RETRY_SECONDS = 60      # first wait after a failed run, doubled per repeat failure
+BRIEFING_RETRY_MAX_SECONDS = 3600
+
+_briefing = {"pending": False, "task": None, "failure": None}  # failure: {version, at, delay, result}
+_briefing_lock = asyncio.Lock()
+
+def _briefing_backing_off(version):
+    """True while the last run failed for this same version and its retry delay has not passed."""
+    failure = _briefing["failure"]
+    return bool(failure and failure["version"] == version
+                and time.monotonic() < failure["at"] + failure["delay"])
+
+async def regenerate_briefing():
+    """Runs the agent in autonomous mode and stores the result, unless the latest snapshot is current."""
+    async with _briefing_lock:
+        await run_in_threadpool(commitment_engine.ensure_escalated)
+        version = await run_in_threadpool(_suggestion_version)
+        latest = await run_in_threadpool(rag_engine.latest_suggestion_snapshot)
+        if latest and latest["version"] == version:
+            return latest
+        if _briefing_backing_off(version):
+            return _briefing["failure"]["result"]
+        result = await rag_engine.memoized_suggestions(version, _load_suggestion_inputs, allow_stale=False)
+        if not result.get("suggestions"):
+            # Failed run (no provider, model error): nothing is stored, and this
+            # version is not retried until its delay passes or the data moves
+            failure = _briefing["failure"]
+            delay = (min(failure["delay"] * 2, BRIEFING_RETRY_MAX_SECONDS)
+                     if failure and failure["version"] == version else BRIEFING_RETRY_SECONDS)
+            _briefing["failure"] = {"version": version, "at": time.monotonic(), "delay": delay, "result": result}
+            return result
+        _briefing["failure"] = None
+        await run_in_threadpool(rag_engine.save_suggestion_snapshot, version, result)
+        return await run_in_threadpool(rag_engine.latest_suggestion_snapshot)
+
+async def suggestion_briefing_task():
+    queue = events.subscribe()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(queue.get(), BRIEFING_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                version = await run_in_threadpool(_suggestion_version)
+                latest = await run_in_threadpool(rag_engine.latest_suggestion_snapshot)
+                if (latest and latest["version"] == version) or _briefing_backing_off(version):
+                    continue
+                # Debounce: wait for a quiet spell so a burst of writes costs one run
+                _briefing["pending"] = True
+                started = loop.time()
+                while loop.time() - started < BRIEFING_MAX_DELAY_SECONDS:
+                    try:
+                        await asyncio.wait_for(queue.get(), BRIEFING_DEBOUNCE_SECONDS)
+                    except asyncio.TimeoutError:
+                        break
+                await regenerate_briefing()
+            except Exception as e:
+                print(f"Suggestion briefing error: {e}")
+            finally:
+                _briefing["pending"] = False
+    finally:
+        events.unsubscribe(queue)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     commitment_engine.init_db()
     issue_engine.init_db()
     rag_engine.init_db()
     asyncio.create_task(auto_escalate_task())
+    asyncio.create_task(suggestion_briefing_task())
     yield
+    await ai.aclose()
+    database.close_all()
 
 app = FastAPI(title="Co-Pilot API", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
@@ -65,76 +147,211 @@ class ChatRequest(BaseModel):
     working_memory: list = []
     strategic_context: Optional[str] = None
     history: List[dict] = [] # List of {role: "user"/"ai", content: "..."}
+    stream: bool = False # true: answer as text/event-stream (meta, token..., done)
+
+def _etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches
+    return "*" in candidates or tag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+def _conditional(request: Request, paths, fn, *args, **kwargs):
+    """
+    Serves fn(*args, **kwargs) as JSON with a strong ETag derived from the
+    data_version of `paths`, today's date and the request URL. A matching
+    If-None-Match gets an empty 304 without running fn at all.
+    """
+    # Version is read before fn runs: a write landing in between yields a body
+    # newer than its tag, which only costs the client one extra full response.
+    tag = snapshots.etag(paths, str(request.url.path) + "?" + str(request.url.query))
+    headers = {"Cache-Control": "no-cache"}
+    if tag:
+        headers["ETag"] = tag
+        if _etag_matches(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(fn(*args, **kwargs)), headers=headers)
+
+async def _load_live_context():
+    """Profile, digest, todo and open clusters for the LLM paths, read side by side on the threadpool."""
+    await run_in_threadpool(commitment_engine.ensure_escalated)
+    return await asyncio.gather(
+        run_in_threadpool(commitment_engine.get_profile),
+        run_in_threadpool(digest_engine.get_digest, escalate=False),
+        run_in_threadpool(commitment_engine.get_todo_list, escalate=False),
+        run_in_threadpool(issue_engine.get_open_clusters),
+    )
 
 # API Endpoints
+INSTANT_PROMPT = "You are Co-Pilot. Answer the user's greeting or general question warmly. Query: {query}"
+
+async def _route_chat(req: ChatRequest):
+    """
+    Returns (route, chat kwargs). The kwargs are None for the instant route,
+    otherwise what rag_engine.chat_async / chat_stream need for this route.
+    """
+    # Working memory from request (if any)
+    recent_embeddings = req.working_memory
+    # Encoded once here, reused by the router and the retriever
+    query_embedding = rag_engine.QueryEmbedding(req.query)
+
+    # 1. Routing: Instant, Follow-up, or Search
+    route = await run_in_threadpool(rag_engine.needs_context, req.query, recent_embeddings, query_embedding)
+    if route == "instant":
+        return route, None
+
+    kwargs = {
+        "query": req.query,
+        "strategic_context": req.strategic_context,
+        "history": req.history,
+        "query_embedding": query_embedding
+    }
+    if route == "follow-up":
+        # Just call Gemini directly with history (no new search)
+        # We skip the heavy retrieval because the context is already "in chat"
+        kwargs["profile"] = await run_in_threadpool(commitment_engine.get_profile)
+        return route, kwargs
+
+    # 2. Full RAG Flow (NEW_DATA_QUERY)
+    profile, digest, todo, cluster_list = await _load_live_context()
+    kwargs.update(profile=profile, digest=digest, top_items=todo["meeting_items"], clusters=cluster_list)
+    return route, kwargs
+
 @app.post("/api/chat")
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
+    # Async so the LLM wait (ai.call_ai_async) holds no threadpool worker;
+    # embedding and SQLite work is still pushed to the threadpool.
+    if req.stream:
+        return StreamingResponse(_chat_events(req), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     try:
-        # Working memory from request (if any)
-        recent_embeddings = req.working_memory
-
-        # 1. Routing: Instant, Follow-up, or Search
-        route = rag_engine.needs_context(req.query, recent_embeddings)
+        route, kwargs = await _route_chat(req)
 
         if route == "instant":
-            res_text = ai.call_ai(f"You are Co-Pilot. Answer the user's greeting or general question warmly. Query: {req.query}")
+            res_text = await ai.call_ai_async(INSTANT_PROMPT.format(query=req.query))
             return {"response": res_text, "sources": [], "routed": "instant"}
 
-        if route == "follow-up":
-            # Just call Gemini directly with history (no new search)
-            # We skip the heavy retrieval because the context is already "in chat"
-            res_data = rag_engine.chat(
-                query=req.query,
-                profile=commitment_engine.get_profile(),
-                strategic_context=req.strategic_context,
-                history=req.history
-            )
-            res_data["routed"] = "follow-up"
-            return res_data
-
-        # 2. Full RAG Flow (NEW_DATA_QUERY)
-        profile = commitment_engine.get_profile()
-        digest = digest_engine.get_digest()
-        todo = commitment_engine.get_todo_list()
-
-        db = issue_engine.get_db()
-        clusters = db.execute("SELECT * FROM clusters WHERE status = 'open' ORDER BY weight DESC").fetchall()
-        db.close()
-        cluster_list = [dict(c) for c in clusters]
-
-        res_data = rag_engine.chat(
-            query=req.query,
-            profile=profile,
-            digest=digest,
-            top_items=todo["meeting_items"],
-            clusters=cluster_list,
-            strategic_context=req.strategic_context,
-            history=req.history
-        )
-
-        # 3. Post-Process: AI Self-Memory
-        import re
-        mem_match = re.search(r"\[MEMORY:\s*(.*?)\](.*?)\[/MEMORY\]", res_data["response"], re.DOTALL)
-        if mem_match:
-            topic = mem_match.group(1).strip()
-            content = mem_match.group(2).strip()
-            rag_engine.store_memory(topic, content)
-            # Remove tag from user-facing response
-            res_data["response"] = re.sub(r"\[MEMORY:.*?/MEMORY\]", "", res_data["response"], flags=re.DOTALL).strip()
-            res_data["memory_stored"] = True
+        res_data = await rag_engine.chat_async(**kwargs)
+        res_data["routed"] = route
+
+        # 3. Post-Process: AI Self-Memory, same tag handling as the streaming path
+        tags = rag_engine.MemoryTagFilter()
+        res_data["response"] = (tags.feed(res_data["response"]) + tags.finish()).strip()
+        for topic, content in tags.memories:
+            await run_in_threadpool(rag_engine.store_memory, topic, content)
+        res_data["memory_stored"] = bool(tags.memories)
 
         return res_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event_type, data):
+    return events.format_sse({"id": None, "type": event_type, "data": data})
+
+async def _chat_events(req: ChatRequest):
+    """
+    SSE body for {"stream": true} chat: meta (routed, sources, working_memory),
+    then token events as the model writes, then done with the full response.
+    Memory tags are stripped on the fly and stored once the stream completes.
+    """
+    try:
+        route, kwargs = await _route_chat(req)
+
+        if route == "instant":
+            # No working_memory key: the instant route keeps the client's memory as-is
+            yield _sse("meta", {"routed": route, "sources": []})
+            parts = []
+            async for text in ai.stream_ai_async(INSTANT_PROMPT.format(query=req.query)):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            yield _sse("done", {"response": "".join(parts).strip(), "memory_stored": False})
+            return
+
+        async for kind, data in rag_engine.chat_stream(**kwargs):
+            if kind == "meta":
+                yield _sse("meta", dict(data, routed=route))
+            elif kind == "token":
+                yield _sse("token", {"text": data})
+            else:
+                for topic, content in data["memories"]:
+                    await run_in_threadpool(rag_engine.store_memory, topic, content)
+                yield _sse("done", {"response": data["response"], "memory_stored": bool(data["memories"])})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
 # Existing API Endpoints
 @app.get("/api/digest")
-def get_digest():
-    return digest_engine.get_digest()
+def get_digest(request: Request):
+    # Escalate first so a due pass bumps the version before the tag is taken
+    commitment_engine.ensure_escalated()
+    return _conditional(request, [digest_engine.DB_PATH], digest_engine.get_digest, escalate=False)
+
+@app.get("/api/dashboard")
+async def get_dashboard(request: Request):
+    """
+    Everything the Home page needs in one round trip. Escalation runs once up
+    front; the five independent reads then run side by side on the threadpool,
+    each on its worker's pooled connection.
+    """
+    await run_in_threadpool(commitment_engine.ensure_escalated)
+    paths = [commitment_engine.DB_PATH, digest_engine.DB_PATH, issue_engine.DB_PATH]
+    tag = await run_in_threadpool(snapshots.etag, paths, str(request.url.path))
+    headers = {"Cache-Control": "no-cache", "ETag": tag} if tag else {"Cache-Control": "no-cache"}
+    if tag and _etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    parts = {
+        "stats": commitment_engine.get_stats,
+        "digest": lambda: digest_engine.get_digest(escalate=False),
+        "clusters": issue_engine.get_open_clusters,
+        "profile": commitment_engine.get_profile,
+        "todo": lambda: commitment_engine.get_todo_list(escalate=False),
+    }
+    results = await asyncio.gather(*(run_in_threadpool(fn) for fn in parts.values()))
+    return JSONResponse(jsonable_encoder(dict(zip(parts, results))), headers=headers)
+
+@app.get("/api/events")
+async def event_stream(request: Request):
+    """
+    Server-sent change feed: item_added / item_updated / item_extended /
+    item_completed, cluster_updated, escalation_finished, and resync when the
+    client should refetch instead of patching.
+    """
+    last_event_id = request.headers.get("last-event-id")
+
+    async def stream():
+        # Subscribed inside the generator: if the response never starts, nothing is left registered
+        queue = events.subscribe(last_event_id)
+        try:
+            version = await run_in_threadpool(snapshots.current_version, commitment_engine.DB_PATH)
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=events.HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Writes made by another worker or by seed.py never reach this
+                    # process's feed, but they still move the shared data_version.
+                    current = await run_in_threadpool(snapshots.current_version, commitment_engine.DB_PATH)
+                    if current != version:
+                        version = current
+                        yield events.format_sse({"id": None, "type": "resync", "data": {"reason": "external"}})
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+                version = await run_in_threadpool(snapshots.current_version, commitment_engine.DB_PATH)
+        finally:
+            events.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/todo")
-def get_todo(type: Optional[str] = None, urgency: Optional[str] = None, ward: Optional[str] = None):
-    return commitment_engine.get_todo_list(type=type, urgency=urgency, ward=ward)
+def get_todo(request: Request, type: Optional[str] = None, urgency: Optional[str] = None, ward: Optional[str] = None):
+    commitment_engine.ensure_escalated()
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_todo_list,
+                        type=type, urgency=urgency, ward=ward, escalate=False)
 
 @app.post("/api/item")
 def add_item(item: ItemCreate):
@@ -161,19 +378,20 @@ def log_complaint(data: ComplaintCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/issues/clusters")
-def get_clusters():
+def get_clusters(request: Request):
     try:
-        db = issue_engine.get_db()
-        rows = db.execute("SELECT * FROM clusters WHERE status = 'open' ORDER BY weight DESC").fetchall()
-        db.close()
-        return [dict(r) for r in rows]
+        return _conditional(request, [issue_engine.DB_PATH], issue_engine.get_open_clusters)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/escalate")
 def run_escalate():
-    commitment_engine.escalate()
-    return {"status": "done"}
+    changed = commitment_engine.escalate()
+    return {"status": "done", "changed": changed}
+
+@app.get("/api/escalation/next")
+def get_escalation_schedule(limit: int = 10):
+    return commitment_engine.get_escalation_schedule(limit=limit)
 
 @app.post("/api/item/{item_id}/complete")
 def complete_item(item_id: int, req: CompletionRequest):
@@ -190,13 +408,13 @@ def extend_item(item_id: int, req: ExtendRequest):
     return {"status": "extended"}
 
 @app.get("/api/history")
-def get_history(limit: int = 50, offset: int = 0):
-    return commitment_engine.get_history(limit=limit, offset=offset)
+def get_history(request: Request, limit: int = 50, offset: int = 0):
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_history, limit=limit, offset=offset)
 
 @app.get("/api/profile")
-def get_profile():
+def get_profile(request: Request):
     print("DEBUG: Hit GET /api/profile")
-    return commitment_engine.get_profile()
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_profile)
 
 @app.post("/api/profile")
 def update_profile(data: dict):
@@ -205,16 +423,28 @@ def update_profile(data: dict):
     return {"status": "updated" if success else "failed"}
 
 @app.get("/api/meetings/recent")
-def get_recent_meetings():
-    return commitment_engine.get_recent_meetings()
+def get_recent_meetings(request: Request):
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_recent_meetings)
 
 @app.get("/api/complaints/recent")
-def get_recent_complaints():
-    return issue_engine.get_recent_complaints()
+def get_recent_complaints(request: Request):
+    return _conditional(request, [issue_engine.DB_PATH], issue_engine.get_recent_complaints)
 
 @app.get("/api/stats")
-def get_stats():
-    return commitment_engine.get_stats()
+def get_stats(request: Request):
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_stats)
+
+@app.get("/api/system/embeddings")
+def get_embedding_usage():
+    return embeddings.memory_usage()
+
+@app.get("/api/system/ai")
+def get_ai_status():
+    return {
+        "provider": ai.provider_name,
+        "max_concurrent_calls": ai.MAX_CONCURRENT_CALLS,
+        "cache": ai.cache_stats()
+    }
 
 @app.post("/api/upload/meeting")
 async def upload_meeting(
@@ -230,8 +460,8 @@ async def upload_meeting(
     content = await file.read()
     text = content.decode("utf-8")
 
-    # Process transcript
-    count = commitment_engine.batch_extract_from_transcript(text, meeting_date, file.filename)
+    # Process transcript (blocking LLM + SQLite work, so off the event loop)
+    count = await run_in_threadpool(commitment_engine.batch_extract_from_transcript, text, meeting_date, file.filename)
 
     return {"status": "success", "extracted_count": count, "filename": file.filename}
 
@@ -247,41 +477,67 @@ async def upload_context(
     content = await file.read()
     text = content.decode("utf-8")
 
-    commitment_engine.add_context_file(file.filename, label, category, text)
+    await run_in_threadpool(commitment_engine.add_context_file, file.filename, label, category, text)
 
     return {"status": "success", "filename": file.filename}
 
 @app.get("/api/context/files")
-def get_context_files():
-    return commitment_engine.get_context_files()
+def get_context_files(request: Request):
+    return _conditional(request, [commitment_engine.DB_PATH], commitment_engine.get_context_files)
 
 class SuggestionsRequest(BaseModel):
     query: Optional[str] = None
     history: Optional[List[dict]] = None
+    # Return the last result at once while a refresh runs in the background
+    allow_stale: bool = True
+
+def _suggestion_version():
+    """
+    Everything the suggestion agent reads: engine data, learned memories and
+    the date (for overdue). A list, so it compares equal to the copy stored
+    as JSON in suggestion_snapshots and the memo and briefing share one key.
+    """
+    return [snapshots.current_version(commitment_engine.DB_PATH),
+            snapshots.current_version(issue_engine.DB_PATH),
+            rag_engine.memory_version(),
+            datetime.date.today().isoformat()]
+
+async def _load_suggestion_inputs():
+    profile, digest, todo, cluster_list = await _load_live_context()
+    return dict(profile=profile, digest=digest, clusters=cluster_list,
+                top_items=todo["meeting_items"] + todo["issue_items"])
 
 @app.post("/api/suggestions")
-def get_suggestions(req: Optional[SuggestionsRequest] = None):
+async def get_suggestions(req: Optional[SuggestionsRequest] = None):
     try:
         query = req.query if req else None
         history = req.history if req else None
-        profile = commitment_engine.get_profile()
-        digest = digest_engine.get_digest()
-        db = issue_engine.get_db()
-        clusters = db.execute("SELECT * FROM clusters WHERE status = 'open' ORDER BY weight DESC").fetchall()
-        db.close()
-        cluster_list = [dict(c) for c in clusters]
-
-        todo = commitment_engine.get_todo_list()
-        top_items = todo["meeting_items"] + todo["issue_items"]
-
-        return rag_engine.generate_suggestions(
-            profile=profile,
-            digest=digest,
-            clusters=cluster_list,
-            top_items=top_items,
-            user_query=query,
-            history=history
-        )
+        allow_stale = req.allow_stale if req else True
+
+        if not query and not history and allow_stale:
+            # Autonomous mode reads the precomputed briefing
+            latest = await run_in_threadpool(rag_engine.latest_suggestion_snapshot)
+            if latest is None:
+                latest = await regenerate_briefing()
+                if "version" not in latest:
+                    return latest
+            version = await run_in_threadpool(_suggestion_version)
+            stale = latest.pop("version") != version
+            retrying = stale and not _briefing_backing_off(version)
+            if retrying and not _briefing["pending"] and not _briefing_lock.locked():
+                # No write event reached this process (external writer, new day)
+                _briefing["task"] = asyncio.create_task(regenerate_briefing())
+            latest["snapshot"] = {
+                "generated_at": latest.pop("created_at"),
+                "stale": stale,
+                "regenerating": retrying or _briefing_lock.locked()
+            }
+            return latest
+
+        # Escalation first so the version below already includes its writes
+        await run_in_threadpool(commitment_engine.ensure_escalated)
+        version = await run_in_threadpool(_suggestion_version)
+        return await rag_engine.memoized_suggestions(version, _load_suggestion_inputs, query, history, allow_stale)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -4,36 +4,55 @@ try:
     from pysqlite3 import dbapi2 as sqlite3
 except ImportError:
     import sqlite3
+import re
 import struct
 import datetime
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
-import google.genai as genai
-from sentence_transformers import SentenceTransformer
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
 import ai
-import ai
+import database
+import embeddings
+import vector_index
 
 # Load environment variables
 load_dotenv()
-api_key = os.environ.get("GEMINI_API_KEY")
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "copilot.db")
-MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_NAME = embeddings.MODEL_NAME
 THRESHOLD = 0.35 # Cosine similarity threshold
 
-# Load model lazily
-_model = None
 def get_model():
-    global _model
-    if _model is None:
-        print(f"Loading SentenceTransformer model {MODEL_NAME}...")
-        _model = SentenceTransformer(MODEL_NAME)
-    return _model
+    # Shared process-wide instance, see embeddings.py
+    return embeddings.get_model()
+
+class QueryEmbedding:
+    """
+    Embeddings of one chat query, carried from the router to the retriever.
+    The router works on the lowercased query and retrieval on the raw one;
+    each distinct form is encoded at most once per request, and only once
+    in total when the tokenizer lowercases anyway.
+    """
+    def __init__(self, text):
+        self.text = text
+        self._vectors = {}
+
+    def _get(self, text):
+        key = text.lower() if embeddings.lowercases_input() else text
+        if key not in self._vectors:
+            self._vectors[key] = embeddings.encode(text)
+        return self._vectors[key]
+
+    def raw(self):
+        return self._get(self.text)
 
-def get_client():
-    if api_key:
-        return genai.Client(api_key=api_key)
-    return None
+    def lowered(self):
+        return self._get(self.text.lower())
 
 _intent_vectors = None
 
@@ -42,26 +61,27 @@ def get_intent_vectors():
     if _intent_vectors is not None:
         return _intent_vectors
     
-    model = get_model()
     # Pre-calculated centroids for "Small Talk" intents
     greetings = ["hi", "hello", "hey", "greetings", "namaste", "good morning", "good evening", "who are you", "what can you do"]
     thanks = ["thanks", "thank you", "much appreciated", "great", "awesome", "nice", "perfect"]
     
     _intent_vectors = {
-        "small_talk": model.encode(greetings).mean(axis=0),
-        "thanks": model.encode(thanks).mean(axis=0)
+        "small_talk": embeddings.encode_many(greetings).mean(axis=0),
+        "thanks": embeddings.encode_many(thanks).mean(axis=0)
     }
     return _intent_vectors
 
-def needs_context(query, recent_node_embeddings=None):
+def needs_context(query, recent_node_embeddings=None, query_embedding=None):
     """
     Local Semantic Router: Detects Small Talk and Contextual Follow-ups.
     Zero tokens, Zero latency.
+    Pass the request's QueryEmbedding so retrieval can reuse the vector.
     """
-    model = get_model()
     iv = get_intent_vectors()
     
-    q_vec = model.encode([query.lower()])[0]
+    if query_embedding is None:
+        query_embedding = QueryEmbedding(query)
+    q_vec = query_embedding.lowered()
     
     def cosine_sim(a, b):
         # Handle cases where b might be None or empty
@@ -92,21 +112,54 @@ def store_memory(topic, content):
     db.commit()
     db.close()
 
+MEMORY_OPEN = "[MEMORY:"
+MEMORY_CLOSE = "[/MEMORY]"
+
+class MemoryTagFilter:
+    """
+    Removes [MEMORY: topic] fact [/MEMORY] blocks from a streamed response.
+    feed() returns the text that is safe to show so far; anything that could
+    still turn out to be part of a tag is held back until it resolves.
+    The blocks found are collected in .memories as (topic, content).
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.memories = []
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        out = ""
+        while True:
+            start = self.buffer.find(MEMORY_OPEN)
+            if start < 0:
+                # Hold back a trailing partial "[MEMO" in case the next chunk completes it
+                keep = 0
+                for n in range(min(len(MEMORY_OPEN) - 1, len(self.buffer)), 0, -1):
+                    if MEMORY_OPEN.startswith(self.buffer[-n:]):
+                        keep = n
+                        break
+                out += self.buffer[:len(self.buffer) - keep]
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                return out
+            end = self.buffer.find(MEMORY_CLOSE, start)
+            if end < 0:
+                out += self.buffer[:start]
+                self.buffer = self.buffer[start:]
+                return out
+            match = re.match(r"\[MEMORY:\s*(.*?)\](.*)", self.buffer[start:end], re.DOTALL)
+            if match:
+                self.memories.append((match.group(1).strip(), match.group(2).strip()))
+            out += self.buffer[:start]
+            self.buffer = self.buffer[end + len(MEMORY_CLOSE):]
+
+    def finish(self):
+        # An unterminated tag is not a memory; show it as-is, like the non-streaming path
+        out, self.buffer = self.buffer, ""
+        return out
+
 def get_db():
-    db = sqlite3.connect(DB_PATH)
-    try:
-        import sqlite_vec
-        db.enable_load_extension(True)
-        sqlite_vec.load(db)
-    except (AttributeError, sqlite3.OperationalError, ImportError):
-        pass
-    finally:
-        try:
-            db.enable_load_extension(False)
-        except Exception:
-            pass
-    db.row_factory = sqlite3.Row
-    return db
+    # Pooled per-thread connection with sqlite-vec already loaded, see database.py
+    return database.connect(DB_PATH)
 
 def serialize_f32(vector):
     return struct.pack(f"{len(vector)}f", *vector)
@@ -153,12 +206,33 @@ def init_db():
         created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+
+    # Bumped by truncate_db(): ids restart at 1 afterwards, so the id range alone
+    # cannot tell the in-memory index (or its saved copy) that it is stale
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS knowledge_version (
+        id          INTEGER PRIMARY KEY CHECK (id = 1),
+        generation  INTEGER DEFAULT 0
+    )
+    """)
+    db.execute("INSERT OR IGNORE INTO knowledge_version (id) VALUES (1)")
+
+    # Precomputed autonomous-mode briefings, newest last (see main.suggestion_briefing_task)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS suggestion_snapshots (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        version         TEXT,       -- data version the briefing was computed from
+        suggestions     TEXT,       -- JSON list
+        thinking_trace  TEXT,       -- JSON list
+        context_summary TEXT,
+        created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
     db.commit()
     db.close()
 
 def store_node(domain, ward, topic, title, content, source_ref):
-    model = get_model()
-    embedding = model.encode(content)
+    embedding = embeddings.encode(content)
     embedding_bytes = serialize_f32(embedding.tolist())
     
     db = get_db()
@@ -171,36 +245,193 @@ def store_node(domain, ward, topic, title, content, source_ref):
     
     node_id = cursor.lastrowid
     
+    indexed = True
     try:
         cursor.execute("INSERT INTO vec_knowledge (node_id, embedding) VALUES (?, ?)", (node_id, embedding_bytes))
     except sqlite3.OperationalError:
-        pass
+        indexed = False
         
     db.commit()
     db.close()
+
+    with _index_lock:
+        # Append only when no other row could sit in between (another process,
+        # or a query that already synced it); otherwise the next sync loads it.
+        if indexed and _index["index"] is not None and node_id == _index["max_id"] + 1:
+            _index["index"].add([node_id], [embedding], [ward], [domain])
+            _index["max_id"] = node_id
     return node_id
 
-def cosine_similarity(v1, v2):
-    import math
-    sumxx, sumyy, sumxy = 0, 0, 0
-    for x, y in zip(v1, v2):
-        sumxx += x*x
-        sumyy += y*y
-        sumxy += x*y
-    if sumxx == 0 or sumyy == 0: return 0
-    return sumxy / (math.sqrt(sumxx) * math.sqrt(sumyy))
-
-def query_nodes(query_text, limit=5, ward_filter=None):
+# In-memory index over vec_knowledge (vector_index.py). It serves queries
+# when sqlite-vec is not loaded, and for every query once the corpus reaches
+# ANN_MIN_ROWS, where it is trained as an IVF index and saved next to the
+# database so restarts skip k-means. store_node() appends to it; rows from
+# other processes are picked up by comparing MIN/MAX(id), which are
+# primary-key lookups on knowledge_nodes. A truncate (any process) bumps
+# knowledge_version.generation, which the index and its saved copy carry.
+# Training runs in a background thread (or `python rag_engine.py --train-index`),
+# never inside a query; until it finishes, queries scan the index exactly.
+ANN_MODE = os.getenv("RAG_ANN", "auto")                  # auto | exact (IVF off, verification) | off (always sqlite-vec)
+ANN_MIN_ROWS = int(os.getenv("RAG_ANN_MIN_ROWS", 20000))
+ANN_NLIST = int(os.getenv("RAG_ANN_NLIST", 0)) or None  # default sqrt(rows)
+ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", 16))        # lists scanned per query: recall vs latency
+
+_index = {"index": None, "generation": None, "min_id": 0, "max_id": 0, "trainer": None}
+_index_lock = threading.Lock()
+
+def index_path():
+    return os.path.splitext(DB_PATH)[0] + ".ann.npz"
+
+def _load_index_rows(cursor, index, after_id):
+    cursor.execute("""
+        SELECT v.node_id, v.embedding, n.ward, n.domain
+        FROM vec_knowledge v
+        JOIN knowledge_nodes n ON n.id = v.node_id
+        WHERE v.node_id > ?
+        ORDER BY v.node_id
+    """, (after_id,))
+    width = embeddings.EMBEDDING_DIM * 4
+    rows = [r for r in cursor.fetchall() if r['embedding'] and len(r['embedding']) == width]
+    if rows:
+        # One buffer for the whole batch instead of unpacking each BLOB
+        matrix = np.frombuffer(b"".join(r['embedding'] for r in rows), dtype=np.float32)
+        index.add([r['node_id'] for r in rows], matrix.reshape(len(rows), -1),
+                  [r['ward'] for r in rows], [r['domain'] for r in rows])
+
+def _node_id_range(cursor):
+    # knowledge_nodes rather than vec_knowledge: a vec0 table answers MIN/MAX with
+    # a full scan. Separate statements, as SQLite only seeks for a lone MIN() or MAX().
+    min_id = cursor.execute("SELECT MIN(id) FROM knowledge_nodes").fetchone()[0] or 0
+    max_id = cursor.execute("SELECT MAX(id) FROM knowledge_nodes").fetchone()[0] or 0
+    return min_id, max_id
+
+def _knowledge_generation(cursor):
+    try:
+        row = cursor.execute("SELECT generation FROM knowledge_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0 # Created by init_db(); nothing has been truncated before it
+    return row[0] if row else 0
+
+def knowledge_index(cursor):
+    """Returns the in-memory index, synced with vec_knowledge. Starts training in the background when due."""
+    with _index_lock:
+        # Read under the lock so a concurrent sync cannot pair this range with newer state
+        generation = _knowledge_generation(cursor)
+        min_id, max_id = _node_id_range(cursor)
+        index = _index["index"]
+        if index is None:
+            # Restart: reuse the saved index if it is a prefix of the same generation
+            saved = vector_index.VectorIndex.load(index_path(), embeddings.EMBEDDING_DIM) if os.path.exists(index_path()) else None
+            if (saved is not None and saved.size and saved.tag == generation
+                    and saved.min_id() == min_id and saved.max_id() <= max_id):
+                index = saved
+                _index.update(index=index, generation=generation, min_id=min_id, max_id=saved.max_id())
+        if index is not None and generation == _index["generation"] and min_id == _index["min_id"]:
+            # Same table. A lower MAX(id) (newest rows deleted) brings nothing new either;
+            # within a generation ids are never reused, and queries drop hits without a knowledge_nodes row.
+            if max_id > _index["max_id"]:
+                _load_index_rows(cursor, index, _index["max_id"])
+                _index["max_id"] = max_id
+        else:
+            # First use, a truncate (here or in another process) or oldest rows deleted: rebuild
+            index = vector_index.VectorIndex(embeddings.EMBEDDING_DIM)
+            index.tag = generation
+            _load_index_rows(cursor, index, 0)
+            _index.update(index=index, generation=generation, min_id=min_id, max_id=max_id)
+
+        if _needs_training(index) and _index["trainer"] is None:
+            _index["trainer"] = threading.Thread(target=train_knowledge_index, args=(index,), daemon=True)
+            _index["trainer"].start()
+        return index
+
+def _needs_training(index):
+    # Once big enough, and again whenever it has doubled since
+    return ANN_MODE == "auto" and index.size >= ANN_MIN_ROWS and index.size >= 2 * index.trained_size
+
+def train_knowledge_index(index=None):
+    """
+    Trains the IVF layer of `index` (default: the synced knowledge index) and
+    saves it next to the database. Searches and appends keep working meanwhile.
+    Returns the index.
+    """
+    if index is None:
+        # Claim the trainer slot so the sync below doesn't start a second run
+        with _index_lock:
+            if _index["trainer"] is None:
+                _index["trainer"] = threading.current_thread()
+        db = get_db()
+        index = knowledge_index(db.cursor())
+        db.close()
+    try:
+        index.train(ANN_NLIST)
+        # Written aside, then swapped in under the lock: a truncate while training
+        # made this index obsolete, and it must never reach index_path()
+        tmp = f"{index_path()}.{threading.get_ident()}"
+        index.save(tmp)
+        with _index_lock:
+            if _index["index"] is index:
+                os.replace(tmp, index_path())
+            else:
+                os.remove(tmp)
+    except OSError as e:
+        print(f"Could not save vector index: {e}")
+    finally:
+        with _index_lock:
+            if _index["trainer"] is threading.current_thread():
+                _index["trainer"] = None
+    return index
+
+def reset_knowledge_index():
+    with _index_lock:
+        _index.update(index=None, generation=None, min_id=0, max_id=0, trainer=None)
+        if os.path.exists(index_path()):
+            os.remove(index_path())
+
+def _index_query(cursor, query_embedding, limit, ward_filter, min_similarity=None, exact=False):
+    """query_nodes() through the in-memory index. [] if vec_knowledge cannot be read."""
+    try:
+        index = knowledge_index(cursor)
+    except (sqlite3.OperationalError, sqlite3.DatabaseError):
+        return [] # Table missing or corrupted
+    hits = index.search(query_embedding, limit, ward=ward_filter, min_similarity=min_similarity,
+                        nprobe=ANN_NPROBE, exact=exact or ANN_MODE == "exact")
+    if not hits:
+        return []
+    ids = [h[0] for h in hits]
+    cursor.execute(f"SELECT * FROM knowledge_nodes WHERE id IN ({','.join('?' * len(ids))})", ids)
+    meta = {r['id']: r for r in cursor.fetchall()}
+    nodes = []
+    for nid, sim, vec in hits:
+        if nid in meta:
+            node = dict(meta[nid])
+            node['similarity'] = sim
+            node['embedding'] = vec.tolist() # Unit vector; working memory only compares cosines
+            nodes.append(node)
+    return nodes
+
+def query_nodes(query_text, limit=5, ward_filter=None, query_vector=None, exact=False):
     """
     Retrieves knowledge nodes using vector similarity.
     Ensures 'embedding' is included in the node dict for working memory tracking.
+    query_vector skips encoding when the caller already has it.
+    exact=True bypasses the approximate index (for checking its recall).
     """
-    model = get_model()
-    query_embedding = model.encode(query_text)
+    query_embedding = query_vector if query_vector is not None else embeddings.encode(query_text)
     query_bytes = serialize_f32(query_embedding.tolist())
     
     db = get_db()
     cursor = db.cursor()
+
+    if ANN_MODE != "off":
+        try:
+            min_id, max_id = _node_id_range(cursor)
+        except (sqlite3.OperationalError, sqlite3.DatabaseError):
+            min_id, max_id = 0, 0
+        if max_id - min_id + 1 >= ANN_MIN_ROWS:
+            # Large corpus: the ANN index instead of sqlite-vec's full scan
+            nodes = _index_query(cursor, query_embedding, limit, ward_filter, exact=exact)
+            db.close()
+            return nodes
     
     nodes = []
     try:
@@ -232,50 +463,20 @@ def query_nodes(query_text, limit=5, ward_filter=None):
             nodes.append(node)
             
     except (sqlite3.OperationalError, sqlite3.DatabaseError) as e:
-        # 2. Fallback to in-memory cosine similarity (Robustness)
-        cursor.execute("SELECT * FROM knowledge_nodes")
-        all_meta = cursor.fetchall()
-
-        all_vecs = {}
-        try:
-            cursor.execute("SELECT node_id, embedding FROM vec_knowledge")
-            all_vecs = {r['node_id']: r['embedding'] for r in cursor.fetchall()}
-        except:
-            pass # Module missing or table corrupted
-        
-        q_vec = query_embedding.tolist()
-        results = []
-        for meta in all_meta:
-            nid = meta['id']
-            node = dict(meta)
-            node['similarity'] = 0
-            node['embedding'] = None
-
-            if nid in all_vecs and all_vecs[nid]:
-                if ward_filter and meta['ward'] and meta['ward'] != ward_filter:
-                    continue
-                v_bytes = all_vecs[nid]
-                try:
-                    v_vec = struct.unpack(f"{len(q_vec)}f", v_bytes)
-                    sim = cosine_similarity(q_vec, v_vec)
-                    if sim >= THRESHOLD:
-                        node['similarity'] = sim
-                        node['embedding'] = list(v_vec) # Store as list for working memory
-                        results.append(node)
-                except:
-                    continue
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        nodes = results[:limit]
+        # 2. Fallback to the in-memory NumPy index (Robustness)
+        nodes = _index_query(cursor, query_embedding, limit, ward_filter, min_similarity=THRESHOLD, exact=exact)
         
     db.close()
     return nodes
 
-def assemble_context(query, profile=None, digest=None, top_items=None, clusters=None):
+def assemble_context(query, profile=None, digest=None, top_items=None, clusters=None, query_embedding=None):
     """
     Assembles the 3-layer context for Gemini.
     Returns (context_string, retrieved_nodes).
     """
-    nodes = query_nodes(query, limit=5)
+    if query_embedding is None:
+        query_embedding = QueryEmbedding(query)
+    nodes = query_nodes(query, limit=5, query_vector=query_embedding.raw())
     
     l1 = "=== LAYER 1: LIVE CONSTITUENCY STATE ===\n"
     if profile:
@@ -307,9 +508,7 @@ def assemble_context(query, profile=None, digest=None, top_items=None, clusters=
             
     return l1 + l2 + l3, nodes
 
-def chat(query, profile=None, digest=None, top_items=None, clusters=None, strategic_context=None, history=None):
-    context, nodes = assemble_context(query, profile, digest, top_items, clusters)
-    
+def _chat_prompt(query, context, strategic_context=None, history=None):
     # Format history if present
     history_str = ""
     if history:
@@ -342,18 +541,59 @@ CONTEXT:
 QUESTION:
 {query}
 """
+    return prompt
+
+def _chat_result(response_text, nodes):
+    sources = [{"id": n["id"], "domain": n["domain"], "title": n["title"]} for n in nodes]
+    # Include embeddings for frontend-to-backend "Working Memory" loop
+    return {
+        "response": response_text, 
+        "sources": sources,
+        "working_memory": [n["embedding"] for n in nodes if n.get("embedding") is not None]
+    }
+
+def chat(query, profile=None, digest=None, top_items=None, clusters=None, strategic_context=None, history=None, query_embedding=None):
+    context, nodes = assemble_context(query, profile, digest, top_items, clusters, query_embedding)
+    prompt = _chat_prompt(query, context, strategic_context, history)
     try:
-        response_text = ai.call_ai(prompt)
-        sources = [{"id": n["id"], "domain": n["domain"], "title": n["title"]} for n in nodes]
-        # Include embeddings for frontend-to-backend "Working Memory" loop
-        return {
-            "response": response_text, 
-            "sources": sources,
-            "working_memory": [n["embedding"] for n in nodes if n.get("embedding") is not None]
-        }
+        return _chat_result(ai.call_ai(prompt), nodes)
+    except Exception as e:
+        return {"response": f"Chat failed: {e}", "sources": [], "working_memory": []}
+
+async def chat_async(query, profile=None, digest=None, top_items=None, clusters=None, strategic_context=None, history=None, query_embedding=None):
+    """chat() for async handlers: retrieval runs in a worker thread, the LLM call on the event loop."""
+    context, nodes = await run_in_threadpool(assemble_context, query, profile, digest, top_items, clusters, query_embedding)
+    prompt = _chat_prompt(query, context, strategic_context, history)
+    try:
+        return _chat_result(await ai.call_ai_async(prompt), nodes)
     except Exception as e:
         return {"response": f"Chat failed: {e}", "sources": [], "working_memory": []}
 
+async def chat_stream(query, profile=None, digest=None, top_items=None, clusters=None, strategic_context=None, history=None, query_embedding=None):
+    """
+    Streaming chat(). Yields ("meta", {sources, working_memory}) as soon as
+    retrieval is done, then ("token", text) per model chunk with memory tags
+    already stripped, then ("done", {response, memories}). The caller owns
+    persisting the memories.
+    """
+    context, nodes = await run_in_threadpool(assemble_context, query, profile, digest, top_items, clusters, query_embedding)
+    prompt = _chat_prompt(query, context, strategic_context, history)
+    meta = _chat_result("", nodes)
+    yield "meta", {"sources": meta["sources"], "working_memory": meta["working_memory"]}
+
+    tags = MemoryTagFilter()
+    shown = ""
+    async for chunk in ai.stream_ai_async(prompt):
+        text = tags.feed(chunk)
+        if text:
+            shown += text
+            yield "token", text
+    tail = tags.finish()
+    if tail:
+        shown += tail
+        yield "token", tail
+    yield "done", {"response": shown.strip(), "memories": tags.memories}
+
 def _execute_tool(tool_name, argument):
     db = get_db()
     try:
@@ -368,7 +608,14 @@ def _execute_tool(tool_name, argument):
                 FROM timely_items WHERE ward = ? AND status != 'completed' ORDER BY deadline ASC
             """, (argument,)).fetchall()
         elif tool_name == "get_department_track_record":
-            rows = db.execute("""
+            # Running totals from dept_scorecard first, then the latest items
+            scorecard = db.execute("""
+                SELECT department, total, completed, on_time, extensions,
+                       ROUND(days_sum / NULLIF(days_count, 0), 1) as avg_days_to_resolve
+                FROM dept_scorecard
+                WHERE department = ?
+            """, (argument,)).fetchall()
+            rows = scorecard + db.execute("""
                 SELECT title, status, deadline, completed_at, extension_count, urgency
                 FROM timely_items
                 WHERE to_whom = ?
@@ -448,8 +695,22 @@ def _build_suggestions_context(profile, digest, clusters, top_items):
         ctx += f"- {c.get('summary')} | {c.get('ward')} | Weight: {c.get('weight')} | Urgency: {c.get('urgency')}\n"
     ctx += "\n"
 
-    ctx += "=== AI MEMORY NOTES ===\n"
     db = get_db()
+    try:
+        scorecard = db.execute("""
+            SELECT department, total, completed, on_time, extensions,
+                   ROUND(days_sum / NULLIF(days_count, 0), 1) as avg_days
+            FROM dept_scorecard WHERE total > 0 ORDER BY total DESC
+        """).fetchall()
+    except sqlite3.OperationalError:
+        scorecard = []
+    if scorecard:
+        ctx += "=== DEPARTMENT SCORECARD ===\n"
+        for d in scorecard:
+            ctx += f"- {d['department']}: {d['total']} items, {d['completed']} done ({d['on_time']} on time), avg {d['avg_days'] or 0} days to resolve, {d['extensions']} extensions\n"
+        ctx += "\n"
+
+    ctx += "=== AI MEMORY NOTES ===\n"
     memories = db.execute("SELECT topic, content, created_at FROM ai_memory ORDER BY created_at DESC").fetchall()
     db.close()
     for m in memories:
@@ -457,9 +718,13 @@ def _build_suggestions_context(profile, digest, clusters, top_items):
 
     return ctx
 
-def run_suggestion_agent(profile=None, digest=None, clusters=None, top_items=None, user_query=None, history=None):
-    client = get_client()
-    if not client:
+async def run_suggestion_agent_async(profile=None, digest=None, clusters=None, top_items=None, user_query=None, history=None):
+    """
+    Up to three LLM rounds with tool calls in between. The model calls go
+    through ai.call_ai_async; context building and tools hit SQLite, so they
+    run in worker threads.
+    """
+    if not ai.is_available():
         return {
             "suggestions": [],
             "thinking_trace": [{"round": 1, "type": "error", "content": "API Key missing", "timestamp": datetime.datetime.now().isoformat()}],
@@ -467,7 +732,7 @@ def run_suggestion_agent(profile=None, digest=None, clusters=None, top_items=Non
             "tools_called": []
         }
 
-    always_on_context = _build_suggestions_context(profile, digest, clusters, top_items)
+    always_on_context = await run_in_threadpool(_build_suggestions_context, profile, digest, clusters, top_items)
     
     inquiry_block = ""
     if user_query:
@@ -520,7 +785,7 @@ THINKING: [strategic highlights and pattern discovery]
 
     current_round = 1
     try:
-        r1_response = ai.call_ai(round_1_prompt)
+        r1_response = await ai.call_ai_async(round_1_prompt, site="suggestions")
         thinking_trace.append({"round": 1, "type": "analysis", "content": r1_response, "timestamp": datetime.datetime.now().isoformat()})
 
         if "TOOL_CALL:" in r1_response:
@@ -531,7 +796,7 @@ THINKING: [strategic highlights and pattern discovery]
 
             thinking_trace.append({"round": 1, "type": "tool_call", "content": f"Fetching {tool_name} for {argument}...", "tool": tool_name, "args": argument, "timestamp": datetime.datetime.now().isoformat()})
 
-            tool_result = _execute_tool(tool_name, argument)
+            tool_result = await run_in_threadpool(_execute_tool, tool_name, argument)
             all_tool_results.append(f"TOOL RESULT ({tool_name} | {argument}):\n{tool_result}")
             tools_called.append(tool_name)
             thinking_trace.append({"round": 2, "type": "tool_result", "content": tool_result, "timestamp": datetime.datetime.now().isoformat()})
@@ -549,7 +814,7 @@ CURRENT DATA:
 You may call one more tool if needed, or proceed.
 Respond with TOOL_CALL or READY as before.
 """
-            r2_response = ai.call_ai(round_2_prompt)
+            r2_response = await ai.call_ai_async(round_2_prompt, site="suggestions")
             thinking_trace.append({"round": 2, "type": "analysis", "content": r2_response, "timestamp": datetime.datetime.now().isoformat()})
             current_round = 2
 
@@ -560,7 +825,7 @@ Respond with TOOL_CALL or READY as before.
 
                 thinking_trace.append({"round": 2, "type": "tool_call", "content": f"Fetching {tool_name} for {argument}...", "tool": tool_name, "args": argument, "timestamp": datetime.datetime.now().isoformat()})
 
-                tool_result = _execute_tool(tool_name, argument)
+                tool_result = await run_in_threadpool(_execute_tool, tool_name, argument)
                 all_tool_results.append(f"TOOL RESULT ({tool_name} | {argument}):\n{tool_result}")
                 tools_called.append(tool_name)
                 thinking_trace.append({"round": 3, "type": "tool_result", "content": tool_result, "timestamp": datetime.datetime.now().isoformat()})
@@ -598,7 +863,7 @@ CRITICAL RULES:
 Return a JSON array only. No markdown.
 Each object: {{ "priority": "...", "title": "...", "body": "..." }}
 """
-        final_response = ai.call_ai(final_prompt)
+        final_response = await ai.call_ai_async(final_prompt, site="suggestions")
 
         if "```json" in final_response:
             final_response = final_response.split("```json")[1].split("```")[0].strip()
@@ -624,9 +889,141 @@ Each object: {{ "priority": "...", "title": "...", "body": "..." }}
             "tools_called": tools_called
         }
 
+def run_suggestion_agent(profile=None, digest=None, clusters=None, top_items=None, user_query=None, history=None):
+    # Blocking entry point for scripts; must not be called from a running event loop
+    return asyncio.run(run_suggestion_agent_async(profile, digest, clusters, top_items, user_query, history))
+
 def generate_suggestions(profile=None, digest=None, clusters=None, top_items=None, user_query=None, history=None):
     return run_suggestion_agent(profile, digest, clusters, top_items, user_query, history)
 
+async def generate_suggestions_async(profile=None, digest=None, clusters=None, top_items=None, user_query=None, history=None):
+    return await run_suggestion_agent_async(profile, digest, clusters, top_items, user_query, history)
+
+# ---------------------------------------------------------------------------
+# Suggestion memo: agent results keyed by (user_query, history digest) and
+# stamped with the data version they were computed from. The version is the
+# caller's choice (main.py combines data_version with memory_version()).
+# ---------------------------------------------------------------------------
+
+SUGGESTION_MEMO_SIZE = 64
+
+_suggestion_memo = OrderedDict()  # key -> {"version", "result", "computed_at"}
+_suggestion_refreshing = {}       # (key, version as JSON) -> asyncio.Task, one recompute in flight each
+
+def memory_version():
+    """Changes whenever the AI learns a new memory (ai_memory feeds the suggestion context)."""
+    db = get_db()
+    row = db.execute("SELECT MAX(id) FROM ai_memory").fetchone()
+    db.close()
+    return row[0] or 0
+
+def _suggestion_key(user_query, history):
+    digest = hashlib.sha1(json.dumps(history or [], sort_keys=True, default=str).encode()).hexdigest()
+    return (user_query or "", digest)
+
+def _memo_response(entry, status, refreshing=False):
+    result = dict(entry["result"])
+    result["cache"] = {
+        "status": status,
+        "computed_at": datetime.datetime.fromtimestamp(entry["computed_at"]).isoformat(),
+        "refreshing": refreshing
+    }
+    return result
+
+async def memoized_suggestions(version, load_inputs, user_query=None, history=None, allow_stale=True):
+    """
+    Returns the agent result for this query/history, reusing the memo while
+    `version` is unchanged. If the data has moved and allow_stale is set, the
+    previous result comes back immediately (cache.status = "stale") and one
+    background task recomputes it. load_inputs() is awaited only on a
+    recompute and must return the profile/digest/clusters/top_items kwargs.
+    Concurrent misses for the same key and version share one recompute.
+    """
+    key = _suggestion_key(user_query, history)
+    entry = _suggestion_memo.get(key)
+    if entry and entry["version"] == version:
+        _suggestion_memo.move_to_end(key)
+        return _memo_response(entry, "hit")
+
+    task = _refresh_task(key, version, load_inputs, user_query, history)
+    if entry and allow_stale:
+        return _memo_response(entry, "stale", refreshing=True)
+
+    # shield: a caller that disconnects must not cancel the others' recompute
+    entry, result = await asyncio.shield(task)
+    return _memo_response(entry, "miss") if entry else result
+
+def _flight_key(key, version):
+    return (key, json.dumps(version, default=str)) # versions may be lists
+
+def _refresh_task(key, version, load_inputs, user_query, history):
+    """The in-flight recompute for (key, version), started if there is none."""
+    flight = _flight_key(key, version)
+    task = _suggestion_refreshing.get(flight)
+    if task is None:
+        task = _suggestion_refreshing[flight] = asyncio.create_task(
+            _refresh_suggestions(key, version, load_inputs, user_query, history))
+        task.add_done_callback(_log_refresh_failure)
+    return task
+
+def _log_refresh_failure(task):
+    # Background refreshes have no awaiting caller; retrieving the exception
+    # here also keeps asyncio from warning that it was never retrieved
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Suggestion refresh error: {task.exception()!r}")
+
+async def _refresh_suggestions(key, version, load_inputs, user_query, history):
+    try:
+        inputs = await load_inputs()
+        # The agent appends to the history it is given; keep the caller's list intact
+        result = await run_suggestion_agent_async(**inputs, user_query=user_query,
+                                                  history=list(history) if history else None)
+        if not result.get("suggestions"):
+            # Failed runs (no provider, model error) are returned but never memoized
+            return None, result
+        entry = {"version": version, "result": result, "computed_at": time.time()}
+        _suggestion_memo[key] = entry
+        _suggestion_memo.move_to_end(key)
+        while len(_suggestion_memo) > SUGGESTION_MEMO_SIZE:
+            _suggestion_memo.popitem(last=False)
+        return entry, result
+    finally:
+        _suggestion_refreshing.pop(_flight_key(key, version), None)
+
+def clear_suggestion_memo():
+    _suggestion_memo.clear()
+
+SUGGESTION_SNAPSHOTS_KEPT = 20
+
+def save_suggestion_snapshot(version, result):
+    db = get_db()
+    db.execute("""
+        INSERT INTO suggestion_snapshots (version, suggestions, thinking_trace, context_summary)
+        VALUES (?, ?, ?, ?)
+    """, (json.dumps(version), json.dumps(result.get("suggestions", [])),
+          json.dumps(result.get("thinking_trace", []), default=str), result.get("context_summary")))
+    db.execute("""
+        DELETE FROM suggestion_snapshots
+        WHERE id NOT IN (SELECT id FROM suggestion_snapshots ORDER BY id DESC LIMIT ?)
+    """, (SUGGESTION_SNAPSHOTS_KEPT,))
+    db.commit()
+    db.close()
+
+def latest_suggestion_snapshot():
+    """The newest briefing as an agent-shaped result plus its version, or None."""
+    db = get_db()
+    row = db.execute("SELECT * FROM suggestion_snapshots ORDER BY id DESC LIMIT 1").fetchone()
+    db.close()
+    if not row:
+        return None
+    return {
+        "suggestions": json.loads(row["suggestions"]),
+        "thinking_trace": json.loads(row["thinking_trace"]),
+        "context_summary": row["context_summary"],
+        "version": json.loads(row["version"]),
+        "created_at": row["created_at"]
+    }
+
 def truncate_db():
     db = get_db()
     db.execute("DELETE FROM knowledge_nodes")
@@ -635,5 +1032,18 @@ def truncate_db():
     except sqlite3.OperationalError:
         pass
     db.execute("DELETE FROM sqlite_sequence WHERE name='knowledge_nodes'")
+    try:
+        db.execute("UPDATE knowledge_version SET generation = generation + 1 WHERE id = 1")
+    except sqlite3.OperationalError:
+        pass # Table not created yet; no index can hold this database either
     db.commit()
     db.close()
+    reset_knowledge_index()
+
+if __name__ == "__main__":
+    import sys
+    init_db()
+    print("Database initialized.")
+    if "--train-index" in sys.argv:
+        index = train_knowledge_index()
+        print(f"Trained the knowledge index on {index.size} nodes ({index_path()}).")
@@ -458,6 +458,9 @@ def seed(reset=False):
         )
         _backdate_completion(id_hist, "2023-01-14", "Resolved efficiently in 2023.")
 
+    # _backdate_completion() writes timely_items directly, so recount departments
+    commitment_engine.rebuild_dept_scorecard()
+
     # -- SUMMARY --------------------------------------------------------------
     conn = sqlite3.connect(commitment_engine.DB_PATH)
     conn.row_factory = sqlite3.Row
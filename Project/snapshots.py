@@ -0,0 +1,102 @@
+try:
+    from pysqlite3 import dbapi2 as sqlite3
+except ImportError:
+    import sqlite3
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+import database
+
+# Snapshot cache for the dashboard read paths (digest, todo, stats, clusters).
+# Every write bumps data_version in the same transaction; a snapshot is served
+# from memory for as long as the version and the calendar date are unchanged.
+# The counter lives in SQLite so all uvicorn workers see each other's writes.
+# Snapshots are shared between callers: treat them as read-only.
+
+MAX_ENTRIES = 256 # LRU bound; filter args come from query strings
+
+_snapshots = OrderedDict()  # (path, name, args) -> ((version, date), value)
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+
+def init_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id        INTEGER PRIMARY KEY CHECK (id = 1),
+            version   INTEGER DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO data_version (id) VALUES (1)")
+
+def bump(cursor):
+    """Call from every write path, on the writer's cursor, before it commits."""
+    try:
+        cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    except sqlite3.OperationalError:
+        pass # Table not created yet; nothing can be cached either
+
+def current_version(path):
+    conn = database.connect(path)
+    try:
+        row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+    return row[0] if row else None
+
+def etag(paths, key):
+    """
+    Strong validator for a read whose result depends only on the data in
+    `paths`, today's date and `key` (e.g. the request URL). None if any of the
+    databases has no data_version table yet.
+    """
+    versions = []
+    for path in dict.fromkeys(paths):
+        version = current_version(path)
+        if version is None:
+            return None
+        versions.append(str(version))
+    stamp = f"{'.'.join(versions)}|{datetime.datetime.now().date().isoformat()}|{key}"
+    return '"' + hashlib.sha1(stamp.encode()).hexdigest()[:20] + '"'
+
+def cached(path, name, compute, *args):
+    """
+    Returns compute(*args), reusing the last result while the data version and
+    today's date are unchanged. The result is shared with other callers; copy
+    it before mutating.
+    """
+    version = current_version(path)
+    if version is None:
+        return compute(*args)
+
+    key = (path, name, args)
+    stamp = (version, datetime.datetime.now().date().isoformat())
+    with _lock:
+        entry = _snapshots.get(key)
+        if entry and entry[0] == stamp:
+            _snapshots.move_to_end(key)
+            _counters["hits"] += 1
+            return entry[1]
+
+    # A write landing mid-compute leaves this tagged with the older version,
+    # so the next read recomputes rather than serving it.
+    value = compute(*args)
+    with _lock:
+        # Anything for this database stamped before now can never hit again
+        for old in [k for k, (s, _) in _snapshots.items() if k[0] == path and s < stamp]:
+            del _snapshots[old]
+        _snapshots[key] = (stamp, value)
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > MAX_ENTRIES:
+            _snapshots.popitem(last=False)
+        _counters["misses"] += 1
+    return value
+
+def clear():
+    with _lock:
+        _snapshots.clear()
+
+def stats():
+    with _lock:
+        return dict(_counters, entries=len(_snapshots))
@@ -14,23 +14,91 @@ function markdownToHtml(text) {
   return html;
 }
 
+// Last ETag + body per GET url. Read APIs answer a matching If-None-Match with
+// an empty 304, so polling an unchanged dashboard costs almost nothing.
+const etagCache = new Map();
+
 async function fetchData(url, options = {}) {
   try {
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const cachedEntry = isGet ? etagCache.get(url) : null;
+    if (cachedEntry) {
+      options = { ...options, cache: 'no-store', headers: { ...options.headers, 'If-None-Match': cachedEntry.etag } };
+    }
     const response = await fetch(url, options);
+    if (response.status === 304 && cachedEntry) return cachedEntry.data;
     if (!response.ok) throw new Error('Network response was not ok');
-    return await response.json();
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (isGet && etag) etagCache.set(url, { etag, data });
+    return data;
   } catch (error) {
     console.error('Fetch error:', error);
     return null;
   }
 }
 
+// Last pending items and open clusters shown on Home, patched by live events
+const homeState = { items: null, clusters: null };
+
+function renderHomeTodo() {
+  const todoContainer = document.querySelector('#page-home .home-grid .home-card[onclick*="todo"]');
+  if (!todoContainer || !homeState.items) return;
+  const label = todoContainer.querySelector('.home-card-label').outerHTML;
+  let html = label;
+  const allItems = [...homeState.items].sort((a, b) => b.weight - a.weight);
+  if (allItems.length === 0) {
+    html += `<div style="color:#888;font-size:11px;padding:10px 0">No urgent items found</div>`;
+  } else {
+    allItems.slice(0, 4).forEach(item => {
+      const overdueText = item.days_overdue > 0 ? `${item.days_overdue}d overdue` : (item.urgency || '');
+      html += `<div class="home-urgent-item"><span class="hui-text">${escapeHtml(item.title)}</span><span class="hui-tag ${item.urgency === 'critical' ? '' : 'amber'}">${escapeHtml(item.ward) || 'Gen'} · ${escapeHtml(overdueText)}</span></div>`;
+    });
+  }
+  todoContainer.innerHTML = html;
+}
+
+function renderHomeClusters() {
+  const container = document.querySelector('#page-home .home-card[onclick*="issues"]');
+  if (!container || !homeState.clusters) return;
+  const label = container.querySelector('.home-card-label').outerHTML;
+  let html = label;
+  if (homeState.clusters.length === 0) {
+    html += `<div style="color:#888;font-size:11px;padding:10px 0">No complaint clusters found</div>`;
+  } else {
+    homeState.clusters.slice(0, 4).forEach(c => {
+      html += `
+              <div class="home-urgent-item">
+              <span class="hui-text">${escapeHtml(c.summary)}</span>
+              <span class="hui-tag ${c.urgency === 'critical' ? '' : 'amber'}">${escapeHtml(c.ward)} · ${escapeHtml(c.urgency)}</span>
+              </div>`;
+    });
+  }
+  container.innerHTML = html;
+}
+
+// Open counts in the hero and on the commitments page, recomputed from homeState
+function renderOpenCounts() {
+  if (!homeState.items) return;
+  const count = u => homeState.items.filter(i => i.urgency === u).length;
+  const hqs = document.querySelectorAll('.hqs-num');
+  if (hqs.length >= 3) {
+    hqs[0].innerText = count('critical');
+    hqs[1].innerText = count('urgent');
+    hqs[2].innerText = homeState.items.length;
+  }
+  const statRed = document.querySelector('.stat-num.red');
+  const statAmber = document.querySelector('.stat-num.amber');
+  const statBlue = document.querySelector('.stat-num.blue');
+  if (statRed) statRed.innerText = count('critical');
+  if (statAmber) statAmber.innerText = count('urgent');
+  if (statBlue) statBlue.innerText = homeState.items.length;
+}
+
 async function loadHome() {
-  const stats = await fetchData('/api/stats');
-  const digest = await fetchData('/api/digest');
-  const clusters = await fetchData('/api/issues/clusters');
-  const profile = await fetchData('/api/profile');
-  const todo = await fetchData('/api/todo'); // Fetch todo items
+  // One round trip for stats, digest, clusters, profile and todo
+  const dashboard = await fetchData('/api/dashboard') || {};
+  const { stats, digest, clusters, profile, todo } = dashboard;
 
   // Dynamic Date for Home
   const now = new Date();
@@ -124,41 +192,13 @@ async function loadHome() {
   }
   // loadClusters(); // Original call, now moved inside loadHome
   if (todo) {
-    const todoContainer = document.querySelector('#page-home .home-grid .home-card[onclick*="todo"]');
-    if (todoContainer) {
-      const label = todoContainer.querySelector('.home-card-label').outerHTML;
-      let html = label;
-      const allItems = [...(todo.meeting_items || []), ...(todo.issue_items || [])].sort((a, b) => b.weight - a.weight);
-      if (allItems.length === 0) {
-        html += `<div style="color:#888;font-size:11px;padding:10px 0">No urgent items found</div>`;
-      } else {
-        allItems.slice(0, 4).forEach(item => {
-          const overdueText = item.days_overdue > 0 ? `${item.days_overdue}d overdue` : (item.urgency || '');
-          html += `<div class="home-urgent-item"><span class="hui-text">${escapeHtml(item.title)}</span><span class="hui-tag ${item.urgency === 'critical' ? '' : 'amber'}">${escapeHtml(item.ward) || 'Gen'} · ${escapeHtml(overdueText)}</span></div>`;
-        });
-      }
-      todoContainer.innerHTML = html;
-    }
+    homeState.items = [...(todo.meeting_items || []), ...(todo.issue_items || [])];
+    renderHomeTodo();
   }
 
   if (clusters) {
-    const container = document.querySelector('#page-home .home-card[onclick*="issues"]');
-    if (container) {
-      const label = container.querySelector('.home-card-label').outerHTML;
-      let html = label;
-      if (clusters.length === 0) {
-        html += `<div style="color:#888;font-size:11px;padding:10px 0">No complaint clusters found</div>`;
-      } else {
-        clusters.slice(0, 4).forEach(c => {
-          html += `
-                  <div class="home-urgent-item">
-                  <span class="hui-text">${escapeHtml(c.summary)}</span>
-                  <span class="hui-tag ${c.urgency === 'critical' ? '' : 'amber'}">${escapeHtml(c.ward)} · ${escapeHtml(c.urgency)}</span>
-                  </div>`;
-        });
-      }
-      container.innerHTML = html;
-    }
+    homeState.clusters = clusters;
+    renderHomeClusters();
   }
   loadRecentMeetings();
 }
@@ -289,41 +329,17 @@ document.addEventListener('DOMContentLoaded', () => {
   loadProfile();
   loadHome();
   loadContextFiles();
+  connectEvents();
   if (document.getElementById('page-issues')) loadRecentComplaints();
 });
 
-async function loadTodo(filter = null) {
-  let url = '/api/todo';
-  const todo = await fetchData(url);
-  if (todo) {
-    let allItems = [...todo.meeting_items, ...todo.issue_items];
-
-    // Apply frontend filter if provided
-    if (filter && filter.urgency) {
-      allItems = allItems.filter(i => i.urgency === filter.urgency);
-    }
+// Items behind the To-Do page and the filter it was opened with
+let todoState = null;
 
-    const container = document.getElementById('page-todo');
-    const title = container.querySelector('.page-title').outerHTML;
-    const summaryText = `${allItems.length} ${filter ? filter.urgency : ''} pending`;
-    const sub = `
-    <div class="page-sub">
-      <span id="todo-stats-summary">${summaryText}</span> · Ranked by weight
-      <button class="gen-btn" style="float:right;margin:0;padding:4px 10px;font-size:10px" onclick="liveEscalate()">Live Escalate</button>
-    </div>`;
-
-    let html = title + sub;
-
-    if (allItems.length === 0) {
-      html += `<div style="color:#666;font-size:11px;padding:20px">No pending items found</div>`;
-    }
-
-    const renderItems = (items, label, className) => {
-      if (items.length === 0) return '';
-      let section = `<div class="section-label">${label}</div>`;
-      items.forEach(item => {
-        section += `
-            <div class="todo-item ${className}">
+function renderTodoItem(item) {
+  const className = item.urgency === 'critical' ? 'c' : item.urgency === 'urgent' ? 'u' : 'n';
+  return `
+            <div class="todo-item ${className}" data-id="${item.id}">
               <div onclick="completeItem(${item.id})">
                 <div class="todo-text">${escapeHtml(item.title)}</div>
                 <div class="todo-meta">
@@ -337,22 +353,125 @@ async function loadTodo(filter = null) {
                 <button class="gen-btn" style="padding:2px 5px;font-size:8px;margin-top:5px" onclick="extendItem(${item.id})">Extend</button>
               </div>
             </div>`;
-      });
-      return section;
-    };
+}
+
+function renderTodoPage() {
+  if (!todoState) return;
+  const filter = todoState.filter;
+  let allItems = [...todoState.items].sort((a, b) => b.weight - a.weight);
+
+  // Apply frontend filter if provided
+  if (filter && filter.urgency) {
+    allItems = allItems.filter(i => i.urgency === filter.urgency);
+  }
+
+  const container = document.getElementById('page-todo');
+  const title = container.querySelector('.page-title').outerHTML;
+  const summaryText = `${allItems.length} ${filter ? filter.urgency : ''} pending`;
+  const sub = `
+    <div class="page-sub">
+      <span id="todo-stats-summary">${summaryText}</span> · Ranked by weight
+      <button class="gen-btn" style="float:right;margin:0;padding:4px 10px;font-size:10px" onclick="liveEscalate()">Live Escalate</button>
+    </div>`;
+
+  let html = title + sub;
+
+  if (allItems.length === 0) {
+    html += `<div style="color:#666;font-size:11px;padding:20px">No pending items found</div>`;
+  }
 
-    const critical = allItems.filter(i => i.urgency === 'critical');
-    const urgent = allItems.filter(i => i.urgency === 'urgent');
-    const normal = allItems.filter(i => i.urgency === 'normal');
+  const renderItems = (items, label) => {
+    if (items.length === 0) return '';
+    return `<div class="section-label">${label}</div>` + items.map(renderTodoItem).join('');
+  };
+
+  html += renderItems(allItems.filter(i => i.urgency === 'critical'), 'Critical');
+  html += renderItems(allItems.filter(i => i.urgency === 'urgent'), 'Urgent');
+  html += renderItems(allItems.filter(i => i.urgency === 'normal'), 'Normal');
 
-    html += renderItems(critical, 'Critical', 'c');
-    html += renderItems(urgent, 'Urgent', 'u');
-    html += renderItems(normal, 'Normal', 'n');
+  container.innerHTML = html;
+}
 
-    container.innerHTML = html;
+async function loadTodo(filter = null) {
+  let url = '/api/todo';
+  const todo = await fetchData(url);
+  if (todo) {
+    todoState = { items: [...todo.meeting_items, ...todo.issue_items], filter };
+    renderTodoPage();
   }
 }
 
+// ---------------------------------------------------------------------------
+// Live updates: /api/events pushes each change; the open lists are patched
+// from it instead of being refetched.
+// ---------------------------------------------------------------------------
+let eventSource = null;
+
+function liveUpdatesOn() {
+  return eventSource && eventSource.readyState === EventSource.OPEN;
+}
+
+function upsertItem(items, item) {
+  const i = items.findIndex(x => x.id === item.id);
+  if (i >= 0) items[i] = { ...items[i], ...item };
+  else items.push(item);
+}
+
+function patchItems(update) {
+  if (homeState.items) update(homeState.items);
+  if (todoState) update(todoState.items);
+}
+
+function refreshOpenViews() {
+  renderHomeTodo();
+  renderOpenCounts();
+  renderTodoPage();
+}
+
+function resyncOpenViews() {
+  loadHome();
+  if (todoState) loadTodo(todoState.filter);
+}
+
+const liveHandlers = {
+  item_added: ({ item }) => patchItems(items => upsertItem(items, item)),
+  item_updated: ({ item }) => patchItems(items => upsertItem(items, item)),
+  item_extended: ({ item }) => patchItems(items => upsertItem(items, item)),
+  item_completed: ({ id }) => patchItems(items => {
+    const i = items.findIndex(x => x.id === id);
+    if (i >= 0) items.splice(i, 1);
+  }),
+  escalation_finished: ({ items: moved }) => {
+    // Large passes don't list their items
+    if (!moved) return resyncOpenViews();
+    patchItems(items => moved.forEach(m => {
+      const item = items.find(x => x.id === m.id);
+      if (item) Object.assign(item, m);
+    }));
+  },
+  cluster_updated: ({ cluster }) => {
+    if (!homeState.clusters) return;
+    const existing = homeState.clusters.find(c => c.id === cluster.id);
+    if (existing) Object.assign(existing, cluster);
+    else homeState.clusters.push(cluster);
+    homeState.clusters.sort((a, b) => b.weight - a.weight);
+    renderHomeClusters();
+  },
+};
+
+function connectEvents() {
+  if (!window.EventSource) return;
+  eventSource = new EventSource('/api/events');
+  Object.entries(liveHandlers).forEach(([type, handler]) => {
+    eventSource.addEventListener(type, (e) => {
+      handler(JSON.parse(e.data));
+      if (type !== 'cluster_updated') refreshOpenViews();
+    });
+  });
+  eventSource.addEventListener('resync', resyncOpenViews);
+  // EventSource reconnects on its own, sending Last-Event-ID to replay what was missed
+}
+
 async function completeItem(id) {
   if (confirm('Mark this item as completed?')) {
     const res = await fetchData(`/api/item/${id}/complete`, {
@@ -362,8 +481,10 @@ async function completeItem(id) {
     });
     if (res) {
       alert('Item completed!');
-      loadTodo();
-      loadHome();
+      if (!liveUpdatesOn()) {
+        loadTodo();
+        loadHome();
+      }
       loadHistory(); // Also refresh history/commitments page
     }
   }
@@ -376,7 +497,7 @@ async function liveEscalate() {
   btn.disabled = true;
   try {
     const res = await fetchData('/api/escalate', { method: 'POST' });
-    if (res) {
+    if (res && !liveUpdatesOn()) {
       loadTodo();
       loadHome();
     }
@@ -397,7 +518,7 @@ async function extendItem(id) {
     });
     if (res) {
       alert('Deadline extended');
-      loadTodo();
+      if (!liveUpdatesOn()) loadTodo();
       loadHistory(); // Also refresh history/commitments page
     }
   }
@@ -788,6 +909,42 @@ let currentWorkingMemory = [];
 let chatHistory = [];
 let currentStrategicContext = null;
 
+// POSTs a JSON body and feeds each server-sent event to onEvent(type, data)
+// as it arrives (EventSource only does GET). Resolves false on failure.
+async function streamPost(url, body, onEvent) {
+  try {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify(body)
+    });
+    if (!response.ok || !response.body) throw new Error('Network response was not ok');
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const frame = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let type = 'message', data = '';
+        frame.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) type = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (data) onEvent(type, JSON.parse(data));
+      }
+    }
+    return true;
+  } catch (error) {
+    console.error('Stream error:', error);
+    return false;
+  }
+}
+
 async function sendChat() {
   const input = document.querySelector('.chat-input');
   const log = document.querySelector('.chat-log');
@@ -816,51 +973,59 @@ async function sendChat() {
   log.appendChild(aiMsg);
   log.scrollTop = log.scrollHeight;
 
-  const res = await fetchData('/api/chat', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({
-      query: query,
-      working_memory: currentWorkingMemory,
-      history: chatHistory,
-      strategic_context: currentStrategicContext
-    })
-  });
-
   // Track user message
+  const history = [...chatHistory];
   chatHistory.push({ role: 'user', content: query });
 
-  if (res) {
-    // Update working memory for next turn
-    if (res.working_memory) {
-      currentWorkingMemory = res.working_memory;
-    }
-
-    const bubble = aiMsg.querySelector('.bubble');
-    bubble.classList.remove('thinking');
+  const bubble = aiMsg.querySelector('.bubble');
+  let text = '';
+  let done = false;
+
+  const ok = await streamPost('/api/chat', {
+    query: query,
+    working_memory: currentWorkingMemory,
+    history: history,
+    strategic_context: currentStrategicContext,
+    stream: true
+  }, (type, data) => {
+    if (type === 'meta') {
+      // Update working memory for next turn
+      if (data.working_memory && data.working_memory.length) currentWorkingMemory = data.working_memory;
+
+      if (data.routed === "instant") {
+        bubble.classList.add('instant');
+        bubble.style.borderLeft = "4px solid #4ade80"; // Subtle indicator for instant
+      } else if (data.routed === "follow-up") {
+        bubble.style.borderLeft = "4px solid #60a5fa"; // Blue for follow-up intelligence
+      }
 
-    if (res.routed === "instant") {
-      bubble.classList.add('instant');
-      bubble.style.borderLeft = "4px solid #4ade80"; // Subtle indicator for instant
-    } else if (res.routed === "follow-up") {
-      bubble.style.borderLeft = "4px solid #60a5fa"; // Blue for follow-up intelligence
+      if (data.sources && data.sources.length > 0) {
+        const sourcesDiv = document.createElement('div');
+        sourcesDiv.className = 'sources';
+        sourcesDiv.innerHTML = 'Sources: ' + data.sources.map(s => `
+          <span class="src-chip" title="${escapeHtml(s.domain)}">${escapeHtml(s.title)}</span>
+        `).join('');
+        aiMsg.appendChild(sourcesDiv);
+      }
+    } else if (type === 'token') {
+      if (!text) bubble.classList.remove('thinking');
+      text += data.text;
+      bubble.innerHTML = markdownToHtml(text);
+    } else if (type === 'done') {
+      done = true;
+      bubble.classList.remove('thinking');
+      bubble.innerHTML = markdownToHtml(data.response);
+      // Track AI message
+      chatHistory.push({ role: 'ai', content: data.response });
+    } else if (type === 'error') {
+      console.error('Chat error:', data.detail);
     }
+    log.scrollTop = log.scrollHeight;
+  });
 
-    bubble.innerHTML = markdownToHtml(res.response);
-    
-    // Track AI message
-    chatHistory.push({ role: 'ai', content: res.response });
-    
-    if (res.sources && res.sources.length > 0) {
-      const sourcesDiv = document.createElement('div');
-      sourcesDiv.className = 'sources';
-      sourcesDiv.innerHTML = 'Sources: ' + res.sources.map(s => `
-        <span class="src-chip" title="${escapeHtml(s.domain)}">${escapeHtml(s.title)}</span>
-      `).join('');
-      aiMsg.appendChild(sourcesDiv);
-    }
-  } else {
-    aiMsg.querySelector('.bubble').innerText = "Sorry, I'm having trouble connecting to my brain right now.";
+  if (!ok || !done) {
+    bubble.classList.remove('thinking');
+    if (!text) bubble.innerText = "Sorry, I'm having trouble connecting to my brain right now.";
   }
   log.scrollTop = log.scrollHeight;
 }
@@ -944,6 +1109,10 @@ function renderThinkingTrace(data) {
 
   if (data.thinking_trace) {
     traceSummary.innerText = data.context_summary || 'Analysis complete';
+    if (data.snapshot) {
+      // Precomputed briefing: say how old it is and whether a newer one is on the way
+      traceSummary.innerText += ` · briefing from ${data.snapshot.generated_at}` + (data.snapshot.regenerating ? ' · regenerating…' : '');
+    }
     traceContent.innerHTML = data.thinking_trace.map(t => `
       <div class="trace-entry">
         <div class="trace-meta">Round ${t.round} · ${t.type} · ${new Date(t.timestamp).toLocaleTimeString()}</div>
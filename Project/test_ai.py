@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+import asyncio
+import tempfile
+
+sys.path.append(os.path.dirname(__file__))
+import ai
+
+class TestResponseCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.saved = (ai.provider_name, ai.CACHE_ENABLED, ai.CACHE_MAX_BYTES, ai.CACHE_DB_PATH)
+        ai.CACHE_DB_PATH = os.path.join(cls.tmpdir, "test_copilot.db")
+
+    @classmethod
+    def tearDownClass(cls):
+        name, ai.CACHE_ENABLED, ai.CACHE_MAX_BYTES, ai.CACHE_DB_PATH = cls.saved
+        ai.set_provider(name)
+
+    def setUp(self):
+        ai.CACHE_ENABLED = True
+        ai.CACHE_MAX_BYTES = 1024 * 1024
+        self.backend = ai.set_provider("stub")
+        self.calls = 0
+        respond = self.backend.respond
+        def counting(prompt):
+            self.calls += 1
+            return respond(prompt)
+        self.backend.respond = counting
+        ai.clear_cache()
+
+    def test_hit_after_miss_ignores_whitespace(self):
+        first = ai.call_ai("Summarise   ward 5", site="extract")
+        self.assertEqual(ai.call_ai("Summarise ward 5\n", site="extract"), first)
+        self.assertEqual(self.calls, 1)
+        stats = ai.cache_stats()["by_site"]["extract"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_uncached_site_and_opt_out(self):
+        ai.call_ai("hello", site="chat")
+        ai.call_ai("hello", site="chat")
+        ai.call_ai("hello", site="extract", cache=False)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(ai.cache_stats()["entries"], 0)
+
+    def test_ttl_expiry(self):
+        ai.call_ai("old prompt", site="suggestions")
+        db = ai._cache_db()
+        db.execute("UPDATE llm_cache SET created_at = created_at - ?", (ai.CACHE_TTLS["suggestions"] + 1,))
+        db.commit()
+        db.close()
+        ai.call_ai("old prompt", site="suggestions")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(ai.cache_stats()["by_site"]["suggestions"]["expired"], 1)
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        ai.CACHE_MAX_BYTES = 400
+        for i in range(6):
+            ai.call_ai(f"prompt number {i}", site="extract") # ~60-70 bytes each
+        ai.call_ai("prompt number 0", site="extract") # touch the oldest
+        for i in range(6, 9):
+            ai.call_ai(f"prompt number {i}", site="extract")
+        stats = ai.cache_stats()
+        self.assertLessEqual(stats["bytes"], 400)
+        self.assertGreater(stats["by_site"]["extract"]["evictions"], 0)
+        calls = self.calls
+        ai.call_ai("prompt number 0", site="extract")
+        self.assertEqual(self.calls, calls) # recently used, so it survived
+        ai.call_ai("prompt number 1", site="extract")
+        self.assertEqual(self.calls, calls + 1) # least recently used, evicted
+
+    def test_evictions_charged_to_the_owning_site(self):
+        ai.CACHE_MAX_BYTES = 400
+        for i in range(5):
+            ai.call_ai(f"prompt number {i}", site="extract")
+        self.assertEqual(ai.cache_stats()["by_site"]["extract"]["evictions"], 0) # under budget: no eviction pass
+        for i in range(3):
+            ai.call_ai(f"another prompt {i}", site="batch_extract")
+        stats = ai.cache_stats()
+        # Only the old extract rows were evicted, by writes from batch_extract
+        self.assertGreater(stats["by_site"]["extract"]["evictions"], 0)
+        self.assertEqual(stats["by_site"]["batch_extract"]["evictions"], 0)
+        self.assertLessEqual(stats["bytes"], 400)
+
+    def test_async_shares_the_cache(self):
+        sync_text = ai.call_ai("same prompt", site="batch_extract")
+        async_text = asyncio.run(ai.call_ai_async("same prompt", site="batch_extract"))
+        self.assertEqual(async_text, sync_text)
+        self.assertEqual(self.calls, 1)
+
+class TestAsyncClients(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = ai.provider_name
+        self.backend = ai.set_provider("openai", base_url="http://127.0.0.1:9/v1")
+
+    def tearDown(self):
+        ai.set_provider(self.saved)
+
+    def test_one_client_per_loop_closed_on_shutdown(self):
+        async def first():
+            client = self.backend._aclient()
+            self.assertIs(self.backend._aclient(), client)
+            return client
+        old = asyncio.run(first())
+
+        async def second():
+            client = self.backend._aclient()
+            # The finished loop's client was dropped, not reused
+            self.assertIsNot(client, old)
+            self.assertEqual(list(self.backend._async_clients.values()), [client])
+            await ai.aclose()
+            return client
+        self.assertTrue(asyncio.run(second()).is_closed)
+        self.assertEqual(self.backend._async_clients, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+import os
+import sys
+import datetime
+
+sys.path.append(os.path.dirname(__file__))
+import commitment_engine
+import snapshots
+import testdb
+
+today = datetime.datetime.now().date()
+_d = lambda days: (today - datetime.timedelta(days=days)).isoformat()
+
+def _add(title, deadline):
+    return commitment_engine.add_item({
+        "text": title,
+        "type": "commitment",
+        "source_id": "test_meeting.txt",
+        "meeting_date": _d(30),
+        "_extracted": {"title": title, "type": "commitment", "deadline": deadline}
+    })
+
+class TestCommitmentEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Point every engine (and the embedding/LLM caches it reaches) at a throwaway database
+        cls.path, cls.saved = testdb.redirect()
+        commitment_engine.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+
+    def setUp(self):
+        commitment_engine.truncate_db()
+
+    def _weights(self):
+        todo = commitment_engine.get_todo_list()
+        return {i["title"]: (i["weight"], i["urgency"]) for i in todo["meeting_items"]}
+
+    def test_escalation_ladder(self):
+        # Band edges: 0 / 1,3 / 4,7 / 8,14 / 15+ days overdue
+        cases = {
+            -5: (1, "normal"), 0: (1, "normal"),
+            1: (2, "normal"), 3: (2, "normal"),
+            4: (3, "urgent"), 7: (3, "urgent"),
+            8: (5, "critical"), 14: (5, "critical"),
+            15: (8, "critical"), 60: (8, "critical"),
+        }
+        for days in cases:
+            _add(f"overdue {days}", _d(days))
+
+        changed = commitment_engine.escalate()
+        self.assertEqual(changed, 8) # everything except the two W1 rows
+
+        weights = self._weights()
+        for days, expected in cases.items():
+            self.assertEqual(weights[f"overdue {days}"], expected, f"{days} days overdue")
+
+    def test_escalate_only_counts_real_changes(self):
+        _add("late", _d(10))
+        self.assertEqual(commitment_engine.escalate(), 1)
+        self.assertEqual(commitment_engine.escalate(), 0)
+
+    def test_escalate_skips_issue_items_and_bad_deadlines(self):
+        _add("no deadline", None)
+        _add("garbled", "next week")
+        commitment_engine.add_item({
+            "cluster_summary": "Drainage overflow Ward 42",
+            "cluster_id": 1, "ward": "Ward 42", "weight": 6, "urgency": "critical"
+        })
+        self.assertEqual(commitment_engine.escalate(), 0)
+        issue = commitment_engine.get_todo_list()["issue_items"][0]
+        self.assertEqual((issue["weight"], issue["urgency"]), (6, "critical"))
+
+    def test_ensure_escalated_skips_clean_epoch(self):
+        item_id = _add("late", _d(10))
+        self.assertEqual(commitment_engine.ensure_escalated(), 1)
+
+        # Nothing changed and the date hasn't moved: no pass at all
+        conn = commitment_engine.sqlite3.connect(commitment_engine.DB_PATH)
+        conn.execute("UPDATE timely_items SET weight = 1 WHERE id = ?", (item_id,))
+        conn.commit()
+        conn.close()
+        self.assertEqual(commitment_engine.ensure_escalated(), 0)
+
+        # Extending raises the dirty flag, so the next read re-escalates
+        commitment_engine.extend_item(item_id, _d(5))
+        self.assertEqual(commitment_engine.ensure_escalated(), 1)
+        self.assertEqual(self._weights()["late"], (3, "urgent"))
+
+    def test_escalate_due_only_touches_scheduled_items(self):
+        a = _add("late", _d(10))
+        b = _add("later", _d(20))
+        commitment_engine.escalate()
+        schedule = {r["id"]: r for r in commitment_engine.get_escalation_schedule()}
+        # 10 days overdue crosses into W8 at deadline + 15; W8 has no next band
+        self.assertEqual(schedule[a]["next_escalation_at"], _d(-5))
+        self.assertEqual((schedule[a]["next_weight"], schedule[a]["next_urgency"]), (8, "critical"))
+        self.assertNotIn(b, schedule)
+
+        # Knock both out of band; only the one that is due gets corrected
+        conn = commitment_engine.sqlite3.connect(commitment_engine.DB_PATH)
+        conn.execute("UPDATE timely_items SET weight = 1")
+        conn.execute("UPDATE timely_items SET next_escalation_at = ? WHERE id = ?", (_d(0), a))
+        conn.commit()
+        conn.close()
+        self.assertEqual(commitment_engine.escalate_due(), 1)
+        weights = self._weights()
+        self.assertEqual(weights["late"], (5, "critical"))
+        self.assertEqual(weights["later"], (1, "critical"))
+
+    def test_due_query_uses_schedule_index(self):
+        conn = commitment_engine.sqlite3.connect(commitment_engine.DB_PATH)
+        plan = conn.execute("""
+            EXPLAIN QUERY PLAN SELECT id FROM timely_items
+            WHERE status = 'pending' AND source != 'issue_engine' AND next_escalation_at <= ?
+        """, (_d(0),)).fetchall()
+        conn.close()
+        self.assertIn("idx_timely_next_escalation", " ".join(str(r[-1]) for r in plan))
+
+    def test_stats_by_department(self):
+        def add(title, to_whom, deadline):
+            return commitment_engine.add_item({
+                "text": title, "type": "commitment", "meeting_date": _d(20),
+                "_extracted": {"title": title, "to_whom": to_whom, "deadline": deadline}
+            })
+        on_time = add("a", "PWD", _d(-5))
+        late = add("b", "PWD", _d(15))
+        add("c", "PWD", _d(1))
+        djb = add("d", "DJB", _d(-1))
+        add("e", None, _d(1))
+        for item_id in (on_time, late, djb):
+            commitment_engine.complete_item(item_id)
+
+        stats = commitment_engine.get_stats()
+        depts = {d["name"]: d for d in stats["by_department"]}
+        self.assertEqual(set(depts), {"PWD", "DJB"})
+        self.assertEqual((depts["PWD"]["total"], depts["PWD"]["on_time"]), (3, 1))
+        self.assertEqual(depts["PWD"]["avg_days"], 20)
+        self.assertEqual((depts["DJB"]["total"], depts["DJB"]["on_time"]), (1, 1))
+        self.assertEqual(stats["all_time"]["avg_days_to_resolve"], 20)
+        self.assertEqual(stats["all_time"]["most_reliable_contact"], "DJB")
+        self.assertEqual(stats["this_month"]["total_made"], 5)
+
+    def test_scorecard_matches_rebuild(self):
+        def add(title, to_whom, deadline):
+            return commitment_engine.add_item({
+                "text": title, "type": "commitment", "meeting_date": _d(20),
+                "_extracted": {"title": title, "to_whom": to_whom, "deadline": deadline}
+            })
+        a = add("a", "PWD", _d(-5))
+        b = add("b", "PWD", _d(15))
+        c = add("c", "DJB", _d(3))
+        commitment_engine.extend_item(b, _d(-3))
+        commitment_engine.extend_item(c, _d(-3))
+        commitment_engine.complete_item(a)
+        commitment_engine.complete_item(b)
+        commitment_engine.complete_item(b) # no-op, already completed
+
+        incremental = commitment_engine.get_dept_scorecard()
+        commitment_engine.rebuild_dept_scorecard()
+        self.assertEqual(incremental, commitment_engine.get_dept_scorecard())
+
+        pwd = commitment_engine.get_dept_scorecard("PWD")[0]
+        self.assertEqual((pwd["total"], pwd["completed"], pwd["on_time"], pwd["extensions"]), (2, 2, 2, 1))
+
+    def test_snapshots_invalidate_on_write(self):
+        item_id = _add("cached", _d(-3))
+        first = commitment_engine.get_todo_list()
+        hits = snapshots.stats()["hits"]
+        self.assertEqual(commitment_engine.get_todo_list(), first)
+        self.assertEqual(snapshots.stats()["hits"], hits + 1)
+
+        # Hits share the stored snapshot instead of copying it
+        self.assertIs(commitment_engine.get_todo_list(), commitment_engine.get_todo_list())
+
+        commitment_engine.complete_item(item_id)
+        self.assertEqual(commitment_engine.get_todo_list()["meeting_items"], [])
+        self.assertEqual(commitment_engine.get_stats()["by_department"], [])
+
+    def test_snapshots_are_bounded(self):
+        commitment_engine.get_todo_list(ward="Ward 1")
+        commitment_engine.update_profile({"name": "Test MLA"})
+        # The recompute drops every entry stamped with the old version
+        commitment_engine.get_todo_list()
+        self.assertEqual(snapshots.stats()["entries"], 1)
+
+        saved, snapshots.MAX_ENTRIES = snapshots.MAX_ENTRIES, 3
+        try:
+            for i in range(10):
+                commitment_engine.get_todo_list(ward=f"Ward {i}")
+            self.assertEqual(snapshots.stats()["entries"], 3)
+        finally:
+            snapshots.MAX_ENTRIES = saved
+
+    def test_etag_changes_with_writes(self):
+        paths = [commitment_engine.DB_PATH]
+        tag = snapshots.etag(paths, "/api/todo?")
+        self.assertEqual(snapshots.etag(paths, "/api/todo?"), tag)
+        self.assertNotEqual(snapshots.etag(paths, "/api/todo?type=question"), tag)
+        commitment_engine.update_profile({"name": "Test MLA"})
+        self.assertNotEqual(snapshots.etag(paths, "/api/todo?"), tag)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(__file__))
+import database
+
+class TestConnectionPool(unittest.TestCase):
+    """Per-thread connection reuse, release semantics and shutdown."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "pool.db")
+        conn = database.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def _count(self):
+        conn = database.connect(self.path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_same_thread_reuses_connection(self):
+        first = database.connect(self.path)
+        raw = first._entry.raw
+        first.close()
+        second = database.connect(self.path)
+        self.assertIs(second._entry.raw, raw)
+        second.close()
+
+    def test_release_rolls_back_uncommitted_work(self):
+        conn = database.connect(self.path)
+        conn.execute("INSERT INTO t VALUES (1)")
+        self.assertTrue(conn.in_transaction)
+        conn.close()
+        self.assertEqual(self._count(), 0)
+
+    def test_nested_handle_inside_transaction_is_refused(self):
+        outer = database.connect(self.path)
+        try:
+            outer.execute("INSERT INTO t VALUES (1)")
+            with self.assertRaises(AssertionError):
+                database.connect(self.path)
+        finally:
+            outer.close()
+        # Outside a transaction nesting is fine and shares the connection
+        outer = database.connect(self.path)
+        inner = database.connect(self.path)
+        self.assertIs(inner._entry, outer._entry)
+        inner.close()
+        outer.close()
+
+    def test_dead_thread_connection_is_closed(self):
+        opened = []
+        def worker():
+            conn = database.connect(self.path)
+            opened.append(conn._entry)
+            conn.close()
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+
+        # Opening any new connection prunes entries of exited threads
+        conn = database.connect(os.path.join(self.dir, "other.db"))
+        conn.close()
+        self.assertTrue(opened[0].closed)
+        self.assertNotIn(opened[0], database._all_entries)
+        with self.assertRaises(database.sqlite3.ProgrammingError):
+            opened[0].raw.execute("SELECT 1")
+
+    def test_close_all_closes_and_reopens(self):
+        conn = database.connect(self.path)
+        entry = conn._entry
+        conn.close()
+        database.close_all()
+        self.assertTrue(entry.closed)
+        self.assertEqual(database.pool_stats()["connections"], 0)
+        with self.assertRaises(database.sqlite3.ProgrammingError):
+            entry.raw.execute("SELECT 1")
+        # The next connect() on this thread opens a fresh connection
+        conn = database.connect(self.path)
+        self.assertIsNot(conn._entry, entry)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+        conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import os
+import sys
+import types
+import tempfile
+import threading
+from unittest import mock
+
+sys.path.append(os.path.dirname(__file__))
+import numpy as np
+import embeddings
+import rag_engine
+import issue_engine
+import testdb
+from test_issue_engine import FakeModel
+
+class TestEmbeddingCache(unittest.TestCase):
+    """The LRU and the embedding_cache table in front of a counting FakeModel."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect(keep=[(embeddings, "_model"), (embeddings, "CACHE_DISK_MAX_ENTRIES")])
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+        embeddings.clear_cache()
+
+    def setUp(self):
+        self.model = embeddings._model = FakeModel()
+        embeddings.CACHE_DISK_MAX_ENTRIES = self.saved[-1][2]
+        embeddings.clear_cache(disk=True)
+
+    def test_counters(self):
+        embeddings.encode_many(["pothole", "streetlight", "pothole"])
+        embeddings.encode("pothole")
+        stats = embeddings.cache_stats()
+        # The repeat inside one batch is served by the same forward pass
+        self.assertEqual((stats["misses"], stats["memory_hits"], stats["disk_hits"]), (3, 1, 0))
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(stats["memory_entries"], 2)
+        self.assertEqual(stats["disk_entries"], 2)
+        self.assertEqual(stats["hit_rate"], 0.25)
+
+    def test_disk_round_trip(self):
+        first = embeddings.encode("garbage not collected")
+        embeddings.clear_cache() # memory only
+        again = embeddings.encode("garbage not collected")
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(embeddings.cache_stats()["disk_hits"], 1)
+        np.testing.assert_array_equal(again, first)
+        self.assertEqual(again.dtype, np.float32)
+
+    def test_clear_disk(self):
+        embeddings.encode("water logging")
+        embeddings.clear_cache(disk=True)
+        self.assertEqual(embeddings.cache_stats()["disk_entries"], 0)
+        embeddings.encode("water logging")
+        self.assertEqual(self.model.calls, 2)
+        self.assertEqual(embeddings.cache_stats()["misses"], 1)
+
+    def test_disk_cap_evicts_least_recently_used(self):
+        embeddings.CACHE_DISK_MAX_ENTRIES = 10
+        for i in range(10):
+            embeddings.encode(f"complaint {i}")
+        db = embeddings._cache_db()
+        db.execute("UPDATE embedding_cache SET last_used = rowid") # distinct, in insertion order
+        db.commit()
+        db.close()
+        embeddings.clear_cache()
+        embeddings.encode("complaint 0") # disk hit refreshes its last_used
+        embeddings.encode("complaint 10") # 11 rows: trims to 9
+        self.assertEqual(embeddings.cache_stats()["disk_entries"], 9)
+
+        embeddings.clear_cache()
+        calls = self.model.calls
+        embeddings.encode("complaint 0")
+        self.assertEqual(self.model.calls, calls) # recently used, kept
+        embeddings.encode("complaint 1")
+        self.assertEqual(self.model.calls, calls + 1) # least recently used, evicted
+
+    def test_new_cache_path_gets_its_table(self):
+        embeddings.encode("broken bench")
+        other = os.path.join(tempfile.mkdtemp(), "other.db")
+        embeddings.CACHE_DB_PATH = other
+        try:
+            embeddings.clear_cache()
+            embeddings.encode("broken bench")
+            self.assertEqual(self.model.calls, 2) # a different store: not cached there yet
+            self.assertEqual(embeddings.cache_stats()["disk_entries"], 1)
+        finally:
+            embeddings.CACHE_DB_PATH = self.path
+
+class TestSharedModel(unittest.TestCase):
+    """get_model() with sentence_transformers replaced by a counting fake."""
+
+    def setUp(self):
+        self.saved = embeddings._model
+        self.addCleanup(setattr, embeddings, "_model", self.saved)
+        embeddings._model = None
+        self.loads = []
+        loads = self.loads
+        class CountingSentenceTransformer(FakeModel):
+            def __init__(self, name):
+                super().__init__()
+                loads.append(name)
+        fake = types.ModuleType("sentence_transformers")
+        fake.SentenceTransformer = CountingSentenceTransformer
+        patcher = mock.patch.dict(sys.modules, {"sentence_transformers": fake})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_loaded_once_and_shared_by_engines(self):
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(embeddings.get_model())) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        models += [rag_engine.get_model(), issue_engine.get_model()]
+        self.assertEqual(self.loads, [embeddings.MODEL_NAME])
+        self.assertEqual(len({id(m) for m in models}), 1)
+
+    def test_injected_model_is_used(self):
+        injected = embeddings._model = FakeModel()
+        self.assertIs(embeddings.get_model(), injected)
+        self.assertIs(rag_engine.get_model(), injected)
+        self.assertEqual(self.loads, [])
+
+if __name__ == "__main__":
+    unittest.main()
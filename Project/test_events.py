@@ -0,0 +1,101 @@
+import unittest
+import os
+import sys
+import asyncio
+import threading
+
+sys.path.append(os.path.dirname(__file__))
+import events
+
+def _drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        events._recent.clear()
+        self.saved = events.QUEUE_SIZE
+
+    def tearDown(self):
+        events.QUEUE_SIZE = self.saved
+        events._recent.clear()
+
+    def test_publish_reaches_subscribers(self):
+        async def scenario():
+            queue = events.subscribe()
+            try:
+                events.publish("item_added", id=1)
+                # Engines publish from threadpool workers
+                worker = threading.Thread(target=events.publish, args=("item_completed",), kwargs={"id": 1})
+                worker.start()
+                worker.join()
+                first = await asyncio.wait_for(queue.get(), 1)
+                second = await asyncio.wait_for(queue.get(), 1)
+                return first, second, events.subscriber_count()
+            finally:
+                events.unsubscribe(queue)
+        first, second, count = asyncio.run(scenario())
+        self.assertEqual((first["type"], first["data"]), ("item_added", {"id": 1}))
+        self.assertEqual(second["type"], "item_completed")
+        self.assertEqual(second["id"], first["id"] + 1)
+        self.assertEqual(count, 1)
+        self.assertEqual(events.subscriber_count(), 0)
+
+    def test_unsubscribed_queue_gets_nothing(self):
+        async def scenario():
+            queue = events.subscribe()
+            events.unsubscribe(queue)
+            events.publish("item_added", id=2)
+            await asyncio.sleep(0)
+            return queue.empty()
+        self.assertTrue(asyncio.run(scenario()))
+
+    def test_replay_from_last_event_id(self):
+        for i in range(3):
+            events.publish("item_added", id=i)
+        first = events._recent[0]["id"]
+
+        async def scenario(last_event_id):
+            queue = events.subscribe(last_event_id)
+            events.unsubscribe(queue)
+            return _drain(queue)
+
+        missed = asyncio.run(scenario(str(first)))
+        self.assertEqual([e["data"]["id"] for e in missed], [1, 2])
+        self.assertEqual(asyncio.run(scenario(str(first + 2))), []) # already up to date
+
+        # Evicted from the buffer, or an id from before a restart: refetch
+        for last_event_id in (str(first - 5), str(first + 10)):
+            replayed = asyncio.run(scenario(last_event_id))
+            self.assertEqual([(e["type"], e["data"]) for e in replayed], [("resync", {"reason": "replay"})])
+
+    def test_overflow_becomes_resync(self):
+        events.QUEUE_SIZE = 3
+
+        async def scenario():
+            queue = events.subscribe()
+            try:
+                for i in range(5):
+                    events.publish("item_added", id=i)
+                await asyncio.sleep(0)
+                return _drain(queue)
+            finally:
+                events.unsubscribe(queue)
+        received = asyncio.run(scenario())
+        # The fourth event overflowed: everything queued is replaced by one resync
+        self.assertEqual([e["type"] for e in received], ["resync", "item_added"])
+        self.assertEqual(received[0]["data"], {"reason": "overflow"})
+        self.assertEqual(received[1]["data"], {"id": 4})
+
+    def test_format_sse(self):
+        self.assertEqual(events.format_sse({"id": 7, "type": "item_added", "data": {"id": 1}}),
+                         'id: 7\nevent: item_added\ndata: {"id": 1}\n\n')
+        # Events outside the feed carry no id, so the client's Last-Event-ID stays put
+        self.assertEqual(events.format_sse({"id": None, "type": "resync", "data": {}}),
+                         "event: resync\ndata: {}\n\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+import os
+import sys
+import hashlib
+
+sys.path.append(os.path.dirname(__file__))
+import numpy as np
+import issue_engine
+import embeddings
+import snapshots
+import testdb
+
+DIM = embeddings.EMBEDDING_DIM
+
+class FakeModel:
+    """Stands in for SentenceTransformer: pinned vectors by text, else a fixed random one per text."""
+
+    def __init__(self):
+        self.vectors = {}
+        self.calls = 0
+
+    def vector(self, text):
+        if text not in self.vectors:
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            self.vectors[text] = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+        return self.vectors[text]
+
+    def encode(self, texts, batch_size=32):
+        self.calls += 1
+        return np.stack([self.vector(t) for t in texts])
+
+def _unit(v):
+    return (v / np.linalg.norm(v)).astype(np.float32)
+
+class IssueEngineCase(unittest.TestCase):
+    """Throwaway database and a FakeModel; no tests of its own."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect(keep=[(embeddings, "_model")])
+        issue_engine.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+        embeddings.clear_cache()
+        issue_engine.reset_ward_indexes()
+
+    def setUp(self):
+        self.model = embeddings._model = FakeModel()
+        embeddings.clear_cache(disk=True)
+        issue_engine.truncate_db()
+
+    def _complaint(self, text, ward="Ward 8"):
+        return issue_engine.process_complaint({"complaint_text": text, "ward": ward})
+
+    def _cluster(self, cluster_id):
+        db = issue_engine.get_db()
+        count = db.execute("SELECT member_count FROM clusters WHERE id = ?", (cluster_id,)).fetchone()[0]
+        blob = db.execute("SELECT embedding FROM vec_clusters WHERE cluster_id = ?", (cluster_id,)).fetchone()[0]
+        db.close()
+        return count, np.frombuffer(blob, dtype=np.float32)
+
+class TestComplaintEmbeddings(IssueEngineCase):
+
+    def test_empty_table_loads_and_recentroids(self):
+        ids, matrix = issue_engine.load_complaint_embeddings()
+        self.assertEqual((ids.shape, matrix.shape, matrix.dtype), ((0,), (0, DIM), np.float32))
+        ids, matrix = issue_engine.load_complaint_embeddings([1, 2, 3])
+        self.assertEqual(matrix.shape, (0, DIM))
+        self.assertEqual(issue_engine.recentroid_clusters(), 0)
+
+    def test_store_and_load_round_trip_float16(self):
+        texts = ["Broken streetlight on Main Road", "Garbage not collected", "Water logging near school"]
+        ids = [self._complaint(t, ward=f"Ward {i}")["complaint_id"] for i, t in enumerate(texts)]
+
+        loaded_ids, matrix = issue_engine.load_complaint_embeddings()
+        self.assertEqual(loaded_ids.tolist(), ids)
+        self.assertEqual(matrix.dtype, np.float32)
+        expected = np.stack([self.model.vector(t) for t in texts])
+        np.testing.assert_allclose(matrix, expected.astype(np.float16).astype(np.float32))
+        np.testing.assert_allclose(matrix, expected, rtol=1e-3, atol=1e-3)
+        # Subset loads come back sorted and skip unknown ids
+        subset_ids, subset = issue_engine.load_complaint_embeddings([ids[2], ids[0], 999])
+        self.assertEqual(subset_ids.tolist(), [ids[0], ids[2]])
+        np.testing.assert_array_equal(subset, matrix[[0, 2]])
+
+        db = issue_engine.get_db()
+        widths = {r[0] for r in db.execute("SELECT length(embedding) FROM complaint_embeddings")}
+        db.close()
+        self.assertEqual(widths, {DIM * 2})
+
+    def test_backfill_skips_stored_rows(self):
+        first = self._complaint("Open manhole on Ring Road")["complaint_id"]
+        db = issue_engine.get_db()
+        db.execute("INSERT INTO complaints (raw_description, ward) VALUES (?, ?)", ("Stray dogs near park", "Ward 8"))
+        db.commit()
+        db.close()
+
+        embeddings.clear_cache(disk=True)
+        calls = self.model.calls
+        version = snapshots.current_version(self.path)
+        self.assertEqual(issue_engine.backfill_complaint_embeddings(), 1)
+        self.assertEqual(self.model.calls, calls + 1)
+        self.assertEqual(snapshots.current_version(self.path), version + 1)
+        self.assertEqual(issue_engine.backfill_complaint_embeddings(), 0)
+        self.assertEqual(self.model.calls, calls + 1)
+        self.assertEqual(snapshots.current_version(self.path), version + 1) # nothing written
+        ids, _ = issue_engine.load_complaint_embeddings()
+        self.assertEqual(ids.tolist(), [first, first + 1])
+
+    def test_backfill_bumps_version_once(self):
+        db = issue_engine.get_db()
+        db.executemany("INSERT INTO complaints (raw_description, ward) VALUES (?, ?)",
+                       [(f"Broken bench {i}", "Ward 8") for i in range(5)])
+        db.commit()
+        db.close()
+
+        version = snapshots.current_version(self.path)
+        self.assertEqual(issue_engine.backfill_complaint_embeddings(batch_size=2), 5)
+        self.assertEqual(snapshots.current_version(self.path), version + 1)
+
+    def test_recentroid_rebuilds_means(self):
+        rng = np.random.default_rng(11)
+        base = _unit(rng.standard_normal(DIM))
+        texts = [f"Pothole report {i}" for i in range(4)]
+        for text in texts:
+            self.model.vectors[text] = _unit(base + 0.02 * rng.standard_normal(DIM))
+        cluster_id = {self._complaint(t)["cluster_id"] for t in texts}
+        self.assertEqual(len(cluster_id), 1)
+        cluster_id = cluster_id.pop()
+
+        # Corrupt the stored centroid and count, then rebuild from complaint_embeddings
+        db = issue_engine.get_db()
+        db.execute("UPDATE vec_clusters SET embedding = ? WHERE cluster_id = ?",
+                   (np.zeros(DIM, dtype=np.float32).tobytes(), cluster_id))
+        db.execute("UPDATE clusters SET member_count = 1 WHERE id = ?", (cluster_id,))
+        snapshots.bump(db.cursor())
+        db.commit()
+        db.close()
+        self.assertEqual(issue_engine.get_open_clusters()[0]["member_count"], 1)
+
+        calls = self.model.calls
+        self.assertEqual(issue_engine.recentroid_clusters(), 1)
+        self.assertEqual(self.model.calls, calls) # nothing re-encoded
+        count, centroid = self._cluster(cluster_id)
+        self.assertEqual(count, 4)
+        # The cached clusters snapshot is invalidated by the rebuild
+        self.assertEqual(issue_engine.get_open_clusters()[0]["member_count"], 4)
+        _, stored = issue_engine.load_complaint_embeddings()
+        np.testing.assert_allclose(centroid, stored.mean(axis=0), rtol=1e-5, atol=1e-6)
+
+class TestRunningCentroid(IssueEngineCase):
+
+    def test_members_fold_into_mean_and_far_complaint_splits(self):
+        rng = np.random.default_rng(5)
+        base = _unit(rng.standard_normal(DIM))
+        inputs = [_unit(base + 0.02 * rng.standard_normal(DIM)) for _ in range(6)]
+        for i, vec in enumerate(inputs):
+            self.model.vectors[f"Sewer overflow {i}"] = vec
+        results = [self._complaint(f"Sewer overflow {i}") for i in range(6)]
+
+        cluster_id = results[0]["cluster_id"]
+        self.assertEqual(results[0]["action"], "new_cluster_created")
+        self.assertTrue(all(r["action"] == "added_to_existing" and r["cluster_id"] == cluster_id for r in results[1:]))
+        count, centroid = self._cluster(cluster_id)
+        self.assertEqual(count, 6)
+        np.testing.assert_allclose(centroid, np.mean(inputs, axis=0), rtol=1e-5, atol=1e-6)
+
+        # Orthogonal to the cluster: opens its own
+        far = rng.standard_normal(DIM)
+        far = _unit(far - (far @ base) * base)
+        self.model.vectors["Tree fell on a car"] = far
+        result = self._complaint("Tree fell on a car")
+        self.assertEqual(result["action"], "new_cluster_created")
+        self.assertNotEqual(result["cluster_id"], cluster_id)
+        self.assertEqual(self._cluster(cluster_id)[0], 6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+import unittest
+import os
+import sys
+import json
+import asyncio
+from unittest import mock
+
+sys.path.append(os.path.dirname(__file__))
+import commitment_engine
+import issue_engine
+import rag_engine
+import embeddings
+import ai
+import testdb
+import main
+from fastapi.testclient import TestClient
+from test_issue_engine import FakeModel
+
+class MainCase(unittest.TestCase):
+    """Throwaway database with every engine's tables; no tests of its own."""
+    keep = [] # extra (module, attr) globals a suite changes
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect(keep=cls.keep)
+        commitment_engine.init_db()
+        issue_engine.init_db()
+        rag_engine.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+        rag_engine.clear_suggestion_memo()
+
+class TestBriefingBackoff(MainCase):
+    """regenerate_briefing with the agent replaced by a fake that fails on demand."""
+
+    def setUp(self):
+        main._briefing["failure"] = None
+        self.addCleanup(main._briefing.update, failure=None)
+        self.version = [1, 1, 0, "2026-01-01"]
+        self.runs = 0
+        self.succeed = False
+        for name, fake in (("memoized_suggestions", self._agent), ("latest_suggestion_snapshot", self._latest)):
+            patcher = mock.patch.object(rag_engine, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(main, "_suggestion_version", lambda: self.version)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.saved_snapshots = []
+        patcher = mock.patch.object(rag_engine, "save_suggestion_snapshot",
+                                    lambda version, result: self.saved_snapshots.append(version))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _agent(self, version, load_inputs, *args, **kwargs):
+        self.runs += 1
+        return {"suggestions": [{"title": "ok"}] if self.succeed else []}
+
+    def _latest(self):
+        if not self.saved_snapshots:
+            return None
+        return {"suggestions": [{"title": "ok"}], "version": self.saved_snapshots[-1], "created_at": "now"}
+
+    def _regenerate(self):
+        return asyncio.run(main.regenerate_briefing())
+
+    def _expire_backoff(self):
+        main._briefing["failure"]["at"] -= main._briefing["failure"]["delay"] + 1
+
+    def test_failure_backs_off_and_doubles(self):
+        self._regenerate()
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(main._briefing["failure"]["delay"], main.BRIEFING_RETRY_SECONDS)
+        self.assertTrue(main._briefing_backing_off(self.version))
+
+        self._regenerate() # inside the delay: served from the failure, no run
+        self.assertEqual(self.runs, 1)
+
+        self._expire_backoff()
+        self._regenerate()
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(main._briefing["failure"]["delay"], 2 * main.BRIEFING_RETRY_SECONDS)
+
+    def test_delay_is_capped(self):
+        for _ in range(12):
+            self._regenerate()
+            self._expire_backoff()
+        self.assertEqual(main._briefing["failure"]["delay"], main.BRIEFING_RETRY_MAX_SECONDS)
+
+    def test_new_version_resets_backoff(self):
+        self._regenerate()
+        self._expire_backoff()
+        self._regenerate()
+        self.assertEqual(main._briefing["failure"]["delay"], 2 * main.BRIEFING_RETRY_SECONDS)
+
+        self.version = [2, 1, 0, "2026-01-01"] # a write moved the data
+        self.assertFalse(main._briefing_backing_off(self.version))
+        self._regenerate()
+        self.assertEqual(self.runs, 3)
+        self.assertEqual(main._briefing["failure"]["delay"], main.BRIEFING_RETRY_SECONDS)
+
+    def test_success_clears_failure_and_stores_snapshot(self):
+        self._regenerate()
+        self.succeed = True
+        self.version = [2, 1, 0, "2026-01-01"]
+        latest = self._regenerate()
+        self.assertIsNone(main._briefing["failure"])
+        self.assertEqual(self.saved_snapshots, [self.version])
+        self.assertEqual(latest["version"], self.version)
+        self._regenerate() # snapshot is current: no run
+        self.assertEqual(self.runs, 2)
+
+class TestDashboard(MainCase):
+    """GET /api/dashboard against the redirected database."""
+
+    def setUp(self):
+        self.client = TestClient(main.app)
+        commitment_engine.add_item({"text": "Repair the drain on Station Road", "type": "commitment",
+                                    "deadline": "2020-01-01"}) # long overdue, leaves the state dirty
+
+    def test_one_escalation_pass_for_all_parts(self):
+        with mock.patch.object(commitment_engine, "ensure_escalated", wraps=commitment_engine.ensure_escalated) as ensure, \
+             mock.patch.object(commitment_engine, "escalate_due", wraps=commitment_engine.escalate_due) as passes:
+            response = self.client.get("/api/dashboard")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(ensure.call_count, 1)
+            self.assertEqual(passes.call_count, 1)
+
+            body = response.json()
+            self.assertEqual(set(body), {"stats", "digest", "clusters", "profile", "todo"})
+            self.assertIn("Repair the drain on Station Road", json.dumps(body["todo"]))
+
+            # Nothing changed: the ETag matches and no pass runs
+            again = self.client.get("/api/dashboard", headers={"If-None-Match": response.headers["ETag"]})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(passes.call_count, 1)
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+class TestChatStream(MainCase):
+    """POST /api/chat with stream=true, answered by the stub provider."""
+    keep = [(embeddings, "_model"), (ai, "provider_name")]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        ai.set_provider(ai.provider_name)
+        embeddings.clear_cache()
+
+    def setUp(self):
+        embeddings._model = FakeModel()
+        embeddings.clear_cache(disk=True)
+        backend = ai.set_provider("stub")
+        backend.respond = lambda prompt: self.answer
+        self.answer = "Paving is on schedule. [MEMORY: roads] Ward 3 paving starts Monday [/MEMORY] Check again Friday."
+        self.client = TestClient(main.app) # no lifespan: the background tasks stay off
+
+    def _stream(self, query):
+        response = self.client.post("/api/chat", json={"query": query, "stream": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        return _parse_sse(response.text)
+
+    def test_search_route_streams_tokens_and_stores_memory(self):
+        events = self._stream("What is the status of road repairs in Ward 3?")
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[0], "meta")
+        self.assertEqual(kinds[-1], "done")
+        self.assertEqual(set(kinds[1:-1]), {"token"})
+        self.assertGreater(len(kinds), 3)
+
+        meta, done = events[0][1], events[-1][1]
+        self.assertEqual(meta["routed"], "search")
+        self.assertIn("working_memory", meta)
+        streamed = "".join(data["text"] for kind, data in events if kind == "token")
+        self.assertNotIn("MEMORY", streamed) # the tag spans chunks and is still removed
+        self.assertEqual(streamed.strip(), done["response"])
+        self.assertEqual(done["response"], "Paving is on schedule.  Check again Friday.")
+        self.assertTrue(done["memory_stored"])
+
+        db = rag_engine.get_db()
+        row = db.execute("SELECT topic, content FROM ai_memory ORDER BY id DESC LIMIT 1").fetchone()
+        db.close()
+        self.assertEqual(tuple(row), ("roads", "Ward 3 paving starts Monday"))
+
+    def test_instant_route_leaves_working_memory_alone(self):
+        self.answer = "Hello! How can I help today?"
+        with mock.patch.object(rag_engine, "needs_context", return_value="instant"):
+            events = self._stream("hello")
+        self.assertEqual(events[0], ("meta", {"routed": "instant", "sources": []}))
+        self.assertEqual(events[-1], ("done", {"response": self.answer, "memory_stored": False}))
+
+    def test_query_encoded_once_per_request(self):
+        query = "What is the status of road repairs in Ward 3?"
+        for stream in (False, True):
+            embeddings.clear_cache() # a cache hit would hide a second encode
+            with mock.patch.object(embeddings, "encode", wraps=embeddings.encode) as encode:
+                response = self.client.post("/api/chat", json={"query": query, "stream": stream})
+            self.assertEqual(response.status_code, 200)
+            # Router (lowercased) and retriever (raw) share one vector
+            encoded = [c.args[0] for c in encode.call_args_list]
+            self.assertEqual([t for t in encoded if t.lower() == query.lower()], [query.lower()])
+
+    def test_errors_arrive_as_an_event(self):
+        ai.set_provider(None)
+        events = self._stream("What is the status of road repairs in Ward 3?")
+        self.assertEqual(events[-1][0], "error")
+
+if __name__ == "__main__":
+    unittest.main()
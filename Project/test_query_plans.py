@@ -0,0 +1,146 @@
+import unittest
+import os
+import sys
+import datetime
+
+sys.path.append(os.path.dirname(__file__))
+import numpy as np
+import commitment_engine
+import digest_engine
+import issue_engine
+import database
+import snapshots
+import testdb
+
+today = datetime.datetime.now().date()
+_d = lambda days: (today - datetime.timedelta(days=days)).isoformat()
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Records every statement the hot read paths issue against timely_items and
+    asserts SQLite answers each one from an index, never a full table scan.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect()
+        commitment_engine.init_db()
+
+        for i in range(20):
+            item_id = commitment_engine.add_item({
+                "text": f"Item {i}",
+                "type": ["commitment", "question", "action"][i % 3],
+                "source_id": "plan_meeting.txt",
+                "meeting_date": _d(30),
+                "_extracted": {
+                    "title": f"Item {i}",
+                    "type": "commitment",
+                    "to_whom": ["PWD", "DJB", "MCD"][i % 3],
+                    "ward": f"Ward {i % 4}",
+                    "deadline": _d(i)
+                }
+            })
+            if i % 5 == 0:
+                commitment_engine.complete_item(item_id, "done")
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+
+    def _statements(self, fn, *args, **kwargs):
+        snapshots.clear() # make sure the read path actually queries
+        conn = database.connect(commitment_engine.DB_PATH)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            fn(*args, **kwargs)
+        finally:
+            conn.set_trace_callback(None)
+            conn.close()
+        return [s for s in statements
+                if s.lstrip().upper().startswith("SELECT") and "timely_items" in s]
+
+    def _assert_no_table_scan(self, fn, *args, **kwargs):
+        statements = self._statements(fn, *args, **kwargs)
+        self.assertTrue(statements, f"{fn.__name__} issued no timely_items queries")
+        conn = database.connect(commitment_engine.DB_PATH)
+        try:
+            for sql in statements:
+                plan = " | ".join(str(r[-1]) for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+                for step in plan.split(" | "):
+                    if step.startswith("SCAN timely_items"):
+                        self.assertIn("INDEX", step, f"Full table scan:\n{sql}\n{plan}")
+        finally:
+            conn.close()
+
+    def test_todo_list(self):
+        self._assert_no_table_scan(commitment_engine.get_todo_list)
+        self._assert_no_table_scan(commitment_engine.get_todo_list, ward="Ward 1")
+        self._assert_no_table_scan(commitment_engine.get_todo_list, urgency="critical")
+        self._assert_no_table_scan(commitment_engine.get_todo_list, type="question")
+
+    def test_issue_lookup_in_add_item(self):
+        payload = {"cluster_summary": "Drainage", "cluster_id": 7, "ward": "Ward 1", "weight": 2, "urgency": "normal"}
+        commitment_engine.add_item(payload)
+        self._assert_no_table_scan(commitment_engine.add_item, payload)
+
+    def test_stats(self):
+        self._assert_no_table_scan(commitment_engine.get_stats)
+
+    def test_digest(self):
+        self._assert_no_table_scan(digest_engine.get_digest)
+
+    def test_history(self):
+        self._assert_no_table_scan(commitment_engine.get_history)
+
+class TestClusterWardIndex(unittest.TestCase):
+    """Complaint matching reads one ward's clusters through idx_clusters_ward_members."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect()
+        issue_engine.init_db()
+        issue_engine.reset_ward_indexes()
+        cls.vectors = np.random.default_rng(0).standard_normal((40, 384)).astype(np.float32)
+        db = issue_engine.get_db()
+        for i, vec in enumerate(cls.vectors):
+            ward = ["Ward 8", "ward8", "South Delhi", None][i % 4]
+            cur = db.execute("INSERT INTO clusters (summary, ward, normalized_ward) VALUES (?, ?, ?)",
+                             (f"Cluster {i}", ward, issue_engine.normalize_ward(ward)))
+            db.execute("INSERT INTO vec_clusters (cluster_id, embedding) VALUES (?, ?)", (cur.lastrowid, vec.tobytes()))
+        db.commit()
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+        issue_engine.reset_ward_indexes()
+
+    def test_lookup_uses_ward_index(self):
+        conn = database.connect(issue_engine.DB_PATH)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            index = issue_engine.ward_cluster_index(conn.cursor(), "8")
+        finally:
+            conn.set_trace_callback(None)
+        for sql in [s for s in statements if s.lstrip().upper().startswith("SELECT") and "clusters" in s]:
+            plan = " | ".join(str(r[-1]) for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            self.assertNotIn("SCAN c ", plan + " ", f"Full table scan:\n{sql}\n{plan}")
+            self.assertNotIn("SCAN clusters ", plan + " ", f"Full table scan:\n{sql}\n{plan}")
+        conn.close()
+        # 'Ward 8' and 'ward8' share a partition; nearest is the query vector itself
+        self.assertEqual(index.size, 20)
+        self.assertEqual(index.search(self.vectors[5], 1, exact=True)[0][0], 6)
+
+    def test_new_clusters_are_picked_up(self):
+        conn = database.connect(issue_engine.DB_PATH)
+        before = issue_engine.ward_cluster_index(conn.cursor(), "southdelhi").size
+        cur = conn.execute("INSERT INTO clusters (summary, ward, normalized_ward) VALUES ('New', 'South Delhi', 'southdelhi')")
+        conn.execute("INSERT INTO vec_clusters (cluster_id, embedding) VALUES (?, ?)", (cur.lastrowid, self.vectors[0].tobytes()))
+        conn.commit()
+        self.assertEqual(issue_engine.ward_cluster_index(conn.cursor(), "southdelhi").size, before + 1)
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import unittest
+import os
+import sys
+import io
+import asyncio
+import threading
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.append(os.path.dirname(__file__))
+import numpy as np
+import rag_engine
+import embeddings
+import testdb
+from test_issue_engine import FakeModel, DIM, _unit
+
+class TestQueryNodes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path, cls.saved = testdb.redirect(keep=[(embeddings, "_model"), (rag_engine, "ANN_MIN_ROWS")])
+        rag_engine.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        testdb.restore(cls.saved)
+        embeddings.clear_cache()
+        rag_engine.reset_knowledge_index()
+
+    def setUp(self):
+        self.model = embeddings._model = FakeModel()
+        embeddings.clear_cache(disk=True)
+        rag_engine.truncate_db()
+
+        # Node i sits at a growing angle from the query, so similarity falls with i
+        rng = np.random.default_rng(9)
+        self.query = _unit(rng.standard_normal(DIM))
+        other = rng.standard_normal(DIM)
+        other = _unit(other - (other @ self.query) * self.query)
+        self.ids = []
+        for i in range(6):
+            angle = 0.2 * i
+            content = f"Fact {i}"
+            self.model.vectors[content] = _unit(np.cos(angle) * self.query + np.sin(angle) * other)
+            self.ids.append(rag_engine.store_node("meetings", ["Ward 1", "Ward 2", None][i % 3],
+                                                  "roads", f"Node {i}", content, "test"))
+
+    def check_order(self, **options):
+        nodes = rag_engine.query_nodes(None, limit=4, query_vector=self.query, **options)
+        self.assertEqual([n["id"] for n in nodes], self.ids[:4])
+        sims = [n["similarity"] for n in nodes]
+        self.assertEqual(sims, sorted(sims, reverse=True))
+        self.assertAlmostEqual(sims[0], 1.0, places=4)
+        self.assertEqual(len(nodes[0]["embedding"]), DIM)
+
+        # Ward 1 keeps its own nodes and the unassigned ones (every third from index 2)
+        nodes = rag_engine.query_nodes(None, limit=3, ward_filter="Ward 1", query_vector=self.query, **options)
+        self.assertEqual([n["id"] for n in nodes], [self.ids[0], self.ids[2], self.ids[3]])
+
+    def test_top_k_order(self):
+        self.check_order()
+
+    def test_top_k_order_through_index(self):
+        rag_engine.ANN_MIN_ROWS = 1
+        try:
+            self.check_order(exact=True)
+            self.assertEqual(rag_engine._index["index"].size, 6)
+        finally:
+            rag_engine.ANN_MIN_ROWS = self.saved[-1][2]
+
+    def _synced_index(self):
+        db = rag_engine.get_db()
+        index = rag_engine.knowledge_index(db.cursor())
+        db.close()
+        return index
+
+    def test_training_runs_off_the_query_path(self):
+        rag_engine.ANN_MIN_ROWS = 1
+        try:
+            index = self._synced_index()
+            trainer = rag_engine._index["trainer"]
+            if trainer is not None:
+                self.assertIsNot(trainer, threading.current_thread())
+                trainer.join(10)
+            self.assertEqual(index.trained_size, 6)
+            self.assertIsNone(rag_engine._index["trainer"])
+            self.assertTrue(os.path.exists(rag_engine.index_path()))
+        finally:
+            rag_engine.ANN_MIN_ROWS = self.saved[-1][2]
+
+    def test_lower_max_id_is_not_a_truncate(self):
+        index = self._synced_index()
+        db = rag_engine.get_db()
+        db.execute("DELETE FROM knowledge_nodes WHERE id = ?", (self.ids[-1],))
+        db.commit()
+        db.close()
+        self.assertIs(self._synced_index(), index)
+        self.assertEqual(rag_engine._index["max_id"], self.ids[-1])
+        # The deleted node's vector stays in the index but never comes back from a query
+        rag_engine.ANN_MIN_ROWS = 1
+        try:
+            nodes = rag_engine.query_nodes(None, limit=6, query_vector=self.query, exact=True)
+        finally:
+            rag_engine.ANN_MIN_ROWS = self.saved[-1][2]
+        self.assertEqual([n["id"] for n in nodes], self.ids[:5])
+
+    def _reseed_elsewhere(self):
+        """Truncates and reseeds six nodes the way another process would, leaving this index alone."""
+        with mock.patch.object(rag_engine, "reset_knowledge_index"):
+            rag_engine.truncate_db()
+        for i in range(6):
+            self.model.vectors[f"Reseeded {i}"] = _unit(-self.query + 0.1 * i * self.model.vector(f"Fact {i}"))
+            rag_engine.store_node("meetings", None, "roads", f"Reseeded {i}", f"Reseeded {i}", "test")
+
+    def test_truncate_and_reseed_rebuilds(self):
+        index = self._synced_index()
+        self._reseed_elsewhere()
+        rebuilt = self._synced_index()
+        # Same ids 1..6 as before; only the generation tells them apart
+        self.assertEqual((rebuilt.min_id(), rebuilt.max_id()), (index.min_id(), index.max_id()))
+        self.assertIsNot(rebuilt, index)
+        top = rebuilt.search(-self.query, 1, exact=True)[0]
+        self.assertAlmostEqual(top[1], 1.0, places=4)
+
+    def test_saved_index_of_an_older_generation_is_ignored(self):
+        rag_engine.ANN_MIN_ROWS = 1
+        try:
+            self._synced_index()
+            trainer = rag_engine._index["trainer"]
+            if trainer is not None:
+                trainer.join(10)
+            self.assertTrue(os.path.exists(rag_engine.index_path()))
+            self._reseed_elsewhere()
+            # Restart: in-memory state gone, the old generation's file still on disk
+            rag_engine._index.update(index=None, generation=None, min_id=0, max_id=0)
+            index = self._synced_index()
+            self.assertAlmostEqual(index.search(-self.query, 1, exact=True)[0][1], 1.0, places=4)
+        finally:
+            rag_engine.ANN_MIN_ROWS = self.saved[-1][2]
+
+class TestSuggestionMemo(unittest.TestCase):
+    """memoized_suggestions with the agent replaced by a counting fake."""
+
+    def setUp(self):
+        rag_engine.clear_suggestion_memo()
+        self.runs = 0
+        self.fail = None # None, "empty" or "raise"
+        patcher = mock.patch.object(rag_engine, "run_suggestion_agent_async", self._agent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(rag_engine.clear_suggestion_memo)
+
+    async def _agent(self, **kwargs):
+        self.runs += 1
+        run = self.runs
+        await asyncio.sleep(0.01)
+        if self.fail == "raise":
+            raise RuntimeError("model down")
+        return {"suggestions": [] if self.fail == "empty" else [{"title": f"run {run}"}]}
+
+    async def _inputs(self):
+        return {}
+
+    def _suggest(self, version, allow_stale=True):
+        return rag_engine.memoized_suggestions(version, self._inputs, allow_stale=allow_stale)
+
+    async def _settle(self):
+        while rag_engine._suggestion_refreshing:
+            await asyncio.sleep(0.005)
+
+    def test_miss_then_hit(self):
+        async def scenario():
+            return await self._suggest([1, 1]), await self._suggest([1, 1])
+        miss, hit = asyncio.run(scenario())
+        self.assertEqual((miss["cache"]["status"], hit["cache"]["status"]), ("miss", "hit"))
+        self.assertEqual(hit["suggestions"], [{"title": "run 1"}])
+        self.assertEqual(self.runs, 1)
+
+    def test_stale_serves_previous_and_refreshes_once(self):
+        async def scenario():
+            await self._suggest([1])
+            stale = await asyncio.gather(self._suggest([2]), self._suggest([2]))
+            await self._settle()
+            return stale, await self._suggest([2])
+        stale, fresh = asyncio.run(scenario())
+        for result in stale:
+            self.assertEqual(result["cache"]["status"], "stale")
+            self.assertEqual(result["suggestions"], [{"title": "run 1"}])
+        self.assertEqual(fresh["cache"]["status"], "hit")
+        self.assertEqual(fresh["suggestions"], [{"title": "run 2"}])
+        self.assertEqual(self.runs, 2)
+
+    def test_concurrent_misses_share_one_run(self):
+        async def scenario():
+            return await asyncio.gather(*(self._suggest([1], allow_stale=False) for _ in range(3)))
+        results = asyncio.run(scenario())
+        self.assertEqual(self.runs, 1)
+        self.assertEqual({r["cache"]["status"] for r in results}, {"miss"})
+        self.assertEqual(rag_engine._suggestion_refreshing, {})
+
+    def test_failed_run_is_not_memoized(self):
+        self.fail = "empty"
+        async def scenario():
+            return await self._suggest([1]), await self._suggest([1])
+        first, second = asyncio.run(scenario())
+        self.assertNotIn("cache", first)
+        self.assertNotIn("cache", second)
+        self.assertEqual(self.runs, 2)
+
+    def test_background_refresh_error_is_logged(self):
+        async def scenario():
+            await self._suggest([1])
+            self.fail = "raise"
+            stale = await self._suggest([2])
+            await self._settle()
+            return stale
+        out = io.StringIO()
+        with redirect_stdout(out):
+            stale = asyncio.run(scenario())
+        self.assertEqual(stale["cache"]["status"], "stale")
+        self.assertIn("Suggestion refresh error: RuntimeError('model down')", out.getvalue())
+        # The old result stays, still stamped with its own version
+        self.assertEqual(rag_engine._suggestion_memo[rag_engine._suggestion_key(None, None)]["version"], [1])
+
+if __name__ == "__main__":
+    unittest.main()
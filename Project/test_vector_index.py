@@ -0,0 +1,101 @@
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+import vector_index
+
+class TestVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.vectors = rng.standard_normal((500, 16)).astype(np.float32)
+        self.wards = [["Ward 1", "Ward 2", None][i % 3] for i in range(500)]
+        self.index = vector_index.VectorIndex(16)
+        # Small batches so the buffer has to grow several times
+        for start in range(0, 500, 37):
+            end = min(start + 37, 500)
+            self.index.add(range(start + 1, end + 1), self.vectors[start:end], self.wards[start:end])
+
+    def brute_force(self, query, k, allowed=lambda i: True):
+        unit = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        sims = unit @ (query / np.linalg.norm(query))
+        order = [i for i in np.argsort(-sims) if allowed(i)]
+        return [i + 1 for i in order[:k]], sims
+
+    def test_matches_brute_force(self):
+        query = self.vectors[42] + 0.1
+        expected, sims = self.brute_force(query, 10)
+        hits = self.index.search(query, 10)
+        self.assertEqual([h[0] for h in hits], expected)
+        self.assertAlmostEqual(hits[0][1], float(sims[expected[0] - 1]), places=5)
+        self.assertAlmostEqual(float(np.linalg.norm(hits[0][2])), 1.0, places=5)
+
+    def test_ward_filter_keeps_unassigned_rows(self):
+        query = self.vectors[3]
+        expected, _ = self.brute_force(query, 8, lambda i: self.wards[i] in ("Ward 2", None))
+        hits = self.index.search(query, 8, ward="Ward 2")
+        self.assertEqual([h[0] for h in hits], expected)
+        # Unknown ward: only rows with no ward qualify
+        self.assertTrue(all(self.wards[h[0] - 1] is None for h in self.index.search(query, 8, ward="Ward 9")))
+
+    def test_min_similarity_and_empty(self):
+        hits = self.index.search(self.vectors[0], 50, min_similarity=0.5)
+        self.assertTrue(all(h[1] >= 0.5 for h in hits))
+        self.assertEqual(hits[0][0], 1)
+        self.assertEqual(vector_index.VectorIndex(16).search(self.vectors[0], 5), [])
+        self.assertEqual(self.index.max_id(), 500)
+
+    def test_update_replaces_vector(self):
+        self.assertTrue(self.index.update(300, self.vectors[10]))
+        hits = self.index.search(self.vectors[10], 2)
+        self.assertEqual({h[0] for h in hits}, {11, 300})
+        self.assertFalse(self.index.update(9999, self.vectors[0]))
+
+class TestIVF(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.vectors = vector_index._synthetic(4000, 32)
+        cls.index = vector_index.VectorIndex(32)
+        cls.index.add(range(1, 4001), cls.vectors)
+        cls.index.train(nlist=40)
+        rng = np.random.default_rng(3)
+        cls.queries = cls.vectors[:50] + 0.1 * rng.standard_normal((50, 32)).astype(np.float32)
+
+    def recall(self, **options):
+        found = [{h[0] for h in self.index.search(q, 10, **options)} for q in self.queries]
+        truth = [{h[0] for h in self.index.search(q, 10, exact=True)} for q in self.queries]
+        return np.mean([len(f & t) / 10 for f, t in zip(found, truth)])
+
+    def test_recall_grows_with_nprobe(self):
+        low, high = self.recall(nprobe=1), self.recall(nprobe=10)
+        self.assertGreaterEqual(high, low)
+        self.assertGreater(high, 0.9)
+        # Probing every list is exact
+        self.assertEqual(self.recall(nprobe=40), 1.0)
+
+    def test_rows_added_after_training_are_searchable(self):
+        index = vector_index.VectorIndex(32)
+        index.add(range(1, 4001), self.vectors)
+        index.train(nlist=40)
+        index.add([5000], [self.queries[0] * 3])
+        self.assertEqual(index.search(self.queries[0], 1, nprobe=1)[0][0], 5000)
+
+    def test_save_and_load(self):
+        path = os.path.join(tempfile.mkdtemp(), "copilot.ann.npz")
+        index = vector_index.VectorIndex(32)
+        index.add(range(1, 4001), self.vectors, wards=["Ward 1" if i % 2 else None for i in range(4000)])
+        index.train(nlist=40)
+        index.save(path)
+        loaded = vector_index.VectorIndex.load(path, 32)
+        self.assertEqual((loaded.size, loaded.trained_size, loaded.max_id()), (4000, 4000, 4000))
+        for q in self.queries[:5]:
+            self.assertEqual([h[0] for h in loaded.search(q, 5, ward="Ward 1")],
+                             [h[0] for h in index.search(q, 5, ward="Ward 1")])
+        self.assertIsNone(vector_index.VectorIndex.load(path, 16))
+
+if __name__ == "__main__":
+    unittest.main()
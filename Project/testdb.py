@@ -0,0 +1,33 @@
+"""
+Fixture shared by the test suites: points every engine's DB_PATH and the
+embedding/LLM cache paths at one throwaway database, then puts them back.
+"""
+import os
+import tempfile
+import commitment_engine
+import digest_engine
+import issue_engine
+import rag_engine
+import embeddings
+import ai
+
+DB_PATHS = [
+    (commitment_engine, "DB_PATH"), (digest_engine, "DB_PATH"), (issue_engine, "DB_PATH"),
+    (rag_engine, "DB_PATH"), (embeddings, "CACHE_DB_PATH"), (ai, "CACHE_DB_PATH"),
+]
+
+def redirect(keep=()):
+    """
+    Creates a temporary database and points every DB_PATHS entry at it.
+    `keep` lists other (module, attr) globals the suite changes, saved with
+    the paths. Returns (path, saved); hand saved to restore().
+    """
+    path = os.path.join(tempfile.mkdtemp(), "test_copilot.db")
+    saved = [(m, attr, getattr(m, attr)) for m, attr in DB_PATHS + list(keep)]
+    for m, attr in DB_PATHS:
+        setattr(m, attr, path)
+    return path, saved
+
+def restore(saved):
+    for m, attr, value in saved:
+        setattr(m, attr, value)
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+# Process-resident vector index. Rows are stored L2-normalised in one
+# contiguous float32 matrix, so cosine similarity against every row is a
+# single matrix-vector product and top-k is an argpartition, not a sort.
+# The buffer doubles when full, so appending one row is amortised O(dim).
+#
+# train() adds an IVF-flat layer: spherical k-means centroids, with every row
+# assigned to its nearest one. A search then scores only the rows in the
+# `nprobe` lists closest to the query. More probes = better recall, slower.
+# exact=True always scans everything, for verification.
+
+def kmeans(vectors, k, iterations=10, seed=0):
+    """Spherical k-means on unit rows. Returns (k, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed lists that lost every member
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = VectorIndex.normalize(sums)
+    return centroids
+
+class VectorIndex:
+    def __init__(self, dim):
+        self.dim = dim
+        self.size = 0
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._wards = np.zeros(0, dtype=np.int32)   # code into _ward_codes, -1 for no ward
+        self._domains = np.zeros(0, dtype=np.int32) # code into _domain_codes, -1 for none
+        self._ward_codes = {}
+        self._domain_codes = {}
+        self.centroids = None   # (nlist, dim) once trained
+        self.trained_size = 0
+        self._assign = np.zeros(0, dtype=np.int32)   # list of each row, -1 before training
+        self.tag = None         # caller's stamp, saved with the index (rag_engine: knowledge generation)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _code(self, codes, value):
+        if value is None:
+            return -1
+        return codes.setdefault(value, len(codes))
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self._ids), 64)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self._vectors[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self._ids[:self.size]
+        wards = np.full(capacity, -1, dtype=np.int32)
+        wards[:self.size] = self._wards[:self.size]
+        domains = np.full(capacity, -1, dtype=np.int32)
+        domains[:self.size] = self._domains[:self.size]
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:self.size] = self._assign[:self.size]
+        # Swap in new arrays rather than resizing, so a concurrent search keeps a consistent view
+        self._vectors, self._ids, self._wards, self._domains = vectors, ids, wards, domains
+        self._assign = assign
+
+    def add(self, ids, vectors, wards=None, domains=None):
+        """Appends rows. vectors is (n, dim); wards/domains are optional per-row labels."""
+        vectors = self.normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        n = len(vectors)
+        if n == 0:
+            return
+        wards = wards if wards is not None else [None] * n
+        domains = domains if domains is not None else [None] * n
+        with self._lock:
+            if self.size + n > len(self._ids):
+                self._grow(self.size + n)
+            end = self.size + n
+            self._vectors[self.size:end] = vectors
+            self._ids[self.size:end] = ids
+            self._wards[self.size:end] = [self._code(self._ward_codes, w) for w in wards]
+            self._domains[self.size:end] = [self._code(self._domain_codes, d) for d in domains]
+            if self.centroids is not None:
+                self._assign[self.size:end] = np.argmax(vectors @ self.centroids.T, axis=1)
+            self.size = end
+
+    def update(self, id, vector):
+        """Replaces the vector stored for id. False if id is not in the index."""
+        vector = self.normalize(np.asarray(vector, dtype=np.float32).reshape(self.dim))
+        with self._lock:
+            ids = self._ids[:self.size]
+            # Ids are appended in ascending order by both callers; fall back to a scan otherwise
+            row = int(np.searchsorted(ids, id))
+            if row >= self.size or ids[row] != id:
+                found = np.flatnonzero(ids == id)
+                if not len(found):
+                    return False
+                row = int(found[0])
+            self._vectors[row] = vector
+            if self.centroids is not None:
+                self._assign[row] = np.argmax(self.centroids @ vector)
+            return True
+
+    def min_id(self):
+        return int(self._ids[:self.size].min()) if self.size else 0
+
+    def max_id(self):
+        return int(self._ids[:self.size].max()) if self.size else 0
+
+    def train(self, nlist=None, iterations=10, sample_per_list=64, seed=0):
+        """
+        Builds the IVF layer over the current rows. nlist defaults to
+        sqrt(size). k-means runs on a sample of sample_per_list rows per list.
+        """
+        with self._lock:
+            size = self.size
+            vectors = self._vectors[:size]
+        nlist = max(1, min(nlist or int(np.sqrt(size)), size))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(size, min(size, nlist * sample_per_list), replace=False)]
+        centroids = kmeans(sample, nlist, iterations, seed)
+        assign = np.concatenate([np.argmax(vectors[i:i + 8192] @ centroids.T, axis=1)
+                                 for i in range(0, size, 8192)] or [np.zeros(0, dtype=np.int64)])
+        with self._lock:
+            self._assign[:size] = assign
+            # Rows appended while training get assigned now
+            if self.size > size:
+                self._assign[size:self.size] = np.argmax(self._vectors[size:self.size] @ centroids.T, axis=1)
+            self.centroids = centroids
+            self.trained_size = size
+
+    def search(self, query, k=5, ward=None, domain=None, min_similarity=None, nprobe=8, exact=False):
+        """
+        Returns [(id, similarity, unit vector)] best first. A ward filter keeps
+        rows of that ward plus rows with no ward; a domain filter is exact.
+        Uses the IVF lists when trained unless exact is set.
+        """
+        with self._lock:
+            size = self.size
+            vectors, ids = self._vectors[:size], self._ids[:size]
+            wards, domains = self._wards[:size], self._domains[:size]
+            assign, centroids = self._assign[:size], self.centroids
+            ward_code = self._ward_codes.get(ward, -2)
+            domain_code = self._domain_codes.get(domain, -2)
+        if size == 0 or k <= 0:
+            return []
+        query = self.normalize(query)
+
+        def allowed(rows):
+            mask = np.ones(len(rows), dtype=bool)
+            if ward is not None:
+                mask &= (wards[rows] == ward_code) | (wards[rows] == -1)
+            if domain is not None:
+                mask &= domains[rows] == domain_code
+            return rows[mask]
+
+        if centroids is None or exact:
+            # Score the whole matrix in place; gathering rows first would copy it
+            rows = allowed(np.arange(size))
+            sims = (vectors @ query)[rows]
+        else:
+            order = np.argsort(-(centroids @ query))
+            probes = min(max(nprobe, 1), len(centroids))
+            while True:
+                probed = np.zeros(len(centroids), dtype=bool)
+                probed[order[:probes]] = True
+                rows = allowed(np.flatnonzero(probed[assign]))
+                # Filters can empty the nearest lists; widen until k rows or everything is probed
+                if len(rows) >= k or probes == len(centroids):
+                    break
+                probes = min(probes * 2, len(centroids))
+            sims = vectors[rows] @ query
+
+        if min_similarity is not None:
+            keep = sims >= min_similarity
+            rows, sims = rows[keep], sims[keep]
+        if len(rows) > k:
+            top = np.argpartition(-sims, k - 1)[:k]
+            rows, sims = rows[top], sims[top]
+        order = np.argsort(-sims, kind="stable")
+        return [(int(ids[rows[i]]), float(sims[i]), vectors[rows[i]]) for i in order]
+
+    def save(self, path):
+        """Writes the rows, labels and IVF layer to one .npz, atomically."""
+        with self._lock:
+            size = self.size
+            arrays = {
+                "vectors": self._vectors[:size], "ids": self._ids[:size],
+                "wards": self._wards[:size], "domains": self._domains[:size],
+                "assign": self._assign[:size],
+                "centroids": self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32),
+                "trained_size": np.array(self.trained_size),
+                "tag": np.array(-1 if self.tag is None else self.tag),
+                "ward_names": np.array(sorted(self._ward_codes, key=self._ward_codes.get), dtype=str),
+                "domain_names": np.array(sorted(self._domain_codes, key=self._domain_codes.get), dtype=str),
+            }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, dim):
+        """Reads an index written by save(). None if missing, unreadable or of another dim."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if data["vectors"].shape[1:] != (dim,):
+                    return None
+                index = cls(dim)
+                size = len(data["ids"])
+                index._grow(size)
+                index._vectors[:size] = data["vectors"]
+                index._ids[:size] = data["ids"]
+                index._wards[:size] = data["wards"]
+                index._domains[:size] = data["domains"]
+                index._assign[:size] = data["assign"]
+                index._ward_codes = {str(name): i for i, name in enumerate(data["ward_names"])}
+                index._domain_codes = {str(name): i for i, name in enumerate(data["domain_names"])}
+                if len(data["centroids"]):
+                    index.centroids = data["centroids"]
+                    index.trained_size = int(data["trained_size"])
+                tag = int(data["tag"]) if "tag" in data.files else -1
+                index.tag = None if tag < 0 else tag
+                index.size = size
+                return index
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Vector index load failed ({path}): {e}")
+            return None
+
+def benchmark(vectors, queries, k=10, nlist=None, nprobes=(1, 2, 4, 8, 16, 32)):
+    """recall@k and mean latency of IVF search against exact search over the same rows."""
+    index = VectorIndex(vectors.shape[1])
+    index.add(np.arange(1, len(vectors) + 1), vectors)
+    started = time.perf_counter()
+    index.train(nlist)
+    print(f"{len(vectors)} rows x {vectors.shape[1]} dims, {len(index.centroids)} lists, trained in {time.perf_counter() - started:.2f}s")
+
+    def run(**options):
+        started = time.perf_counter()
+        results = [[h[0] for h in index.search(q, k, **options)] for q in queries]
+        return results, (time.perf_counter() - started) / len(queries) * 1000
+
+    truth, exact_ms = run(exact=True)
+    print(f"exact        recall@{k} 1.000  {exact_ms:7.2f} ms/query")
+    for nprobe in nprobes:
+        found, ms = run(nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, truth) if b])
+        print(f"nprobe={nprobe:<5} recall@{k} {recall:.3f}  {ms:7.2f} ms/query")
+
+def _synthetic(rows, dim, seed=0):
+    # Clustered unit vectors, closer to sentence embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(rows // 200, 1), dim)).astype(np.float32)
+    vectors = topics[rng.integers(len(topics), size=rows)] + 1.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return VectorIndex.normalize(vectors)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="recall@k benchmark of IVF against exact search")
+    parser.add_argument("--db", help="benchmark on vec_knowledge from this database instead of synthetic rows")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.db:
+        sys.path.append(os.path.dirname(__file__))
+        import database
+        conn = database.connect(args.db)
+        blobs = [r[0] for r in conn.execute("SELECT embedding FROM vec_knowledge ORDER BY node_id")]
+        conn.close()
+        data = VectorIndex.normalize(np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1))
+    else:
+        data = _synthetic(args.rows, args.dim)
+    # Queries: perturbed copies of stored rows, so each has real neighbours
+    rng = np.random.default_rng(1)
+    picks = data[rng.choice(len(data), min(args.queries, len(data)), replace=False)]
+    benchmark(data, picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32), args.k, args.nlist)